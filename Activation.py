@@ -0,0 +1,205 @@
+#!/usr/bin/python
+__author__ = 'davinellulinvega'
+
+# Import the required packages
+from math import exp
+from math import tanh
+import numpy as np
+
+
+# Define the Activation class
+class Activation(object):
+    """
+    An activation function along with its derivative, in a vectorized form for the arrays of the dense engine and in a
+    scalar form for the neurons of the object graph. The derivative is expressed from both the weighted sum of the
+    inputs and the output, so that it can reuse what the forward pass computed.
+    """
+
+    def __init__(self, name, function, derivative, scalar, scalar_derivative):
+        """
+        Define the attributes
+        :param name: The name under which the activation is registered
+        :param function: function(sum_in, out=None) -> output, on arrays
+        :param derivative: derivative(sum_in, output, out=None) -> derivative, on arrays
+        :param scalar: scalar(sum_in) -> output, on floats
+        :param scalar_derivative: scalar_derivative(sum_in, output) -> derivative, on floats
+        """
+
+        self.name = name
+        self.function = function
+        self.derivative = derivative
+        self.scalar = scalar
+        self.scalar_derivative = scalar_derivative
+
+
+# Define the GaussianTable class
+class GaussianTable(object):
+    """
+    A lookup table approximating the gaussian bump exp(-x^2) by linear interpolation between evenly spaced samples.
+    The interpolation error is at most max|f''| * step^2 / 8 = step^2 / 4 on [-bound, bound] and exp(-bound^2) outside,
+    where the table returns its end value. The derivative is the slope of the interpolated segment, which is the exact
+    derivative of what the table computes.
+    """
+
+    def __init__(self, bound=6.0, resolution=256):
+        """
+        Sample the gaussian bump
+        :param bound: The table covers [-bound, bound]
+        :param resolution: The number of samples per unit
+        """
+
+        # The sampling grid
+        self.bound = float(bound)
+        self.step = 1.0 / resolution
+        self.scale = float(resolution)
+        nb_sample = int(round(2 * self.bound * resolution)) + 1
+        samples = np.linspace(-self.bound, self.bound, nb_sample)
+        # The value of each sample and the difference with the next one
+        self.values = np.exp(-(samples ** 2))
+        # A last, flat segment catches the upper bound itself
+        self.deltas = np.append(np.diff(self.values), 0)
+        # The same tables as lists, for the scalar version
+        self.value_list = self.values.tolist()
+        self.delta_list = self.deltas.tolist()
+        # The largest difference with exp(-x^2)
+        self.max_error = self.step ** 2 / 4 + exp(-self.bound ** 2)
+
+    def locate(self, sum_in):
+        """
+        Find the segment of the table containing each value
+        :param sum_in: An array of weighted sums
+        :return: A tuple: (index of the segment, position within the segment in [0, 1])
+        """
+
+        position = np.clip(sum_in, -self.bound, self.bound)
+        position += self.bound
+        position *= self.scale
+        index = position.astype(np.intp)
+        position -= index
+        return index, position
+
+    def function(self, sum_in, out=None):
+        """Interpolate the gaussian bump for an array of weighted sums"""
+
+        index, position = self.locate(sum_in)
+        position *= self.deltas[index]
+        position += self.values[index]
+        if out is None:
+            return position
+        out[...] = position
+        return out
+
+    def derivative(self, sum_in, output, out=None):
+        """The slope of the interpolated segment for an array of weighted sums, 0 outside of the table"""
+
+        index = self.locate(sum_in)[0]
+        slope = self.deltas[index] * self.scale
+        slope[np.abs(sum_in) >= self.bound] = 0
+        if out is None:
+            return slope.astype(sum_in.dtype, copy=False)
+        out[...] = slope
+        return out
+
+    def scalar(self, sum_in):
+        """Interpolate the gaussian bump for a single weighted sum"""
+
+        # Outside of the table, return the end value
+        if not (-self.bound < sum_in < self.bound):
+            return self.value_list[0]
+        # Interpolate within the segment
+        position = (sum_in + self.bound) * self.scale
+        index = int(position)
+        return self.value_list[index] + (position - index) * self.delta_list[index]
+
+    def scalar_derivative(self, sum_in, output):
+        """The slope of the interpolated segment for a single weighted sum"""
+
+        # Outside of the table, the output is constant
+        if not (-self.bound < sum_in < self.bound):
+            return 0.0
+        index = int((sum_in + self.bound) * self.scale)
+        return self.delta_list[index] * self.scale
+
+
+def gaussian(sum_in, out=None):
+    """The gaussian bump exp(-x^2)"""
+
+    out = np.square(sum_in, out=out)
+    np.negative(out, out=out)
+    return np.exp(out, out=out)
+
+
+def gaussian_derivative(sum_in, output, out=None):
+    """The derivative of the gaussian bump: -2 * x * exp(-x^2)"""
+
+    out = np.multiply(sum_in, -2, out=out)
+    out *= output
+    return out
+
+
+def sigmoid(sum_in, out=None):
+    """The logistic function 1 / (1 + exp(-x)), computed as (1 + tanh(x / 2)) / 2 which cannot overflow"""
+
+    out = np.multiply(sum_in, 0.5, out=out)
+    np.tanh(out, out=out)
+    out += 1
+    out *= 0.5
+    return out
+
+
+def sigmoid_derivative(sum_in, output, out=None):
+    """The derivative of the logistic function: y * (1 - y)"""
+
+    out = np.subtract(1, output, out=out)
+    out *= output
+    return out
+
+
+def tanh_derivative(sum_in, output, out=None):
+    """The derivative of the hyperbolic tangent: 1 - y^2"""
+
+    out = np.square(output, out=out)
+    np.subtract(1, out, out=out)
+    return out
+
+
+# The registered activations, by name
+ACTIVATIONS = dict()
+
+
+def register_activation(activation):
+    """
+    Make an activation available to the networks under its name
+    :param activation: An instance of Activation
+    :return: Nothing
+    """
+
+    ACTIVATIONS[activation.name] = activation
+
+
+def get_activation(name):
+    """
+    Retrieve a registered activation
+    :param name: The name of the activation
+    :return: The corresponding instance of Activation
+    """
+
+    try:
+        return ACTIVATIONS[name]
+    except KeyError:
+        raise ValueError("Unknown activation function, choose one of: " + ", ".join(sorted(ACTIVATIONS)), name)
+
+
+# Register the default activations
+GAUSSIAN_TABLE = GaussianTable()
+register_activation(Activation("gaussian", gaussian, gaussian_derivative,
+                               lambda sum_in: exp(-(sum_in ** 2)),
+                               lambda sum_in, output: -2 * sum_in * output))
+register_activation(Activation("gaussian_lut", GAUSSIAN_TABLE.function, GAUSSIAN_TABLE.derivative,
+                               GAUSSIAN_TABLE.scalar, GAUSSIAN_TABLE.scalar_derivative))
+register_activation(Activation("sigmoid", sigmoid, sigmoid_derivative,
+                               lambda sum_in: 0.5 * (1 + tanh(0.5 * sum_in)),
+                               lambda sum_in, output: output * (1 - output)))
+register_activation(Activation("tanh", np.tanh, tanh_derivative,
+                               tanh,
+                               lambda sum_in, output: 1 - output ** 2))
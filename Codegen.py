@@ -0,0 +1,69 @@
+#!/usr/bin/python
+__author__ = 'davinellulinvega'
+
+# Import the required packages
+from math import exp
+import Activation
+
+
+def build_forward_source(weights, activations):
+    """
+    Write the source code of a function computing the output of a network, with every weight written as a literal and
+    every neuron held in a local variable. The gaussian bump is written inline, other activation functions are called
+    through the default arguments f0, f1, ... of the function.
+    :param weights: A list of weight matrices, one per layer after the input layer, in feed forward order
+    :param activations: A list with the name of the activation function of each of these layers
+    :return: The source code of a function named forward, taking a sequence of input values and returning a list of
+    output values
+    """
+
+    # Bind the activation functions of each layer to local variables
+    arguments = ["input_val", "exp=exp"]
+    for layer_index, name in enumerate(activations):
+        if name != "gaussian":
+            arguments.append("f%d=activations[%d]" % (layer_index, layer_index))
+
+    # Unpack the input values into local variables
+    nb_in = len(weights[0][0])
+    inputs = ["i%d" % index for index in range(nb_in)]
+    lines = ["def forward(%s):" % ", ".join(arguments),
+             "    %s, = input_val" % ", ".join(inputs)]
+
+    # For each layer, compute the weighted sum of each neuron and apply the activation function
+    for layer_index, matrix in enumerate(weights):
+        outputs = []
+        for neuron_index, row in enumerate(matrix):
+            terms = " + ".join("%r * %s" % (float(weight), name) for weight, name in zip(row, inputs))
+            output = "n%d_%d" % (layer_index, neuron_index)
+            lines.append("    s = %s" % terms)
+            if activations[layer_index] == "gaussian":
+                lines.append("    %s = exp(-(s * s))" % output)
+            else:
+                lines.append("    %s = f%d(s)" % (output, layer_index))
+            outputs.append(output)
+        inputs = outputs
+
+    # Return the output of the last layer
+    lines.append("    return [%s]" % ", ".join(inputs))
+    return "\n".join(lines) + "\n"
+
+
+def build_forward(weights, activations=None):
+    """
+    Generate and compile an unrolled function computing the output of a network. Meant for small networks, since the
+    size of the code grows with the number of synapses.
+    :param weights: A list of weight matrices, one per layer after the input layer, in feed forward order
+    :param activations: A list with the name of the activation function of each of these layers. Defaults to None,
+    meaning the gaussian bump everywhere
+    :return: A function taking a sequence of input values and returning a list of output values
+    """
+
+    # Use the scalar version of the activation functions
+    if activations is None:
+        activations = ["gaussian"] * len(weights)
+    scalars = [Activation.get_activation(name).scalar for name in activations]
+
+    # Compile the source code in its own namespace
+    namespace = dict(exp=exp, activations=scalars)
+    exec(compile(build_forward_source(weights, activations), "<unrolled network>", "exec"), namespace)
+    return namespace["forward"]
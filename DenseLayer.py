@@ -0,0 +1,229 @@
+#!/usr/bin/python
+__author__ = 'davinellulinvega'
+
+# Import the required packages
+import numpy as np
+import Activation
+
+
+# Define the DenseLayer class
+class DenseLayer:
+    """A collection of computing units stored as arrays, with all incoming synapses held in a single weight matrix"""
+
+    # The arrays holding floating point values, converted by set_dtype
+    float_arrays = ('output', 'error', 'sum_in', 'derivative', 'weights', 'prev_delta', '_gradient', '_scaled_error',
+                    '_stat')
+    # Layers recorded before the options existed store double precision values and use the gaussian bump
+    dtype = np.dtype(np.float64)
+    activation = "gaussian"
+
+    def __init__(self, nb_neuron, prev_layer=None, seed=None, dtype=np.float64, activation="gaussian"):
+        """
+        Define the attributes and initialize their value
+        :param seed: A seed or a numpy.random.Generator used to draw the initial weights. Defaults to None, meaning
+        draw them from a freshly seeded generator.
+        :param dtype: The floating point type used to store the values and compute with them, either numpy.float32 or
+        numpy.float64 (default)
+        :param activation: The name of a function registered in Activation.ACTIVATIONS. Defaults to the gaussian bump
+        """
+
+        # The precision of the values and the activation function
+        self.dtype = np.dtype(dtype)
+        Activation.get_activation(activation)
+        self.activation = activation
+        # The output and the error of each neuron in the layer
+        self.output = np.zeros(nb_neuron, dtype=dtype)
+        self.error = np.zeros(nb_neuron, dtype=dtype)
+        # The weighted sum of the inputs and the derivative of the activation, kept from the last activation
+        self.sum_in = np.zeros(nb_neuron, dtype=dtype)
+        self.derivative = np.zeros(nb_neuron, dtype=dtype)
+        # The layers feeding and fed by this one
+        self.prev_layer = None
+        self.next_layer = None
+        # One row of incoming synaptic weights per neuron, one column per neuron in the previous layer
+        self.weights = None
+        # Keep a record of the previous deltas, to compute the momentum
+        self.prev_delta = None
+        self.epsylon = 0.7
+
+        # Check if the previous layer exist
+        if not (prev_layer is None) and isinstance(prev_layer, DenseLayer):
+            # Link both layers together
+            self.prev_layer = prev_layer
+            prev_layer.next_layer = self
+            # Initialize the weights to random numbers between -1 and 1
+            self.weights = np.random.default_rng(seed).uniform(-1, 1, (nb_neuron, len(prev_layer))).astype(dtype)
+            self.prev_delta = np.zeros((nb_neuron, len(prev_layer)), dtype=dtype)
+            # Working buffers reused by every update, so that learning does not allocate any array
+            self._gradient = np.zeros((nb_neuron, len(prev_layer)), dtype=dtype)
+            self._scaled_error = np.zeros(nb_neuron, dtype=dtype)
+            self._stat = np.zeros(nb_neuron, dtype=dtype)
+            self._no_dev = np.zeros(nb_neuron, dtype=bool)
+
+    def set_dtype(self, dtype):
+        """
+        Convert all the values of the layer to another floating point type
+        :param dtype: Either numpy.float32 or numpy.float64
+        :return: Nothing
+        """
+
+        # Convert each array, an input layer does not have any weight
+        self.dtype = np.dtype(dtype)
+        for name in self.float_arrays:
+            array = getattr(self, name, None)
+            if array is not None:
+                setattr(self, name, array.astype(dtype))
+
+    def set_epsylon(self, epsylon):
+        """
+        Set the momentum of all incoming synapses
+        :param epsylon: The fraction of the previous delta added to each weight update
+        :return: Nothing
+        """
+
+        self.epsylon = epsylon
+
+    def __len__(self):
+        """Return the number of neurons in the layer"""
+
+        return len(self.output)
+
+    def set_output(self, values):
+        """Assign the given values to the output of the neurons"""
+
+        self.output[:] = values
+
+    def get_output(self):
+        """Retrieve the value(s) of the output(s) and return them in a list"""
+
+        return self.output.tolist()
+
+    def update_weight(self, learn_rate, gradient=None, interleaved=False):
+        """
+        Define the procedure to update the weights of all incoming synapses
+        :param gradient: A matrix of gradients accumulated over a batch of samples, as returned by get_gradient.
+        Defaults to None, meaning use the error and output of the connected neurons
+        :param interleaved: True to normalize the weights after each synapse update, which costs O(fan_in^2), False
+        (default) to normalize them once after all the updates
+        """
+
+        # An input layer does not have any incoming synapse
+        if self.weights is None:
+            return
+
+        # Compute the learning part of the deltas
+        if gradient is None:
+            np.multiply(self.error, learn_rate, out=self._scaled_error)
+            np.outer(self._scaled_error, self.prev_layer.output, out=self._gradient)
+        else:
+            np.multiply(gradient, learn_rate, out=self._gradient)
+        # Add the momentum and store the deltas in the previous deltas, they do not depend on the weights
+        delta = self.prev_delta
+        delta *= self.epsylon
+        delta += self._gradient
+
+        # Apply all the deltas, then normalize once
+        if not interleaved:
+            self.weights += delta
+            self.normalize_weight()
+            return
+
+        # For each neuron in the previous layer, update the corresponding synapse of every neuron at once
+        for index in range(delta.shape[1]):
+            # Compute the new weight
+            self.weights[:, index] += delta[:, index]
+            # Normalize the synaptic weights
+            self.normalize_weight()
+
+    def normalize_weight(self):
+        """Normalize the weights of each neuron, while keeping the dispersion ratio"""
+
+        # Compute the average of each neuron's incoming weights and subtract it
+        nb_syn = self.weights.shape[1]
+        avg = np.add.reduce(self.weights, axis=1, out=self._stat)
+        avg /= nb_syn
+        self.weights -= avg[:, np.newaxis]
+
+        # Compute the standard deviation
+        dev = np.einsum('ij,ij->i', self.weights, self.weights, out=self._stat)
+        dev /= nb_syn
+        np.sqrt(dev, out=dev)
+        # If all the weights of a neuron are equal, there is no dispersion to keep
+        np.copyto(dev, 1, where=np.equal(dev, 0, out=self._no_dev))
+
+        # And divide by the standard deviation
+        self.weights /= dev[:, np.newaxis]
+
+    def update_error(self, error=None):
+        """Define the procedure to update the error of all neurons in the layer"""
+
+        # If no error is provided
+        if error is None:
+            # Back propagate the error of the next layer
+            if self.next_layer is None:
+                self.error[:] = 0
+            else:
+                self.next_layer.get_back_error(self.next_layer.error, out=self.error)
+            # Compute the error, with the derivative kept from the last activation
+            self.error *= self.derivative
+        else:
+            # Else store the error values
+            self.error[:] = error
+
+    def activate(self):
+        """Define the procedure to activate all neurons in the layer"""
+
+        # Get the weighted sum of the inputs
+        np.dot(self.weights, self.prev_layer.output, out=self.sum_in)
+
+        # Apply the activation function and assign the result to the output
+        activation = Activation.get_activation(self.activation)
+        activation.function(self.sum_in, out=self.output)
+
+        # Keep the derivative of the activation for the back propagation
+        activation.derivative(self.sum_in, self.output, out=self.derivative)
+
+    def get_weights(self):
+        """Return the matrix of the incoming synaptic weights, with one row per neuron"""
+
+        return self.weights
+
+    def get_weighted_sum(self, inputs):
+        """
+        Compute the weighted sum of the inputs of each neuron for many samples at once
+        :param inputs: An array of shape (N, nb_prev), one row of output values of the previous layer per sample
+        :return: An array of shape (N, nb_neuron)
+        """
+
+        return inputs.dot(self.weights.T)
+
+    def get_back_error(self, errors, out=None):
+        """
+        Propagate the errors of many samples back through the incoming synapses
+        :param errors: An array of shape (N, nb_neuron), one row of errors per sample, or of shape (nb_neuron,) for a
+        single sample
+        :param out: An array receiving the result. Defaults to None, meaning allocate a new one
+        :return: An array of shape (N, nb_prev), the weighted sum of the errors seen by each neuron of the previous
+                 layer
+        """
+
+        return np.dot(errors, self.weights, out=out)
+
+    def get_gradient(self, errors, inputs):
+        """
+        Accumulate the gradient of the incoming synaptic weights over many samples
+        :param errors: An array of shape (N, nb_neuron), one row of errors per sample
+        :param inputs: An array of shape (N, nb_prev), one row of output values of the previous layer per sample
+        :return: A matrix of shape (nb_neuron, nb_prev) that can be given to update_weight
+        """
+
+        return errors.T.dot(inputs)
+
+    def activate_batch(self, inputs):
+        """
+        Compute the output of the layer for many samples at once, without modifying the state of the neurons
+        :param inputs: An array of shape (N, nb_prev), one row of output values of the previous layer per sample
+        :return: An array of shape (N, nb_neuron)
+        """
+
+        return Activation.get_activation(self.activation).function(self.get_weighted_sum(inputs))
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+__author__ = 'davinellulinvega'
+
+# Import the required packages
+import numpy as np
+import Activation
+
+
+# Define the FrozenNetwork class
+class FrozenNetwork(object):
+    """An immutable, inference only snapshot of a Network, stored as contiguous float32 weight matrices"""
+
+    __slots__ = ('weights', 'activations', '_functions', '_input', '_outputs')
+
+    def __init__(self, weights, activations=None):
+        """
+        Copy the weights and allocate the buffers holding the output of each layer
+        :param weights: A list of weight matrices, one per layer after the input layer, in feed forward order
+        :param activations: A list with the name of the activation function of each of these layers. Defaults to None,
+        meaning the gaussian bump everywhere
+        """
+
+        # Look the activation functions up
+        if activations is None:
+            activations = ["gaussian"] * len(weights)
+        object.__setattr__(self, 'activations', tuple(activations))
+        object.__setattr__(self, '_functions', tuple(Activation.get_activation(name).function for name in activations))
+
+        # Copy the weights into read only contiguous matrices
+        frozen = []
+        for matrix in weights:
+            matrix = np.array(matrix, dtype=np.float32, order='C')
+            matrix.setflags(write=False)
+            frozen.append(matrix)
+        object.__setattr__(self, 'weights', tuple(frozen))
+
+        # The buffers receiving the input and the output of each layer
+        object.__setattr__(self, '_input', np.zeros(frozen[0].shape[1], dtype=np.float32))
+        object.__setattr__(self, '_outputs', tuple(np.zeros(len(matrix), dtype=np.float32) for matrix in frozen))
+
+    def __setattr__(self, name, value):
+        """Forbid any modification of the snapshot"""
+
+        raise AttributeError("A frozen network cannot be modified")
+
+    def __reduce__(self):
+        """Pickle the snapshot through its weights"""
+
+        return FrozenNetwork, (self.weights, self.activations)
+
+    def activate(self, input_val):
+        """Define the procedure to compute the new output of each layer"""
+
+        # Check the number of input values
+        if len(input_val) != len(self._input):
+            raise IndexError("The number of input values provided is different from the number of input neurons",
+                             len(input_val), len(self._input))
+
+        # Propagate the input through each layer in order
+        self._input[:] = input_val
+        inputs = self._input
+        for matrix, function, output in zip(self.weights, self._functions, self._outputs):
+            # Get the weighted sum of the inputs and apply the activation function
+            np.dot(matrix, inputs, out=output)
+            function(output, out=output)
+            inputs = output
+
+    def get_output(self):
+        """Retrieve the value(s) of the output(s) and return them in a list"""
+
+        return self._outputs[-1].tolist()
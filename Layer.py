@@ -2,6 +2,8 @@
 __author__ = 'davinellulinvega'
 
 # Import the required packages
+import numpy as np
+import Activation
 import Synapse
 import Neuron
 
@@ -10,50 +12,123 @@ import Neuron
 class Layer:
     """The basic collection of computing unit in the neural network"""
 
-    def __init__(self, nb_neuron, prev_layer=None):
-        """Define the attributes and initialize their value"""
+    # The classes used to build the neurons and the synapses
+    neuron_class = Neuron.Neuron
+    synapse_class = Synapse.Synapse
+    # Layers recorded before the activation could be chosen use the gaussian bump
+    activation = "gaussian"
+
+    def __init__(self, nb_neuron, prev_layer=None, seed=None, dtype=np.float64, activation="gaussian"):
+        """
+        Define the attributes and initialize their value
+        :param seed: A seed or a numpy.random.Generator used to draw the initial weights. Defaults to None, meaning
+        draw them from a freshly seeded generator.
+        :param dtype: Only numpy.float64 is supported, since neurons and synapses store python floats
+        :param activation: The name of a function registered in Activation.ACTIVATIONS. Defaults to the gaussian bump
+        """
+
+        # Check the requested precision and activation function
+        self.set_dtype(dtype)
+        Activation.get_activation(activation)
+        self.activation = activation
 
         # A list of all the neurons in the layer
-        self.neurons = []
-
-        # Create nb_neuron new neurons
-        while nb_neuron > 0:
-            # Create the neuron
-            tmp_neuron = Neuron.Neuron()
-            # Add the neuron to the layer's list
-            self.neurons.append(tmp_neuron)
-            # Decrease the number of neuron
-            nb_neuron -= 1
-
-            # Check if the previous layer exist
+        neuron_class = self.neuron_class
+        self.neurons = [neuron_class() for _ in range(nb_neuron)]
+
+        # Check if the previous layer exist
         if not (prev_layer is None) and isinstance(prev_layer, Layer):
-            # For each neuron in the layer
-            for tmp_neuron in self.neurons:
-                # For each neuron in the previous layer
-                for prev_neuron in prev_layer.neurons:
-                    # Create a synapse
-                    tmp_syn = Synapse.Synapse(prev_neuron, tmp_neuron)
-                    # Add the synapse in the out list
-                    prev_neuron.add_out_syn(tmp_syn)
-                    # Add the synapse in the in list
-                    tmp_neuron.add_in_syn(tmp_syn)
-
-    def update_weight(self, learn_rate):
-        """Define the procedure to update the weights of all incoming synapses"""
+            # Draw the initial weights of all the synapses at once
+            weights = np.random.default_rng(seed).uniform(-1, 1, (nb_neuron, len(prev_layer))).tolist()
+            synapse_class = self.synapse_class
+            prev_neurons = prev_layer.neurons
+            # For each neuron in the layer, create all the input synapses from the previous layer
+            for tmp_neuron, row in zip(self.neurons, weights):
+                tmp_neuron.in_syn = [synapse_class(prev_neuron, tmp_neuron, weight)
+                                     for prev_neuron, weight in zip(prev_neurons, row)]
+            # For each neuron in the previous layer, add the synapses toward this layer in the out list
+            for index, prev_neuron in enumerate(prev_neurons):
+                prev_neuron.out_syn.extend([tmp_neuron.in_syn[index] for tmp_neuron in self.neurons])
 
-        # For each neuron in the layer
+    def __len__(self):
+        """Return the number of neurons in the layer"""
+
+        return len(self.neurons)
+
+    def set_dtype(self, dtype):
+        """
+        Check that the requested floating point type is the one of python floats
+        :param dtype: Only numpy.float64 is supported
+        :return: Nothing
+        """
+
+        if np.dtype(dtype) != np.float64:
+            raise ValueError("Neurons and synapses store python floats, use DenseLayer for another precision", dtype)
+
+    def set_epsylon(self, epsylon):
+        """
+        Set the momentum of all incoming synapses
+        :param epsylon: The fraction of the previous delta added to each weight update
+        :return: Nothing
+        """
+
+        # For each synapse of each neuron in the layer
         for neuron in self.neurons:
+            for synapse in neuron.in_syn:
+                synapse.epsylon = epsylon
+
+    def set_output(self, values):
+        """Assign the given values to the output of the neurons"""
+
+        # For each neuron in the layer
+        for index, value in enumerate(values):
+            self.neurons[index].output = value
+
+    def get_output(self):
+        """Retrieve the value(s) of the output(s) and return them in a list"""
+
+        # Initialize the list
+        outputs = []
+        # For each neuron in the layer
+        for tmp_neuron in self.neurons:
+            # Append the output to the list
+            outputs.append(tmp_neuron.output)
+        # Return the resulting list
+        return outputs
+
+    def update_weight(self, learn_rate, gradient=None, interleaved=False):
+        """
+        Define the procedure to update the weights of all incoming synapses
+        :param gradient: A matrix of gradients accumulated over a batch of samples, as returned by get_gradient.
+        Defaults to None, meaning use the error and output of the connected neurons
+        :param interleaved: True to normalize the weights after each synapse update, False (default) to normalize them
+        once after all the updates
+        """
+
+        # For each neuron in the layer
+        for index, neuron in enumerate(self.neurons):
             # Ask the neuron to update the incoming synaptic weight
-            neuron.update_weight(learn_rate)
+            if gradient is None:
+                neuron.update_weight(learn_rate, interleaved=interleaved)
+            else:
+                neuron.update_weight(learn_rate, gradient[index], interleaved)
+
+    def normalize_weight(self):
+        """Normalize the incoming weights of each neuron, while keeping the dispersion ratio"""
+
+        # For each neuron in the layer
+        for neuron in self.neurons:
+            neuron.normalize_weight()
 
     def update_error(self, error=None):
         """Define the procedure to update the weights of all neurons in the layer"""
 
         # For each neuron in the layer
         if error is None:
+            activation = Activation.get_activation(self.activation)
             for index, neuron in enumerate(self.neurons):
                 # Ask the neuron to update its error
-                neuron.update_error()
+                neuron.update_error(activation=activation)
         else:
             for index, neuron in enumerate(self.neurons):
                 # Ask the neuron to update its error
@@ -63,6 +138,59 @@ class Layer:
         """Define the procedure to activate all neurons in the layer"""
 
         # For each neuron in the layer
+        activation = Activation.get_activation(self.activation)
         for neuron in self.neurons:
             # Ask the neuron to activate
-            neuron.activate()
+            neuron.activate(activation)
+
+    def get_weights(self):
+        """Build a matrix of the incoming synaptic weights, with one row per neuron"""
+
+        return np.array([[syn.weight for syn in neuron.in_syn] for neuron in self.neurons])
+
+    def get_weighted_sum(self, inputs):
+        """
+        Compute the weighted sum of the inputs of each neuron for many samples at once
+        :param inputs: An array of shape (N, nb_prev), one row of output values of the previous layer per sample
+        :return: An array of shape (N, nb_neuron)
+        """
+
+        return inputs.dot(self.get_weights().T)
+
+    def get_back_error(self, errors):
+        """
+        Propagate the errors of many samples back through the incoming synapses
+        :param errors: An array of shape (N, nb_neuron), one row of errors per sample
+        :return: An array of shape (N, nb_prev), the weighted sum of the errors seen by each neuron of the previous
+                 layer
+        """
+
+        return errors.dot(self.get_weights())
+
+    def get_gradient(self, errors, inputs):
+        """
+        Accumulate the gradient of the incoming synaptic weights over many samples
+        :param errors: An array of shape (N, nb_neuron), one row of errors per sample
+        :param inputs: An array of shape (N, nb_prev), one row of output values of the previous layer per sample
+        :return: A matrix of shape (nb_neuron, nb_prev) that can be given to update_weight
+        """
+
+        return errors.T.dot(inputs)
+
+    def activate_batch(self, inputs):
+        """
+        Compute the output of the layer for many samples at once, without modifying the state of the neurons
+        :param inputs: An array of shape (N, nb_prev), one row of output values of the previous layer per sample
+        :return: An array of shape (N, nb_neuron)
+        """
+
+        return Activation.get_activation(self.activation).function(self.get_weighted_sum(inputs))
+
+
+# Define the CompactLayer class
+class CompactLayer(Layer):
+    """A layer built out of slotted neurons and synapses, which use a fraction of the memory of the default ones"""
+
+    # The classes used to build the neurons and the synapses
+    neuron_class = Neuron.CompactNeuron
+    synapse_class = Synapse.CompactSynapse
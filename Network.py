@@ -2,18 +2,49 @@
 __author__ = 'davinellulinvega'
 
 # Import the required packages
-import Layer
+import numpy as np
+import Activation
+import Codegen
+import DenseLayer
+import FrozenNetwork
 
 
 # Define the Network class
 class Network:
     """Define a simple feed forward network, with an input, a hidden layer and an output layer"""
 
-    def __init__(self, nb_in, hid_layers, nb_out):
-        """Define the attributes and assign default values"""
+    # Networks recorded before the options existed normalize their weights once per update, in double precision
+    interleaved = False
+    dtype = np.dtype(np.float64)
+    # The number of weight updates so far, and the unrolled forward function with the update it was generated for
+    weights_version = 0
+    _forward = None
+    _forward_version = None
+
+    def __init__(self, nb_in, hid_layers, nb_out, layer_class=DenseLayer.DenseLayer, interleaved=False, seed=None,
+                 dtype=np.float64, activation="gaussian"):
+        """
+        Define the attributes and assign default values
+        :param layer_class: The class used to build each layer. Defaults to the array backed DenseLayer, use Layer.Layer
+        to build the network out of Neuron and Synapse objects instead.
+        :param interleaved: True to normalize the weights of a neuron after each synapse update, reproducing the
+        original learning rule at a O(fan_in^2) cost. Defaults to False, normalize once after all the updates.
+        :param seed: A seed making the initial weights reproducible. Defaults to None, meaning random weights.
+        :param dtype: The floating point type used to store the values and learn, either numpy.float32 or
+        numpy.float64 (default). Only DenseLayer supports single precision.
+        :param activation: The name of the activation function of the neurons, see Activation.ACTIVATIONS. Defaults to
+        the gaussian bump exp(-x^2)
+        """
+
+        # A single generator draws the weights of all the layers
+        rng = np.random.default_rng(seed)
+
+        # Keep track of the normalization scheme and of the precision
+        self.interleaved = interleaved
+        self.dtype = np.dtype(dtype)
 
         # Define an input layer
-        self.input = Layer.Layer(nb_in)
+        self.input = layer_class(nb_in, seed=rng, dtype=dtype, activation=activation)
         # Define the hidden layers
         self.hidden = []
 
@@ -26,31 +57,56 @@ class Network:
             # Check if it is the first index
             if index == 0:
                 # Create a layer linked to the input
-                self.hidden.append(Layer.Layer(nb_neuron, self.input))
+                self.hidden.append(layer_class(nb_neuron, self.input, rng, dtype, activation))
             else:
                 # Create a layer linked to the previous one
-                self.hidden.append(Layer.Layer(nb_neuron, self.hidden[index - 1]))
+                self.hidden.append(layer_class(nb_neuron, self.hidden[index - 1], rng, dtype, activation))
 
         # Define an output layer
-        self.output = Layer.Layer(nb_out, self.hidden[-1])
+        self.output = layer_class(nb_out, self.hidden[-1], rng, dtype, activation)
+
+    def set_dtype(self, dtype):
+        """
+        Convert all the values of the network to another floating point type, for instance after loading it
+        :param dtype: Either numpy.float32 or numpy.float64
+        :return: Nothing
+        """
+
+        # Convert each layer
+        for layer in [self.input] + self.hidden + [self.output]:
+            layer.set_dtype(dtype)
+        self.dtype = np.dtype(dtype)
+
+    def set_epsylon(self, epsylon):
+        """
+        Set the momentum of all the synapses in the network
+        :param epsylon: The fraction of the previous delta added to each weight update
+        :return: Nothing
+        """
+
+        # Set the momentum of each layer
+        for layer in self.hidden + [self.output]:
+            layer.set_epsylon(epsylon)
 
     def update_weight(self, learn_rate):
         """Define the procedure to update the synaptic weights"""
 
         # Update the output layer
-        self.output.update_weight(learn_rate)
+        self.output.update_weight(learn_rate, interleaved=self.interleaved)
         # Update the hidden layers in reverse order
         for hidden in reversed(self.hidden):
-            hidden.update_weight(learn_rate)
+            hidden.update_weight(learn_rate, interleaved=self.interleaved)
+        # Keep track of the change
+        self.weights_version += 1
 
     def update_error(self, error):
         """Define the procedure to update the neurons' errors"""
 
         # Check that the error is a list of the same size than the output layer
-        if not (isinstance(error, list)) or len(error) != len(self.output.neurons):
+        if not (isinstance(error, list)) or len(error) != len(self.output):
             # Raise and error
             raise IndexError("Error is not a list or has not the right amount of entries", len(error),
-                             len(self.output.neurons))
+                             len(self.output))
         # Update the output layer
         self.output.update_error(error)
         # Update the hidden layers in reverse order
@@ -65,34 +121,136 @@ class Network:
         # Update the weights
         self.update_weight(learn_rate)
 
+    def learn_batch(self, input_vals, errors, learn_rate):
+        """
+        Define the procedure for the network to learn from a batch of transitions at once. The gradient is accumulated
+        over the whole batch and a single momentum update is then applied to the weights.
+        :param input_vals: An array like of shape (N, nb_in), the input values of each transition
+        :param errors: An array like of shape (N, nb_out), the error on the output of each transition
+        :param learn_rate: The learning rate
+        :return: Nothing
+        """
+
+        # Check the dimensions of the batch
+        inputs = self.check_batch(input_vals, self.input)
+        errors = self.check_batch(errors, self.output)
+        if len(inputs) != len(errors):
+            raise IndexError("The number of inputs is different from the number of errors", len(inputs), len(errors))
+
+        # Propagate the inputs forward, keeping the inputs and weighted sums of each layer
+        layers = self.hidden + [self.output]
+        activations = [Activation.get_activation(layer.activation) for layer in layers]
+        layer_inputs = []
+        sums_in = []
+        for layer, activation in zip(layers, activations):
+            layer_inputs.append(inputs)
+            sums_in.append(layer.get_weighted_sum(inputs))
+            inputs = activation.function(sums_in[-1])
+
+        # Propagate the errors backward and accumulate the gradient of each layer
+        gradients = []
+        for index in reversed(range(len(layers))):
+            # The error of a hidden layer is derived from the error of the next one
+            if index < len(layers) - 1:
+                outputs = layer_inputs[index + 1]
+                errors = layers[index + 1].get_back_error(errors)
+                errors *= activations[index].derivative(sums_in[index], outputs)
+            gradients.append(layers[index].get_gradient(errors, layer_inputs[index]))
+
+        # Update the weights, starting with the output layer
+        for layer, gradient in zip(reversed(layers), gradients):
+            layer.update_weight(learn_rate, gradient, self.interleaved)
+        # Keep track of the change
+        self.weights_version += 1
+
     def activate(self, input_val):
         """Define the procedure to compute the new output of each neurons"""
 
         # Check if the provided input is a list of the same size as the input layer
         if not (isinstance(input_val, list)):
             raise TypeError("Input values should be provided in a list")
-        if len(input_val) != len(self.input.neurons):
+        if len(input_val) != len(self.input):
             raise IndexError("The number of input values provided is different from the number of input neurons",
-                             len(input_val), len(self.input.neurons))
+                             len(input_val), len(self.input))
 
         # Assign the values to the neurons in the input layer
-        for index, value in enumerate(input_val):
-            self.input.neurons[index].output = value
+        self.input.set_output(input_val)
 
-        # Activate the hidden layers in reverse order
-        for hidden in reversed(self.hidden):
+        # Activate the hidden layers in order, so that each one sees the new output of the previous one
+        for hidden in self.hidden:
             hidden.activate()
         # Activate the output layer
         self.output.activate()
 
+    def check_batch(self, values, layer):
+        """
+        Convert a batch of values into a matrix and check that it has one column per neuron in the given layer
+        :param values: An array like of shape (N, len(layer))
+        :param layer: The layer the values are meant for
+        :return: The values as a two dimensional array in the precision of the network
+        """
+
+        # Convert the values
+        values = np.asarray(values, dtype=self.dtype)
+        # Check the dimensions
+        if values.ndim != 2:
+            raise TypeError("A batch of values should be provided as a two dimensional array")
+        if values.shape[1] != len(layer):
+            raise IndexError("The number of values provided per sample is different from the number of neurons",
+                             values.shape[1], len(layer))
+        return values
+
+    def activate_batch(self, input_vals):
+        """
+        Compute the output of the network for many inputs at once, without modifying the state of the neurons
+        :param input_vals: An array like of shape (N, nb_in), one row of input values per sample
+        :return: An array of shape (N, nb_out), one row of output values per sample
+        """
+
+        # Check that the provided inputs form a matrix with one column per input neuron
+        inputs = self.check_batch(input_vals, self.input)
+
+        # Propagate the inputs through the hidden layers
+        for hidden in self.hidden:
+            inputs = hidden.activate_batch(inputs)
+        # And through the output layer
+        return self.output.activate_batch(inputs)
+
     def get_output(self):
         """Retrieve the value(s) of the output(s) and return them in a list"""
 
-        # Initialize the list
-        outputs = []
-        # For each neuron in the list
-        for tmp_neuron in self.output.neurons:
-            # Append the output to the list
-            outputs.append(tmp_neuron.output)
-        # Return the resulting list
-        return outputs
+        return self.output.get_output()
+
+    def freeze(self):
+        """
+        Take a snapshot of the network restricted to inference, which later learning does not affect
+        :return: An instance of FrozenNetwork.FrozenNetwork, with the same activate and get_output methods
+        """
+
+        layers = self.hidden + [self.output]
+        return FrozenNetwork.FrozenNetwork([layer.get_weights() for layer in layers],
+                                           [layer.activation for layer in layers])
+
+    def compile(self):
+        """
+        Generate a pure python function computing the output of the network from its current weights, with the whole
+        network unrolled into local variables. The function is cached and generated again only once the weights have
+        been updated through update_weight, learn or learn_batch.
+        :return: A function taking a sequence of input values and returning a list of output values
+        """
+
+        # Generate the function again if the weights changed since the last time
+        if self._forward is None or self._forward_version != self.weights_version:
+            layers = self.hidden + [self.output]
+            self._forward = Codegen.build_forward([layer.get_weights() for layer in layers],
+                                                  [layer.activation for layer in layers])
+            self._forward_version = self.weights_version
+        return self._forward
+
+    def __getstate__(self):
+        """Leave the unrolled forward function out of the pickled state, it is generated again on demand"""
+
+        state = self.__dict__.copy()
+        state.pop('_forward', None)
+        state.pop('_forward_version', None)
+        return state
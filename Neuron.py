@@ -6,14 +6,17 @@ from math import exp
 import Synapse
 
 
-# Declare the class Neuron
-class Neuron:
-    """The basic computing unit on the neural network"""
+# Declare the class BaseNeuron
+class BaseNeuron(object):
+    """The behavior shared by all computing units, independently of how their attributes are stored"""
+
+    __slots__ = ()
 
     def __init__(self):
         """Define the attributes and initialize the neuron"""
 
         self.output = 0
+        self.sum_in = 0
         self.in_syn = []
         self.out_syn = []
         self.error = 0
@@ -22,7 +25,7 @@ class Neuron:
         """Define the operations to be executed when adding an input synapse"""
 
         # Check if the synapse is an instance of Synapse
-        if not (isinstance(synapse, Synapse.Synapse)):
+        if not (isinstance(synapse, Synapse.BaseSynapse)):
             # If not raise an error
             raise TypeError("Only synapses can link neurons")
         else:
@@ -33,44 +36,65 @@ class Neuron:
         """Define the operations to be executed when adding an ouput synapse"""
 
         # Check if the synapse is an instance of Synapse
-        if not (isinstance(synapse, Synapse.Synapse)):
+        if not (isinstance(synapse, Synapse.BaseSynapse)):
             # If not raise an error
             raise TypeError("Only synapses can link neurons")
         else:
             # Else add the synapse to the out_syn list
             self.out_syn.append(synapse)
 
-    def update_error(self, error=None):
-        """Define the procedure to update the error on the output"""
+    def update_error(self, error=None, activation=None):
+        """
+        Define the procedure to update the error on the output
+        :param activation: The Activation.Activation used by the neuron. Defaults to None, meaning the gaussian bump
+        """
 
         # If no error is provided
         if error is None:
-            sum_in = 0
-            for syn in self.in_syn:
-                sum_in += syn.get_weighted_input()
             sum_err = 0
             # For each out synapse
             for syn in self.out_syn:
                 sum_err += syn.neuron_out.error * syn.weight
             # Compute the error
-            self.error = sum_err * (-2 * sum_in * self.output)
+            if activation is None:
+                self.error = sum_err * (-2 * self.sum_in * self.output)
+            else:
+                self.error = sum_err * activation.scalar_derivative(self.sum_in, self.output)
         else:
             # Else store the error value
             self.error = error
 
-    def update_weight(self, learn_rate):
-        """Define the procedure to update the weight of the input synapses"""
+    def update_weight(self, learn_rate, gradients=None, interleaved=False):
+        """
+        Define the procedure to update the weight of the input synapses
+        :param gradients: A list of gradients accumulated over a batch of samples, one per input synapse. Defaults to
+        None, meaning use the error and output of the connected neurons
+        :param interleaved: True to normalize the weights after each synapse update, which costs O(fan_in^2), False
+        (default) to normalize them once after all the updates
+        """
 
         # For each input synapse
-        for syn in self.in_syn:
+        for index, syn in enumerate(self.in_syn):
             # Ask the synapse to update its weight
-            syn.update_weight(learn_rate)
+            if gradients is None:
+                syn.update_weight(learn_rate)
+            else:
+                syn.update_weight(learn_rate, gradients[index])
             # Normalize the synaptic weight
+            if interleaved:
+                self.normalize_weight()
+
+        # Normalize the synaptic weights once all of them are updated
+        if not interleaved:
             self.normalize_weight()
 
     def normalize_weight(self):
         """Normalize the weight, while keeping the dispersion ratio"""
 
+        # An input neuron does not have any weight to normalize
+        if not self.in_syn:
+            return
+
         # For each input synapse
         avg = 0
         # Compute the average
@@ -85,6 +109,9 @@ class Neuron:
             var += (syn.weight - avg) ** 2
         var /= len(self.in_syn)
         dev = var ** 0.5
+        # If all the weights are equal, there is no dispersion to keep
+        if dev == 0:
+            dev = 1
 
         # For each input synapse
         for syn in self.in_syn:
@@ -93,13 +120,48 @@ class Neuron:
             # And divide by the standard deviation
             syn.weight /= dev
 
-    def activate(self):
-        """Compute the new value of the neuron's output"""
+    def activate(self, activation=None):
+        """
+        Compute the new value of the neuron's output
+        :param activation: The Activation.Activation to apply. Defaults to None, meaning the gaussian bump
+        """
 
         # Get the weighted sum of the inputs
         sum_in = 0
         for syn in self.in_syn:
             sum_in += syn.get_weighted_input()
 
+        # Keep the weighted sum for the back propagation
+        self.sum_in = sum_in
+
         # Apply the activation function and assign the result to the output
-        self.output = exp(-(sum_in**2))
+        if activation is None:
+            self.output = exp(-(sum_in**2))
+        else:
+            self.output = activation.scalar(sum_in)
+
+
+# Declare the class Neuron
+class Neuron(BaseNeuron):
+    """The basic computing unit on the neural network"""
+
+    # Neurons recorded before the weighted sum was kept have not computed it yet
+    sum_in = 0
+
+
+# Declare the class CompactNeuron
+class CompactNeuron(BaseNeuron):
+    """A computing unit storing its attributes in slots rather than in a dictionary, to shrink large networks"""
+
+    __slots__ = ('output', 'sum_in', 'in_syn', 'out_syn', 'error')
+
+    def __getstate__(self):
+        """Gather the attributes in a dictionary, since there is no __dict__ to pickle"""
+
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        """Restore the attributes from a pickled dictionary"""
+
+        for name, value in state.items():
+            setattr(self, name, value)
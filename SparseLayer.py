@@ -0,0 +1,248 @@
+#!/usr/bin/python
+__author__ = 'davinellulinvega'
+
+# Import the required packages
+import numpy as np
+import Activation
+import DenseLayer
+
+
+def segment_sum(values, segments, nb_segment):
+    """
+    Sum values sharing the same segment, for one or many samples at once
+    :param values: An array of shape (nnz,) or (N, nnz)
+    :param segments: An array of shape (nnz,), the segment each column of values belongs to
+    :param nb_segment: The number of segments
+    :return: An array of shape (nb_segment,) or (N, nb_segment)
+    """
+
+    # A single sample
+    if values.ndim == 1:
+        return np.bincount(segments, weights=values, minlength=nb_segment).astype(values.dtype, copy=False)
+
+    # Give each sample its own range of segments, so that a single pass sums them all
+    nb_sample = values.shape[0]
+    offsets = np.arange(nb_sample)[:, np.newaxis] * nb_segment + segments
+    sums = np.bincount(offsets.ravel(), weights=values.ravel(), minlength=nb_sample * nb_segment)
+    return sums.reshape(nb_sample, nb_segment).astype(values.dtype, copy=False)
+
+
+# Define the SparseLayer class
+class SparseLayer(DenseLayer.DenseLayer):
+    """
+    A DenseLayer whose neurons are connected to only some of the neurons in the previous layer. The existing synapses
+    are stored in compressed sparse rows: the weights of neuron i are data[indptr[i]:indptr[i + 1]] and come from the
+    neurons indices[indptr[i]:indptr[i + 1]] of the previous layer. Every pass costs O(nnz), the number of synapses.
+    """
+
+    # The arrays holding floating point values, converted by set_dtype
+    float_arrays = ('output', 'error', 'sum_in', 'derivative', 'data', 'prev_delta', '_gradient')
+
+    def __init__(self, nb_neuron, prev_layer=None, seed=None, dtype=np.float64, activation="gaussian", density=0.1,
+                 pattern=None):
+        """
+        Define the attributes and initialize their value
+        :param seed: A seed or a numpy.random.Generator used to draw the connections and the initial weights. Defaults
+        to None, meaning draw them from a freshly seeded generator.
+        :param dtype: The floating point type used to store the values and compute with them, either numpy.float32 or
+        numpy.float64 (default)
+        :param activation: The name of a function registered in Activation.ACTIVATIONS. Defaults to the gaussian bump
+        :param density: The fraction of the previous layer each neuron is connected to, when no pattern is given.
+        Each neuron keeps at least two synapses, since the normalization turns a single weight into 0.
+        :param pattern: A boolean matrix of shape (nb_neuron, nb_prev), True where a synapse exists, with at least two
+        synapses per neuron. Defaults to None, meaning draw the connections at random according to the density.
+        """
+
+        # The precision of the values and the activation function
+        self.dtype = np.dtype(dtype)
+        Activation.get_activation(activation)
+        self.activation = activation
+        # The output and the error of each neuron in the layer
+        self.output = np.zeros(nb_neuron, dtype=dtype)
+        self.error = np.zeros(nb_neuron, dtype=dtype)
+        # The weighted sum of the inputs and the derivative of the activation, kept from the last activation
+        self.sum_in = np.zeros(nb_neuron, dtype=dtype)
+        self.derivative = np.zeros(nb_neuron, dtype=dtype)
+        # The layers feeding and fed by this one
+        self.prev_layer = None
+        self.next_layer = None
+        # The compressed rows: the first synapse of each neuron, the neuron feeding each synapse, the neuron each
+        # synapse belongs to and the weight of each synapse
+        self.indptr = None
+        self.indices = None
+        self.row = None
+        self.data = None
+        # Keep a record of the previous deltas, to compute the momentum
+        self.prev_delta = None
+        self.epsylon = 0.7
+
+        # Check if the previous layer exist
+        if not (prev_layer is None) and isinstance(prev_layer, DenseLayer.DenseLayer):
+            # Link both layers together
+            self.prev_layer = prev_layer
+            prev_layer.next_layer = self
+            rng = np.random.default_rng(seed)
+
+            # Build the connections from the pattern or the density
+            if pattern is None:
+                nb_prev = len(prev_layer)
+                fan_in = min(nb_prev, max(2, int(round(density * nb_prev))))
+                self.indices = np.concatenate([np.sort(rng.choice(nb_prev, fan_in, replace=False))
+                                               for _ in range(nb_neuron)]).astype(np.int32)
+                self.row = np.repeat(np.arange(nb_neuron, dtype=np.int32), fan_in)
+            else:
+                pattern = np.asarray(pattern, dtype=bool)
+                if pattern.shape != (nb_neuron, len(prev_layer)):
+                    raise IndexError("The connectivity pattern should have one row per neuron and one column per "
+                                     "neuron in the previous layer", pattern.shape, (nb_neuron, len(prev_layer)))
+                # A neuron left with a single synapse would be disconnected by the normalization, as with the density
+                fan_in = pattern.sum(axis=1)
+                if np.any(fan_in < min(2, len(prev_layer))):
+                    raise ValueError("The connectivity pattern should give each neuron at least two synapses",
+                                     np.flatnonzero(fan_in < 2))
+                row, indices = np.nonzero(pattern)
+                self.row = row.astype(np.int32)
+                self.indices = indices.astype(np.int32)
+            self.indptr = np.zeros(nb_neuron + 1, dtype=np.intp)
+            np.cumsum(np.bincount(self.row, minlength=nb_neuron), out=self.indptr[1:])
+
+            # Initialize the weights to random numbers between -1 and 1
+            self.data = rng.uniform(-1, 1, len(self.indices)).astype(dtype)
+            self.prev_delta = np.zeros(len(self.indices), dtype=dtype)
+            # Working buffer reused by every update
+            self._gradient = np.zeros(len(self.indices), dtype=dtype)
+            # The number of synapses of each neuron, at least one to keep the averages defined
+            self._fan_in = np.maximum(np.diff(self.indptr), 1)
+
+    def __getstate__(self):
+        """Leave the working buffer out of the pickled state, it is allocated again on loading"""
+
+        state = self.__dict__.copy()
+        state.pop('_gradient', None)
+        return state
+
+    def __setstate__(self, state):
+        """Restore the pickled state and allocate the working buffer, as a DenseLayer would have pickled it"""
+
+        self.__dict__.update(state)
+        if self.data is not None:
+            self._gradient = np.zeros(len(self.data), dtype=self.dtype)
+
+    @property
+    def nnz(self):
+        """The number of synapses stored by the layer"""
+
+        return 0 if self.data is None else len(self.data)
+
+    def update_weight(self, learn_rate, gradient=None, interleaved=False):
+        """
+        Define the procedure to update the weights of all incoming synapses
+        :param gradient: An array of gradients accumulated over a batch of samples, one per synapse, as returned by
+        get_gradient. Defaults to None, meaning use the error and output of the connected neurons
+        :param interleaved: True to normalize the weights after each synapse update, the k-th synapse of every neuron
+        being updated at once, False (default) to normalize them once after all the updates
+        """
+
+        # An input layer does not have any incoming synapse
+        if self.data is None:
+            return
+
+        # Compute the learning part of the deltas
+        if gradient is None:
+            np.multiply(self.error[self.row], self.prev_layer.output[self.indices], out=self._gradient)
+            self._gradient *= learn_rate
+        else:
+            np.multiply(gradient, learn_rate, out=self._gradient)
+        # Add the momentum and store the deltas in the previous deltas, they do not depend on the weights
+        delta = self.prev_delta
+        delta *= self.epsylon
+        delta += self._gradient
+
+        # Apply all the deltas, then normalize once
+        if not interleaved:
+            self.data += delta
+            self.normalize_weight()
+            return
+
+        # For each position within the rows, update the corresponding synapse of every neuron at once
+        position = np.arange(len(self.data)) - self.indptr[self.row]
+        for index in range(int(position.max()) + 1 if len(position) else 0):
+            # Compute the new weight
+            selected = np.flatnonzero(position == index)
+            self.data[selected] += delta[selected]
+            # Normalize the synaptic weights
+            self.normalize_weight()
+
+    def normalize_weight(self):
+        """Normalize the weights of each neuron, while keeping the dispersion ratio"""
+
+        # Compute the average of each neuron's incoming weights and subtract it
+        nb_neuron = len(self.output)
+        avg = segment_sum(self.data, self.row, nb_neuron)
+        avg /= self._fan_in
+        self.data -= avg[self.row]
+
+        # Compute the standard deviation
+        dev = segment_sum(self.data * self.data, self.row, nb_neuron)
+        dev /= self._fan_in
+        np.sqrt(dev, out=dev)
+        # If all the weights of a neuron are equal, there is no dispersion to keep
+        dev[dev == 0] = 1
+
+        # And divide by the standard deviation
+        self.data /= dev[self.row]
+
+    def activate(self):
+        """Define the procedure to activate all neurons in the layer"""
+
+        # Get the weighted sum of the inputs
+        self.sum_in[:] = segment_sum(self.data * self.prev_layer.output[self.indices], self.row, len(self.output))
+
+        # Apply the activation function and assign the result to the output
+        activation = Activation.get_activation(self.activation)
+        activation.function(self.sum_in, out=self.output)
+
+        # Keep the derivative of the activation for the back propagation
+        activation.derivative(self.sum_in, self.output, out=self.derivative)
+
+    def get_weights(self):
+        """Return the matrix of the incoming synaptic weights, with one row per neuron and 0 for missing synapses"""
+
+        weights = np.zeros((len(self.output), len(self.prev_layer)), dtype=self.dtype)
+        weights[self.row, self.indices] = self.data
+        return weights
+
+    def get_weighted_sum(self, inputs):
+        """
+        Compute the weighted sum of the inputs of each neuron for many samples at once
+        :param inputs: An array of shape (N, nb_prev), one row of output values of the previous layer per sample
+        :return: An array of shape (N, nb_neuron)
+        """
+
+        return segment_sum(inputs[:, self.indices] * self.data, self.row, len(self.output))
+
+    def get_back_error(self, errors, out=None):
+        """
+        Propagate the errors of many samples back through the incoming synapses
+        :param errors: An array of shape (N, nb_neuron), one row of errors per sample, or of shape (nb_neuron,) for a
+        single sample
+        :param out: An array receiving the result. Defaults to None, meaning allocate a new one
+        :return: An array of shape (N, nb_prev), the weighted sum of the errors seen by each neuron of the previous
+                 layer
+        """
+
+        back_error = segment_sum(errors[..., self.row] * self.data, self.indices, len(self.prev_layer))
+        if out is None:
+            return back_error
+        out[...] = back_error
+        return out
+
+    def get_gradient(self, errors, inputs):
+        """
+        Accumulate the gradient of the incoming synaptic weights over many samples
+        :param errors: An array of shape (N, nb_neuron), one row of errors per sample
+        :param inputs: An array of shape (N, nb_prev), one row of output values of the previous layer per sample
+        :return: An array of shape (nnz,), one gradient per synapse, that can be given to update_weight
+        """
+
+        return np.einsum('ij,ij->j', errors[:, self.row], inputs[:, self.indices])
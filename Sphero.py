@@ -43,6 +43,9 @@ class Sphero(sphero_driver.Sphero):
 
         # Initialize the actor and critic
         self._actor = None
+        self._frozen_actor = None
+        # The state the last roll was chosen from, which the actor learns from
+        self._roll_input = None
         self._critic = None
         loaded = True
         # If required from the configuration files
@@ -54,9 +57,12 @@ class Sphero(sphero_driver.Sphero):
             self._actor = Network.Network(2, hid_act, 2)
             self._critic = Network.Network(2, hid_crit, 1)
 
-    def initialize(self):
+    def initialize(self, sample_div=40, sample_frames=1):
         """
         Configure the the data streaming, collision detection and power notification
+        :param sample_div: The divisor of the 400Hz sampling rate of the sensors. Defaults to 40, meaning 10Hz
+        :param sample_frames: The number of frames the robot gathers before sending them in a single packet. Defaults
+        to 1. Batching frames lowers the load on the link and on the parser at higher sampling rates.
         :return: Nothing
         """
 
@@ -64,7 +70,7 @@ class Sphero(sphero_driver.Sphero):
         if self.is_connected:
             # Configure the collision detection and data streaming
             self.config_collision()
-            self.set_data_strm(40, 1, 0, 0,
+            self.set_data_strm(sample_div, sample_frames, 0, 0,
                                sphero_driver.STRM_MASK2['VELOCITY_X'] | sphero_driver.STRM_MASK2['VELOCITY_Y'] |
                                sphero_driver.STRM_MASK2['ODOM_X'] | sphero_driver.STRM_MASK2['ODOM_Y'], False)
 
@@ -139,15 +145,20 @@ class Sphero(sphero_driver.Sphero):
     def on_position_speed(self, data):
         """
         This function is a callback for the streaming of position and speed information.
-        :param data: A dictionary containing all the requested information
+        :param data: A record containing all the requested information, or an array of such records from the oldest to
+        the latest when several frames are streamed per packet
         :return: Nothing
         """
 
+        # Only the latest frame of a batch describes the present state
+        if self.sample_frames > 1:
+            data = data[-1]
+
         # Simply assign the values to the corresponding members
-        self._x = data['ODOM_X'] / 100
-        self._y = data['ODOM_Y'] / 100
-        self._speed_x = data['VELOCITY_X']
-        self._speed_y = data['VELOCITY_Y']
+        self._x = int(data['ODOM_X']) / 100
+        self._y = int(data['ODOM_Y']) / 100
+        self._speed_x = int(data['VELOCITY_X'])
+        self._speed_y = int(data['VELOCITY_Y'])
 
     def on_power_notify(self, data):
         """
@@ -225,6 +236,10 @@ class Sphero(sphero_driver.Sphero):
                 unpickle = Unpickler(cfg_file)
                 self._critic = unpickle.load()
 
+            # Replace the snapshot of the previous actor, if any
+            if self._frozen_actor is not None:
+                self.freeze_actor()
+
             # Return True because everything up to this point went well
             return True
 
@@ -251,7 +266,7 @@ class Sphero(sphero_driver.Sphero):
         # Record the collision positions
         self.dump_collision_pos()
         # Check that more than one thread is running to avoid a runtimeError
-        if threading.activeCount() > 0:
+        if threading.active_count() > 0:
             # Wait for all threads to terminate
             self.join(timeout)
 
@@ -284,33 +299,85 @@ class Sphero(sphero_driver.Sphero):
         :return: Nothing
         """
 
-        # Compute the punishment
-        if self._collided:
-            punishment = -1
-        else:
-            punishment = 0
-
         # Compute the error
-        error = punishment + discount * state_n - state_o
+        error = self.td_error(self._collided, state_n, state_o, discount)
+
+        # When the snapshot chose the roll, activate the actor itself on the same state so that it learns from its own
+        # activations
+        if self._frozen_actor is not None and self._roll_input is not None:
+            self._actor.activate(self._roll_input)
 
         # Have the actor and critic learn
         self._actor.learn([error, error], learn_rate)
         self._critic.learn([error], learn_rate)
 
+    @staticmethod
+    def td_error(collided, state_n, state_o, discount):
+        """
+        Compute the temporal difference error of a transition, a collision being punished by -1. Works on single values
+        as well as on numpy arrays holding many transitions.
+        :param collided: Whether the robot collided during the transition
+        :param state_n: the value of the new state
+        :param state_o: the value of the old state
+        :param discount: the discount rate
+        :return: The error
+        """
+
+        # Compute the punishment
+        punishment = -1 * collided
+
+        # Compute the error
+        return punishment + discount * state_n - state_o
+
+    @staticmethod
+    def roll_params(speed_output, heading_output, max_speed=255):
+        """
+        Map the outputs of the actor to the parameters of a roll. Works on single values as well as on numpy arrays.
+        :param speed_output: The output of the actor driving the speed, in the range [0; 1]
+        :param heading_output: The output of the actor driving the heading, in the range [0; 1]
+        :param max_speed: The maximal speed at which sphero can roll
+        :return: A tuple: (speed, heading), not rounded
+        """
+
+        speed = speed_output * max_speed  # With output=1 -> max_speed, with output=0 -> 0
+        heading = heading_output * 359  # 359 is the maximum heading possible
+        return speed, heading
+
+    def freeze_actor(self):
+        """
+        Take an inference only snapshot of the actor, which get_roll_params uses instead of the actor until the next
+        call to this method or to thaw_actor. Call it again to refresh the snapshot with what the actor has learned.
+        :return: Nothing
+        """
+
+        self._frozen_actor = self._actor.freeze()
+
+    def thaw_actor(self):
+        """
+        Drop the snapshot of the actor, so that get_roll_params uses the actor itself again
+        :return: Nothing
+        """
+
+        self._frozen_actor = None
+
     def get_roll_params(self, max_speed=255):
         """
-        Activate the actor and return the speed and heading for the next roll
+        Activate the actor, or its snapshot if freeze_actor was called, and return the speed and heading for the next
+        roll
         :param max_speed: The maximal speed at which sphero can roll
         :return: A tuple: (speed, heading)
         """
 
-        # Activate the actor
-        self._actor.activate([self._x, self._y])
+        # Use the snapshot of the actor if there is one
+        actor = self._actor if self._frozen_actor is None else self._frozen_actor
+
+        # Activate the actor, remembering the state for learn
+        self._roll_input = [self._x, self._y]
+        actor.activate(self._roll_input)
 
         # Get the parameters for the roll
-        outputs = self._actor.get_output()  # outputs are in the range [0; 1]
-        speed = outputs[0] * max_speed  # With output=1 -> max_speed, with output=0 -> 0
-        heading = outputs[1] * 359  # 359 is the maximum heading possible
+        outputs = actor.get_output()  # outputs are in the range [0; 1]
+        speed, heading = self.roll_params(outputs[0], outputs[1], max_speed)
 
         # Return the formatted parameters
         return int(speed), int(heading)
@@ -6,38 +6,52 @@ from random import uniform
 import Neuron
 
 
-# Define the Synapse class
-class Synapse:
-    """The basic connection between computing units in the neural network"""
+# Define the BaseSynapse class
+class BaseSynapse(object):
+    """The behavior shared by all connections, independently of how their attributes are stored"""
+
+    __slots__ = ()
 
-    def __init__(self, neuron_in, neuron_out):
-        """Define the synapse's attribute and initialize their value"""
+    def __init__(self, neuron_in, neuron_out, weight=None):
+        """
+        Define the synapse's attribute and initialize their value
+        :param weight: The initial weight. Defaults to None, meaning a random number between -1 and 1
+        """
 
-        # Initialize the weight to a random number between 0 and 1
-        self.weight = uniform(-1, 1)
+        # Initialize the weight to a random number between -1 and 1
+        if weight is None:
+            weight = uniform(-1, 1)
+        self.weight = weight
         # Keep a record of the previous delta, to compute the momentum
         self.prev_delta = 0
         self.epsylon = 0.7
         # Check if neuron_in is an instance of Neuron
-        if not (isinstance(neuron_in, Neuron.Neuron)):
+        if not (isinstance(neuron_in, Neuron.BaseNeuron)):
             # If not raise an error
             raise TypeError("Only neurons can be connected to a synapse")
         else:
             # Else store the instance
             self.neuron_in = neuron_in
             # Check if neuron_out is an instance of Neuron
-        if not (isinstance(neuron_out, Neuron.Neuron)):
+        if not (isinstance(neuron_out, Neuron.BaseNeuron)):
             # If not raise an error
             raise TypeError("Only neurons can be connected to a synapse")
         else:
             # Else store the instance
             self.neuron_out = neuron_out
 
-    def update_weight(self, learn_rate):
-        """Define the procedure for updating the weight of the synapse"""
+    def update_weight(self, learn_rate, gradient=None):
+        """
+        Define the procedure for updating the weight of the synapse
+        :param gradient: A gradient accumulated over a batch of samples. Defaults to None, meaning use the error and
+        output of the connected neurons
+        """
 
         # Compute the delta
-        delta = learn_rate * self.neuron_out.error * self.neuron_in.output + self.epsylon * self.prev_delta
+        if gradient is None:
+            delta = learn_rate * self.neuron_out.error * self.neuron_in.output + self.epsylon * self.prev_delta
+        else:
+            delta = learn_rate * gradient + self.epsylon * self.prev_delta
         # Compute the new weight
         self.weight += delta
         # Store the delta in the previous delta
@@ -47,3 +61,43 @@ class Synapse:
         """Returns the value of the neuron_in multiplied by the weight of the synapse"""
 
         return self.weight * self.neuron_in.output
+
+
+# Define the Synapse class
+class Synapse(BaseSynapse):
+    """The basic connection between computing units in the neural network"""
+
+
+# Define the CompactSynapse class
+class CompactSynapse(BaseSynapse):
+    """A connection storing its attributes in slots rather than in a dictionary, to shrink large networks"""
+
+    __slots__ = ('weight', 'prev_delta', 'epsylon', 'neuron_in', 'neuron_out')
+
+    def __init__(self, neuron_in, neuron_out, weight=None):
+        """
+        Define the synapse's attribute and initialize their value, trusting the caller to provide neurons
+        :param weight: The initial weight. Defaults to None, meaning a random number between -1 and 1
+        """
+
+        # Initialize the weight to a random number between -1 and 1
+        if weight is None:
+            weight = uniform(-1, 1)
+        self.weight = weight
+        # Keep a record of the previous delta, to compute the momentum
+        self.prev_delta = 0
+        self.epsylon = 0.7
+        # Store the connected neurons
+        self.neuron_in = neuron_in
+        self.neuron_out = neuron_out
+
+    def __getstate__(self):
+        """Gather the attributes in a dictionary, since there is no __dict__ to pickle"""
+
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        """Restore the attributes from a pickled dictionary"""
+
+        for name, value in state.items():
+            setattr(self, name, value)
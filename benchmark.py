@@ -0,0 +1,482 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = 'davinellulinvega'
+
+# Import the required packages
+import argparse
+import contextlib
+import copy
+import functools
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+import numpy as np
+import Activation
+import DenseLayer
+import Layer
+import Network
+import Sphero
+import SparseLayer
+
+# The layer classes to compare, by name
+LAYER_CLASSES = dict(
+    layer=Layer.Layer,
+    compact=Layer.CompactLayer,
+    dense=DenseLayer.DenseLayer,
+    sparse=functools.partial(SparseLayer.SparseLayer, density=0.1))
+
+# The largest difference allowed between the single and double precision learning curves of the reference task
+PRECISION_TOLERANCE = 1e-5
+
+# The hidden layers of the networks measured by the suite, from the smallest one to wide layers
+SUITE_TOPOLOGIES = [[1], [10], [10, 10, 10], [50, 50, 50], [100, 100, 100], [250, 250]]
+
+# The slowdown relative to the baseline above which the suite reports a regression
+REGRESSION_TOLERANCE = 0.2
+
+# The names of all the benchmarks
+BENCHMARKS = ["layer", "network", "forward", "precision", "activation", "suite"]
+
+
+def measure_layer(layer_class, nb_neuron):
+    """
+    Build a fully connected layer of nb_neuron neurons on top of a layer of the same size, and measure its footprint
+    :param layer_class: The class used to build both layers
+    :param nb_neuron: The number of neurons in each layer
+    :return: A tuple: (bytes per synapse, construction time in seconds)
+    """
+
+    # Build a tiny layer first so that one time initializations do not end up in the measurement
+    layer_class(1, layer_class(1))
+
+    # Build the previous layer outside of the measurement
+    gc.collect()
+    prev_layer = layer_class(nb_neuron)
+
+    # Measure the memory allocated by an unconnected layer, to isolate the cost of the synapses
+    tracemalloc.start()
+    unconnected = layer_class(nb_neuron)
+    neuron_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del unconnected
+
+    # Measure the time taken to build the connected layer
+    gc.collect()
+    start = time.perf_counter()
+    layer_class(nb_neuron, prev_layer)
+    duration = time.perf_counter() - start
+
+    # Build the connected layer again to measure the memory it holds, the tracing slows the construction down
+    gc.collect()
+    tracemalloc.start()
+    layer = layer_class(nb_neuron, prev_layer)
+    layer_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del layer
+
+    # Return the memory per synapse and the construction time
+    return float(layer_bytes - neuron_bytes) / (nb_neuron * nb_neuron), duration
+
+
+def bench_layer(sizes, names):
+    """
+    Print the bytes per synapse and the construction time of Layer(n, prev_layer) for each size and layer class
+    :param sizes: A list of layer sizes
+    :param names: A list of keys in LAYER_CLASSES
+    :return: Nothing
+    """
+
+    print("{:<10}{:>8}{:>12}{:>16}{:>16}".format("class", "size", "synapses", "bytes/synapse", "build (ms)"))
+    for size in sizes:
+        for name in names:
+            bytes_per_syn, duration = measure_layer(LAYER_CLASSES[name], size)
+            print("{:<10}{:>8}{:>12}{:>16.1f}{:>16.2f}".format(name, size, size * size, bytes_per_syn,
+                                                                 duration * 1000))
+
+
+def bench_network(sizes, names):
+    """
+    Print the construction time of a Network(2, [n, n, n], 2), the shape of the actor in main.py, for each size and
+    layer class
+    :param sizes: A list of hidden layer sizes
+    :param names: A list of keys in LAYER_CLASSES
+    :return: Nothing
+    """
+
+    print("{:<10}{:>8}{:>16}".format("class", "size", "build (ms)"))
+    for size in sizes:
+        for name in names:
+            # Build the network with a fixed seed
+            gc.collect()
+            start = time.perf_counter()
+            Network.Network(2, [size, size, size], 2, LAYER_CLASSES[name], seed=0)
+            duration = time.perf_counter() - start
+            print("{:<10}{:>8}{:>16.2f}".format(name, size, duration * 1000))
+
+
+def time_call(function, number):
+    """
+    Measure the average duration of a call
+    :param function: The function to call, without any argument
+    :param number: The number of calls per measurement, the best of three measurements is kept
+    :return: The duration of a call in seconds
+    """
+
+    return min(timeit.repeat(function, number=number, repeat=3)) / number
+
+
+def bench_forward(sizes, number=2000):
+    """
+    Print the duration of a forward pass through a Network(2, [n, n, n], 2) for the object graph, the dense engine,
+    a frozen snapshot and the unrolled function generated by Network.compile
+    :param sizes: A list of hidden layer sizes
+    :param number: The number of forward passes per measurement
+    :return: Nothing
+    """
+
+    print("{:<10}{:>8}{:>16}{:>12}".format("engine", "size", "forward (us)", "speedup"))
+    input_val = [0.25, 0.75]
+    for size in sizes:
+        # Build the same network with both engines
+        graph = Network.Network(2, [size, size, size], 2, Layer.Layer, seed=0)
+        dense = Network.Network(2, [size, size, size], 2, seed=0)
+        frozen = dense.freeze()
+        forward = dense.compile()
+
+        # Measure a forward pass followed by the retrieval of the outputs, as done by Sphero.get_roll_params
+        durations = [("layer", time_call(lambda: (graph.activate(input_val), graph.get_output()), number)),
+                     ("dense", time_call(lambda: (dense.activate(input_val), dense.get_output()), number)),
+                     ("frozen", time_call(lambda: (frozen.activate(input_val), frozen.get_output()), number)),
+                     ("unrolled", time_call(lambda: forward(input_val), number))]
+        for name, duration in durations:
+            print("{:<10}{:>8}{:>16.2f}{:>11.1f}x".format(name, size, duration * 1e6, durations[0][1] / duration))
+
+
+def learn_frozen(frozen, actor, critic, steps=20):
+    """
+    Have a Sphero go through the learning steps of main.py from random positions, without a robot
+    :param frozen: Whether to choose the rolls with a snapshot of the actor taken before each step
+    :param actor: The Network copied as the actor
+    :param critic: The Network copied as the critic
+    :param steps: The number of steps
+    :return: The list of weight matrices of the actor after learning
+    """
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sphero = Sphero.Sphero(False)
+    sphero._actor = copy.deepcopy(actor)
+    sphero._critic = copy.deepcopy(critic)
+    rng = np.random.default_rng(0)
+    for step in range(steps):
+        if frozen:
+            sphero.freeze_actor()
+        sphero._x, sphero._y = rng.random(2).tolist()
+        state_o = sphero.get_state_value()
+        sphero.get_roll_params()
+        sphero._x, sphero._y = rng.random(2).tolist()
+        sphero._collided = step % 3 == 0
+        state_n = sphero.get_state_value()
+        sphero.learn(state_n, state_o, 0.7, 0.05)
+    return [layer.weights for layer in sphero._actor.hidden + [sphero._actor.output]]
+
+
+def check_frozen_learning():
+    """
+    Check that the actor keeps learning while a frozen snapshot of it chooses the rolls: its weights should change as
+    they do when the actor chooses the rolls itself
+    :return: True if they do, False otherwise
+    """
+
+    actor = Network.Network(2, [10, 10, 10], 2, seed=0)
+    critic = Network.Network(2, [10, 10, 10], 1, seed=1)
+    live = learn_frozen(False, actor, critic)
+    frozen = learn_frozen(True, actor, critic)
+    initial = [layer.weights for layer in actor.hidden + [actor.output]]
+    passed = all(np.allclose(weights, other) for weights, other in zip(live, frozen)) and \
+        any(not np.array_equal(weights, other) for weights, other in zip(frozen, initial))
+    print("actor learning behind a frozen snapshot: {}".format("OK" if passed else "FAILED"))
+    return passed
+
+
+def learning_curve(dtype, steps=5000, every=250, learn_rate=0.01):
+    """
+    Train a Network(5, [20, 20], 1) to approximate a gaussian bump centered in the unit hypercube, one sample at a time
+    as Sphero.learn does, and record the mean squared error on a fixed evaluation set along the way
+    :param dtype: The floating point type of the network
+    :param steps: The number of learning steps
+    :param every: The number of steps between two evaluations
+    :param learn_rate: The learning rate
+    :return: A tuple: (array of mean squared errors, duration of a learning step in seconds, bytes of weights)
+    """
+
+    # Draw the training and evaluation samples from fixed seeds
+    net = Network.Network(5, [20, 20], 1, seed=0, dtype=dtype)
+    inputs = np.random.default_rng(1).random((steps, 5))
+    targets = np.exp(-4 * ((inputs - 0.5) ** 2).sum(axis=1))
+    eval_inputs = np.random.default_rng(2).random((256, 5))
+    eval_targets = np.exp(-4 * ((eval_inputs - 0.5) ** 2).sum(axis=1))
+
+    # Learn and evaluate periodically
+    curve = []
+    duration = 0
+    for step in range(steps):
+        start = time.perf_counter()
+        net.activate(inputs[step].tolist())
+        net.learn([float(targets[step]) - net.get_output()[0]], learn_rate)
+        duration += time.perf_counter() - start
+        if step % every == 0 or step == steps - 1:
+            curve.append(((net.activate_batch(eval_inputs)[:, 0] - eval_targets) ** 2).mean())
+
+    # Return the curve, the cost of a step and the memory taken by the weights
+    nb_bytes = sum(layer.weights.nbytes + layer.prev_delta.nbytes for layer in net.hidden + [net.output])
+    return np.array(curve, dtype=np.float64), duration / steps, nb_bytes
+
+
+def bench_precision():
+    """
+    Check that single and double precision networks learn the reference task along the same curve, within
+    PRECISION_TOLERANCE, and print the cost of both
+    :return: True if the curves agree, False otherwise
+    """
+
+    # Learn the reference task in both precisions
+    curve64, step64, bytes64 = learning_curve(np.float64)
+    curve32, step32, bytes32 = learning_curve(np.float32)
+
+    # Compare the results
+    print("{:<10}{:>14}{:>14}{:>16}".format("dtype", "final mse", "step (us)", "weight bytes"))
+    print("{:<10}{:>14.6f}{:>14.2f}{:>16}".format("float64", curve64[-1], step64 * 1e6, bytes64))
+    print("{:<10}{:>14.6f}{:>14.2f}{:>16}".format("float32", curve32[-1], step32 * 1e6, bytes32))
+    difference = np.abs(curve64 - curve32).max()
+    passed = difference <= PRECISION_TOLERANCE
+    print("largest difference between the learning curves: {:.3g} (tolerance {:g}) {}".format(
+        difference, PRECISION_TOLERANCE, "OK" if passed else "FAILED"))
+    return passed
+
+
+def bench_activation(sizes, number=2000):
+    """
+    Print the cost of each registered activation function, with its derivative, on vectors of weighted sums as the
+    dense engine does and on a single float as a neuron of the object graph does, then check the error of the lookup
+    table against its bound
+    :param sizes: A list of vector sizes
+    :param number: The number of calls per measurement
+    :return: True if the lookup table stays within its error bound, False otherwise
+    """
+
+    # Draw weighted sums covering the range seen by the neurons
+    rng = np.random.default_rng(0)
+    print("{:<14}{:>8}{:>16}{:>16}".format("activation", "size", "forward (us)", "derivative (us)"))
+    for name in sorted(Activation.ACTIVATIONS):
+        activation = Activation.get_activation(name)
+        for size in sizes:
+            sum_in = rng.uniform(-3, 3, size)
+            output = np.empty(size)
+            derivative = np.empty(size)
+            forward = time_call(lambda: activation.function(sum_in, out=output), number)
+            backward = time_call(lambda: activation.derivative(sum_in, output, out=derivative), number)
+            print("{:<14}{:>8}{:>16.3f}{:>16.3f}".format(name, size, forward * 1e6, backward * 1e6))
+        forward = time_call(lambda: activation.scalar(0.3), number)
+        backward = time_call(lambda: activation.scalar_derivative(0.3, 0.9), number)
+        print("{:<14}{:>8}{:>16.3f}{:>16.3f}".format(name, "scalar", forward * 1e6, backward * 1e6))
+
+    # Compare the lookup table with the exact gaussian bump, including outside of the table
+    sum_in = np.linspace(-2 * Activation.GAUSSIAN_TABLE.bound, 2 * Activation.GAUSSIAN_TABLE.bound, 1000001)
+    error = np.abs(Activation.GAUSSIAN_TABLE.function(sum_in) - Activation.gaussian(sum_in)).max()
+    passed = error <= Activation.GAUSSIAN_TABLE.max_error
+    print("largest error of the lookup table: {:.3g} (bound {:.3g}) {}".format(
+        error, Activation.GAUSSIAN_TABLE.max_error, "OK" if passed else "FAILED"))
+    return passed
+
+
+def parse_topology(text):
+    """Parse the hidden layers of a network given as '10,10,10'"""
+
+    try:
+        topology = [int(size) for size in text.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("hidden layers are given as comma separated sizes, like 10,10,10")
+    if min(topology) < 1:
+        raise argparse.ArgumentTypeError("hidden layers are given as comma separated sizes, like 10,10,10")
+    return topology
+
+
+def time_auto(function):
+    """
+    Measure the average duration of a call, with enough calls per measurement for it to last at least 0.2 seconds
+    :param function: The function to call, without any argument
+    :return: The duration of a call in seconds, the best of three measurements
+    """
+
+    timer = timeit.Timer(function)
+    number = timer.autorange()[0]
+    return min(timer.repeat(repeat=3, number=number)) / number
+
+
+def time_brain(actor, critic):
+    """
+    Measure Sphero.dump_brain and Sphero.load_brain in a temporary directory
+    :param actor: The Network recorded as the actor
+    :param critic: The Network recorded as the critic
+    :return: A tuple: (dump duration, load duration) in seconds
+    """
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            # Lay out the directories the robot reads and writes
+            os.chdir(directory)
+            os.mkdir("Config")
+            os.mkdir("Data")
+            open(os.path.join("Data", "collision_position.dat"), "w").close()
+
+            # Record and load the networks
+            sphero = Sphero.Sphero(False)
+            sphero._actor = actor
+            sphero._critic = critic
+            return time_auto(sphero.dump_brain), time_auto(sphero.load_brain)
+        finally:
+            os.chdir(cwd)
+
+
+def bench_suite(topologies, names):
+    """
+    Measure the operations of the networks for each topology and layer class: construction, forward pass, learning
+    step, weight normalization and recording and loading of the brain by Sphero
+    :param topologies: A list of hidden layer lists
+    :param names: A list of keys in LAYER_CLASSES
+    :return: A dictionary of durations in seconds, by 'operation/class/topology'
+    """
+
+    results = dict()
+    print("{:<12}{:<10}{:>16}{:>16}".format("operation", "class", "topology", "duration (us)"))
+    for topology in topologies:
+        for name in names:
+            # Build the networks of the robot, with the shape of the actor and of the critic
+            layer_class = LAYER_CLASSES[name]
+            actor = Network.Network(2, topology, 2, layer_class, seed=0)
+            critic = Network.Network(2, topology, 1, layer_class, seed=1)
+            layers = actor.hidden + [actor.output]
+            actor.activate([0.25, 0.75])
+
+            # Measure each operation
+            durations = [("build", time_auto(lambda: Network.Network(2, topology, 2, layer_class, seed=0))),
+                         ("activate", time_auto(lambda: actor.activate([0.25, 0.75]))),
+                         ("learn", time_auto(lambda: actor.learn([0.1, -0.1], 0.001))),
+                         ("normalize", time_auto(lambda: [layer.normalize_weight() for layer in layers]))]
+            durations.extend(zip(("dump_brain", "load_brain"), time_brain(actor, critic)))
+
+            # Record and print them
+            label = "-".join(str(size) for size in topology)
+            for operation, duration in durations:
+                results["{}/{}/{}".format(operation, name, label)] = duration
+                print("{:<12}{:<10}{:>16}{:>16.2f}".format(operation, name, label, duration * 1e6))
+    return results
+
+
+def write_results(path, results):
+    """
+    Record the results of the suite in a JSON file, along with a description of the platform
+    :param path: The path of the file
+    :param results: A dictionary of durations in seconds, as returned by bench_suite
+    :return: Nothing
+    """
+
+    with open(path, "w") as json_file:
+        json.dump(dict(platform=dict(python=platform.python_version(), numpy=np.__version__,
+                                     machine=platform.machine(), system=platform.system()),
+                       results=results), json_file, indent=2, sort_keys=True)
+
+
+def compare_results(path, results, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compare the results of the suite with a baseline recorded by write_results
+    :param path: The path of the baseline
+    :param results: A dictionary of durations in seconds, as returned by bench_suite
+    :param tolerance: The slowdown above which a measurement is a regression, 0.2 meaning 20% slower
+    :return: True if there is no regression, False otherwise
+    """
+
+    with open(path, "r") as json_file:
+        baseline = json.load(json_file)['results']
+
+    # Compare the measurements found in both
+    regressions = 0
+    print("{:<40}{:>16}{:>16}{:>10}".format("measurement", "baseline (us)", "current (us)", "ratio"))
+    for key in sorted(set(results) & set(baseline)):
+        ratio = results[key] / baseline[key]
+        if ratio > 1 + tolerance:
+            status = "REGRESSION"
+            regressions += 1
+        elif ratio < 1 - tolerance:
+            status = "faster"
+        else:
+            status = ""
+        print("{:<40}{:>16.2f}{:>16.2f}{:>9.2f}x {}".format(key, baseline[key] * 1e6, results[key] * 1e6, ratio,
+                                                            status))
+    missing = len(set(results) ^ set(baseline))
+    print("{} regression(s) above {:.0%}, {} measurement(s) in only one of the runs".format(
+        regressions, tolerance, missing))
+    return regressions == 0
+
+
+if __name__ == "__main__":
+    # Parse the command line
+    parser = argparse.ArgumentParser(description="Benchmark the neural network engines")
+    parser.add_argument("benchmarks", nargs="*", metavar="{" + ",".join(BENCHMARKS) + "}",
+                        help="The benchmarks to run, all of them by default")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        help="The number of neurons in the measured layers. Defaults to 10 50 100 250 500 for the "
+                             "construction benchmarks, 2 5 10 20 for the forward pass and 10 100 1000 for the "
+                             "activation functions")
+    parser.add_argument("--classes", nargs="+", choices=sorted(LAYER_CLASSES), default=["layer", "compact", "dense"],
+                        help="The layer classes to measure, sparse connects each neuron to 10%% of the previous layer")
+    parser.add_argument("--topologies", type=parse_topology, nargs="+", default=SUITE_TOPOLOGIES,
+                        help="The hidden layers of the networks measured by the suite, like 10,10,10. Defaults to "
+                             + " ".join(",".join(str(size) for size in topology) for topology in SUITE_TOPOLOGIES))
+    parser.add_argument("--output", help="Record the results of the suite in this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="Compare the results of the suite with a JSON file recorded by --output, and fail if "
+                             "a measurement is slower than the baseline by more than the tolerance")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="The slowdown reported as a regression by --compare. Defaults to %(default)s, 20%% slower")
+    args = parser.parse_args()
+    benchmarks = args.benchmarks or BENCHMARKS
+    for name in benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark: " + name)
+
+    # Run the benchmarks
+    if "layer" in benchmarks:
+        bench_layer(args.sizes or [10, 50, 100, 250, 500], args.classes)
+        print("")
+    if "network" in benchmarks:
+        bench_network(args.sizes or [10, 50, 100, 250, 500], args.classes)
+        print("")
+    passed = True
+    if "forward" in benchmarks:
+        bench_forward(args.sizes or [2, 5, 10, 20])
+        passed = check_frozen_learning() and passed
+        print("")
+    if "precision" in benchmarks:
+        passed = bench_precision() and passed
+        print("")
+    if "activation" in benchmarks:
+        passed = bench_activation(args.sizes or [10, 100, 1000]) and passed
+        print("")
+    if "suite" in benchmarks:
+        results = bench_suite(args.topologies, args.classes)
+        if args.output:
+            write_results(args.output, results)
+        if args.compare:
+            print("")
+            passed = compare_results(args.compare, results, args.tolerance) and passed
+    if not passed:
+        sys.exit(1)
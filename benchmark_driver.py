@@ -0,0 +1,621 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = 'davinellulinvega'
+
+# Import the required packages
+import argparse
+import contextlib
+import functools
+import io
+import random
+import struct
+import sys
+import threading
+import time
+import timeit
+import sphero_driver
+import sphero_sim
+
+# The streaming masks to measure, by name: (mask1, mask2)
+MASKS = dict(
+    # What Sphero.initialize streams
+    position=(0, sphero_driver.STRM_MASK2['ODOM_X'] | sphero_driver.STRM_MASK2['ODOM_Y'] |
+              sphero_driver.STRM_MASK2['VELOCITY_X'] | sphero_driver.STRM_MASK2['VELOCITY_Y']),
+    # The filtered inertial measurements
+    imu=(functools.reduce(lambda mask, key: mask | sphero_driver.STRM_MASK1[key],
+                          [key for key in sphero_driver.STRM_MASK1 if key.startswith(('IMU_', 'ACCEL_', 'GYRO_')) and
+                           key.endswith('_FILTERED')], 0), 0),
+    # Every field the robot can stream
+    all=(functools.reduce(lambda mask, value: mask | value, sphero_driver.STRM_MASK1.values(), 0),
+         functools.reduce(lambda mask, value: mask | value, sphero_driver.STRM_MASK2.values(), 0)))
+
+# The fraction of the asynchronous packets reporting a collision, and a power notification
+COLLISION_RATE = 0.01
+POWER_RATE = 0.001
+
+# The rate at which the robot samples its sensors, in frames per second
+SAMPLE_RATE = 400.0
+
+# The names of all the benchmarks
+BENCHMARKS = ["stream", "parse", "encode", "command", "flood", "response"]
+
+
+def async_packet(id_code, payload):
+    """Build an asynchronous packet: SOP1, SOP2, ID CODE, DLEN-MSB, DLEN-LSB, data and CHK"""
+
+    body = bytearray([id_code, (len(payload) + 1) >> 8, (len(payload) + 1) & 0xff]) + payload
+    return bytearray([0xff, 0xfe]) + body + bytearray([sphero_sim.checksum(body)])
+
+
+def sync_packet(seq, payload=bytearray()):
+    """Build a successful acknowledgement: SOP1, SOP2, MRSP, SEQ, DLEN, data and CHK"""
+
+    body = bytearray([sphero_driver.MRSP['ORBOTIX_RSP_CODE_OK'], seq & 0xff, len(payload) + 1]) + payload
+    return bytearray([0xff, 0xff]) + body + bytearray([sphero_sim.checksum(body)])
+
+
+def nb_field(mask1, mask2):
+    """Return the number of fields streamed for a pair of masks"""
+
+    return bin(mask1).count('1') + bin(mask2).count('1')
+
+
+def make_stream(mask1, mask2, sample_frames, nb_packet, sync_ratio=0.0, seed=0):
+    """
+    Generate the bytes sent by a robot streaming its sensors, mixed with acknowledgements, collisions and power
+    notifications
+    :param mask1: The first streaming mask, as given to set_data_strm
+    :param mask2: The second streaming mask
+    :param sample_frames: The number of frames in each data packet
+    :param nb_packet: The number of packets
+    :param sync_ratio: The fraction of the packets acknowledging a command
+    :param seed: The seed of the mix of packets and of the streamed values
+    :return: A tuple: (the stream as a bytearray, a dictionary counting the packets of each kind)
+    """
+
+    rng = random.Random(seed)
+    nb_value = nb_field(mask1, mask2) * sample_frames
+    stream = bytearray()
+    counts = dict(sync=0, data=0, collision=0, power=0)
+    for index in range(nb_packet):
+        draw = rng.random()
+        if draw < sync_ratio:
+            stream += sync_packet(index)
+            counts['sync'] += 1
+            continue
+        draw = (draw - sync_ratio) / (1 - sync_ratio)
+        if draw < POWER_RATE:
+            stream += async_packet(sphero_driver.IDCODE['PWR_NOTIFY'], bytearray([rng.randint(1, 4)]))
+            counts['power'] += 1
+        elif draw < POWER_RATE + COLLISION_RATE:
+            stream += async_packet(sphero_driver.IDCODE['COLLISION'], bytearray(struct.pack(
+                '>hhhBhhBI', rng.randint(-0x8000, 0x7fff), rng.randint(-0x8000, 0x7fff), 0, 1, rng.randint(0, 0x7fff),
+                rng.randint(0, 0x7fff), rng.randint(0, 255), index)))
+            counts['collision'] += 1
+        else:
+            values = [rng.randint(-0x8000, 0x7fff) for _ in range(nb_value)]
+            stream += async_packet(sphero_driver.IDCODE['DATA_STRM'],
+                                   bytearray(struct.pack('>%dh' % nb_value, *values)))
+            counts['data'] += 1
+    return stream, counts
+
+
+# Define the EndOfStream class
+class EndOfStream(Exception):
+    """Raised by ReplayInterface.recv once the whole stream has been read"""
+
+
+# Define the ReplayInterface class
+class ReplayInterface(object):
+    """A transport with the methods of sphero_driver.BTInterface, replaying a recorded stream in chunks"""
+
+    def __init__(self, stream, chunk_size):
+        """
+        Define the attributes
+        :param stream: The bytes to deliver
+        :param chunk_size: The largest number of bytes delivered by a single recv, the socket may deliver less than
+        requested
+        """
+
+        self.stream = bytes(stream)
+        self._view = memoryview(self.stream)
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.sent = bytearray()
+
+    def connect(self):
+        """Open the link"""
+
+        return True
+
+    def send(self, data):
+        """Record the bytes sent by the driver"""
+
+        self.sent += data
+
+    def recv(self, num_bytes):
+        """Return the next chunk of the stream, and raise EndOfStream once it is exhausted"""
+
+        if self.position >= len(self.stream):
+            raise EndOfStream()
+        end = self.position + min(num_bytes, self.chunk_size)
+        data = self.stream[self.position:end]
+        self.position = end
+        return data
+
+    def recv_into(self, buffer, num_bytes):
+        """Copy the next chunk of the stream into buffer and return its length, as recv does otherwise"""
+
+        if self.position >= len(self.stream):
+            raise EndOfStream()
+        nb_bytes = min(num_bytes, self.chunk_size, len(self.stream) - self.position)
+        buffer[:nb_bytes] = self._view[self.position:self.position + nb_bytes]
+        self.position += nb_bytes
+        return nb_bytes
+
+    def close(self):
+        """Close the link"""
+
+        pass
+
+
+# Define the StreamingInterface class
+class StreamingInterface(object):
+    """
+    A transport with the methods of sphero_driver.BTInterface, whose recv blocks as a socket does until the robot sends
+    its next data packet, once every period
+    """
+
+    def __init__(self, target_name='Sphero', target_addr=None, period=0.1, packet=bytearray()):
+        """
+        Define the attributes
+        :param period: The time between two packets sent by the robot, in seconds
+        :param packet: The packet sent by the robot
+        """
+
+        self.period = period
+        self.packet = bytes(packet)
+        # The time at which each write reached the link, and its bytes
+        self.sent = []
+        self._next = None
+        self._closed = threading.Event()
+
+    def connect(self):
+        """Open the link, the first packet arrives one period later"""
+
+        self._next = time.perf_counter() + self.period
+        return True
+
+    def send(self, data):
+        """Record the time at which the bytes reached the link"""
+
+        self.sent.append((time.perf_counter(), bytes(data)))
+
+    def recv(self, num_bytes):
+        """Wait for the next packet and return it, or return nothing once the link is closed"""
+
+        if self._closed.wait(max(0.0, self._next - time.perf_counter())):
+            return b''
+        self._next += self.period
+        return self.packet
+
+    def close(self):
+        """Close the link, waking recv up"""
+
+        self._closed.set()
+
+
+def make_driver(stream, chunk_size, mask1, mask2, sample_frames, counts):
+    """
+    Build a driver reading a stream, as if set_data_strm had been sent with the masks
+    :param stream: The bytes received by the driver
+    :param chunk_size: The largest number of bytes returned by a read of the transport
+    :param mask1: The first streaming mask
+    :param mask2: The second streaming mask
+    :param sample_frames: The number of frames in each data packet
+    :param counts: A dictionary in which the callbacks count the packets of each kind they receive
+    :return: An instance of sphero_driver.Sphero
+    """
+
+    driver = sphero_driver.Sphero()
+    driver.bt = ReplayInterface(stream, chunk_size)
+    driver.is_connected = True
+    driver.create_mask_list(mask1, mask2, sample_frames)
+    driver.stream_mask1, driver.stream_mask2 = mask1, mask2
+
+    # Count the packets reaching the callbacks
+    def count(kind, data):
+        counts[kind] += 1
+    for kind, id_code in (("data", 'DATA_STRM'), ("collision", 'COLLISION'), ("power", 'PWR_NOTIFY')):
+        driver.add_async_callback(sphero_driver.IDCODE[id_code], functools.partial(count, kind))
+    return driver
+
+
+def run_stream(stream, expected, chunk_size, mask1, mask2, sample_frames):
+    """
+    Have the driver receive a whole stream and parse it
+    :param stream: The bytes received by the driver
+    :param expected: The dictionary counting the packets of each kind, as returned by make_stream
+    :param chunk_size: The largest number of bytes returned by a read of the transport
+    :param mask1: The first streaming mask
+    :param mask2: The second streaming mask
+    :param sample_frames: The number of frames in each data packet
+    :return: A tuple: (duration in seconds, None or a description of the failure)
+    """
+
+    counts = dict(data=0, collision=0, power=0)
+    driver = make_driver(stream, chunk_size, mask1, mask2, sample_frames, counts)
+    start = time.perf_counter()
+    try:
+        driver.recv(chunk_size)
+    except EndOfStream:
+        pass
+    except Exception as error:
+        return time.perf_counter() - start, "{}: {}".format(type(error).__name__, error)
+    duration = time.perf_counter() - start
+
+    # Every asynchronous packet should have reached its callback
+    lost = sum(expected[kind] - counts[kind] for kind in counts)
+    return duration, "{} packets lost".format(lost) if lost else None
+
+
+def bench_stream(masks, frames, sync_ratios, chunk_sizes, nb_packet):
+    """
+    Print the throughput of the driver receiving generated streams, for every combination of the parameters
+    :param masks: A list of keys in MASKS
+    :param frames: A list of numbers of frames per data packet
+    :param sync_ratios: A list of fractions of acknowledgements in the streams
+    :param chunk_sizes: A list of largest numbers of bytes returned by a read of the transport
+    :param nb_packet: The number of packets in each stream
+    :return: True if every stream was parsed without losing a packet, False otherwise
+    """
+
+    passed = True
+    print("{:<10}{:>7}{:>6}{:>7}{:>12}{:>10}{:>12}{:>10}  {}".format(
+        "mask", "frames", "sync", "chunk", "packets/s", "kB/s", "us/packet", "x 400Hz", "status"))
+    for name in masks:
+        mask1, mask2 = MASKS[name]
+        for sample_frames in frames:
+            for sync_ratio in sync_ratios:
+                stream, expected = make_stream(mask1, mask2, sample_frames, nb_packet, sync_ratio)
+                for chunk_size in chunk_sizes:
+                    duration, failure = run_stream(stream, expected, chunk_size, mask1, mask2, sample_frames)
+                    if failure is not None:
+                        passed = False
+                        print("{:<10}{:>7}{:>6.2f}{:>7}{:>12}{:>10}{:>12}{:>10}  {}".format(
+                            name, sample_frames, sync_ratio, chunk_size, "-", "-", "-", "-", failure))
+                        continue
+                    # The sensor frames decoded per second, relative to the highest rate the robot streams at
+                    headroom = expected['data'] * sample_frames / duration / SAMPLE_RATE
+                    print("{:<10}{:>7}{:>6.2f}{:>7}{:>12.0f}{:>10.0f}{:>12.2f}{:>10.1f}  {}".format(
+                        name, sample_frames, sync_ratio, chunk_size, nb_packet / duration,
+                        len(stream) / duration / 1000, duration / nb_packet * 1e6, headroom, "ok"))
+    return passed
+
+
+def time_call(function, number):
+    """
+    Measure the average duration of a call
+    :param function: The function to call, without any argument
+    :param number: The number of calls per measurement, the best of three measurements is kept
+    :return: The duration of a call in seconds
+    """
+
+    return min(timeit.repeat(function, number=number, repeat=3)) / number
+
+
+def bench_parse(masks, frames, number=20000):
+    """
+    Print the duration of the parsers of the driver on a single packet
+    :param masks: A list of keys in MASKS
+    :param frames: A list of numbers of frames per data packet
+    :param number: The number of calls per measurement
+    :return: True if every parser accepted its packet, False otherwise
+    """
+
+    passed = True
+    print("{:<24}{:>7}{:>8}{:>14}  {}".format("parser", "frames", "bytes", "parse (us)", "status"))
+    driver = sphero_driver.Sphero()
+
+    # One packet of each kind
+    packets = [("parse_pwr_notify", None, async_packet(sphero_driver.IDCODE['PWR_NOTIFY'], bytearray([2]))),
+               ("parse_collision_detect", None, async_packet(sphero_driver.IDCODE['COLLISION'],
+                                                             bytearray(16)))]
+    for name in masks:
+        mask1, mask2 = MASKS[name]
+        for sample_frames in frames:
+            nb_value = nb_field(mask1, mask2) * sample_frames
+            packets.append(("parse_data_strm/" + name, (mask1, mask2, sample_frames),
+                            async_packet(sphero_driver.IDCODE['DATA_STRM'], bytearray(2 * nb_value))))
+
+    for label, stream_config, packet in packets:
+        parser = getattr(driver, label.split("/")[0])
+        if stream_config is not None:
+            driver.create_mask_list(*stream_config)
+        data_length = (packet[3] << 8) + packet[4]
+        try:
+            parser(packet, data_length)
+        except Exception as error:
+            passed = False
+            status, duration = "{}: {}".format(type(error).__name__, error), "-"
+        else:
+            status, duration = "ok", "{:.2f}".format(time_call(lambda: parser(packet, data_length), number) * 1e6)
+        print("{:<24}{:>7}{:>8}{:>14}  {}".format(label, stream_config[2] if stream_config else 1, len(packet),
+                                                  duration, status))
+    return passed
+
+
+class EncodingProtocol(sphero_driver.SpheroProtocol):
+    """The encoding of the driver without a link: send returns the packet"""
+
+    def send(self, packet, response):
+        return packet
+
+
+class ListProtocol(EncodingProtocol):
+    """The commands as the driver encoded them before its preassembled packets, by list concatenation"""
+
+    def clamp(self, n, minn, maxn):
+        return max(min(maxn, n), minn)
+
+    def pack_cmd(self, req, cmd):
+        self.inc_seq()
+        return req + [self.seq] + [len(cmd) + 1] + cmd
+
+    def encode(self, data, response):
+        checksum = ~sum(data) % 256
+        if response:
+            output = sphero_driver.REQ['WITH_RESPONSE'] + data + [checksum]
+        else:
+            output = sphero_driver.REQ['WITHOUT_RESPONSE'] + data + [checksum]
+        return bytes(bytearray(output))
+
+    def roll(self, speed, heading, state, response):
+        return self.send(self.encode(self.pack_cmd(sphero_driver.REQ['CMD_ROLL'], [
+            self.clamp(speed, 0, 255), (heading >> 8), (heading & 0xff), state]), response), response)
+
+    def set_data_strm(self, sample_div, sample_frames, sample_mask1, pcnt, sample_mask2, response):
+        data = self.pack_cmd(sphero_driver.REQ['CMD_SET_DATA_STRM'], [
+            (sample_div >> 8), (sample_div & 0xff), (sample_frames >> 8), (sample_frames & 0xff),
+            ((sample_mask1 >> 24) & 0xff), ((sample_mask1 >> 16) & 0xff), ((sample_mask1 >> 8) & 0xff),
+            (sample_mask1 & 0xff), pcnt, ((sample_mask2 >> 24) & 0xff), ((sample_mask2 >> 16) & 0xff),
+            ((sample_mask2 >> 8) & 0xff), (sample_mask2 & 0xff)])
+        self.create_mask_list(sample_mask1, sample_mask2, sample_frames)
+        self.stream_mask1 = sample_mask1
+        self.stream_mask2 = sample_mask2
+        return self.send(self.encode(data, response), response)
+
+
+def bench_encode(number=20000):
+    """
+    Print the number of commands encoded per second by the preassembled packets of the driver, and by list
+    concatenation as before them. Every sequence number is checked to give the same packet both ways.
+    :param number: The number of calls per measurement
+    :return: True if the packets were identical, False otherwise
+    """
+
+    passed = True
+    print("{:<16}{:>7}{:>14}{:>18}{:>10}  {}".format("command", "bytes", "list (cmd/s)", "template (cmd/s)",
+                                                     "speedup", "status"))
+    template, reference = EncodingProtocol(), ListProtocol()
+    mask2 = MASKS['position'][1]
+    for name, args in (("roll", (128, 270, 0x01)), ("set_data_strm", (40, 1, 0, 0, mask2))):
+        command = getattr(template, name)
+        reference_command = getattr(reference, name)
+
+        # Both encodings should agree on every sequence number, with and without response
+        status = "ok"
+        for seq in range(0x100):
+            for response in (False, True):
+                template.seq = reference.seq = seq
+                if command(*args + (response,)) != reference_command(*args + (response,)):
+                    status = "packet {} differs".format((seq + 1) & 0xff)
+        passed = passed and status == "ok"
+
+        duration = time_call(functools.partial(command, *args + (False,)), number)
+        reference_duration = time_call(functools.partial(reference_command, *args + (False,)), number)
+        print("{:<16}{:>7}{:>14.0f}{:>18.0f}{:>9.1f}x  {}".format(
+            name, len(command(*args + (False,))), 1 / reference_duration, 1 / duration,
+            reference_duration / duration, status))
+    return passed
+
+
+def percentile(values, fraction):
+    """Return the value below which a fraction of the values lie"""
+
+    values = sorted(values)
+    return values[int(round(fraction * (len(values) - 1)))]
+
+
+def bench_command(periods, nb_command=200, interval=0.005):
+    """
+    Print the latency of roll commands issued while the driver is receiving a stream: the time taken by the call to
+    return, and the time taken by the bytes to reach the link
+    :param periods: A list of times between two packets sent by the robot, in seconds
+    :param nb_command: The number of commands issued for each period
+    :param interval: The longest time between two commands, the actual one is drawn uniformly up to it
+    :return: Nothing
+    """
+
+    print("{:>8}{:>8}{:>8}{:>14}{:>14}{:>14}{:>14}{:>14}".format(
+        "period", "rolls", "sent", "issue p50", "issue p99", "issue max", "sent p50", "sent p99"))
+    rng = random.Random(0)
+    mask1, mask2 = MASKS['position']
+    packet = async_packet(sphero_driver.IDCODE['DATA_STRM'], bytearray(2 * nb_field(mask1, mask2)))
+    for period in periods:
+        # Connect a driver to a robot streaming its position, and start receiving
+        driver = sphero_driver.Sphero()
+        driver.transport_class = functools.partial(StreamingInterface, period=period, packet=packet)
+        driver.connect()
+        driver.create_mask_list(mask1, mask2)
+        driver.add_async_callback(sphero_driver.IDCODE['DATA_STRM'], lambda data: None)
+        driver.start()
+
+        # Roll at random times, as the control loop does
+        starts, issue = [], []
+        for index in range(nb_command):
+            time.sleep(rng.uniform(0, interval))
+            start = time.perf_counter()
+            driver.roll(1 + index % 255, index, 0x01, False)
+            issue.append(time.perf_counter() - start)
+            starts.append(start)
+        link = driver.bt
+        driver.disconnect()
+        driver.join()
+
+        # The time from the call to the bytes reaching the link, a roll superseded by a newer one is never sent
+        sent = [end - starts[(packet[7] << 8) | packet[8]] for end, packet in link.sent]
+        print("{:>8}{:>8}{:>8}{:>14}{:>14}{:>14}{:>14}{:>14}".format(
+            "{:g}ms".format(period * 1000), nb_command, len(sent),
+            *("{:.3f}ms".format(value * 1000) for value in (percentile(issue, 0.5),
+                                                            percentile(issue, 0.99),
+                                                            max(issue),
+                                                            percentile(sent, 0.5),
+                                                            percentile(sent, 0.99)))))
+
+
+def bench_flood(budgets, duration=1.0, period=0.01):
+    """
+    Print how the driver copes with a control loop writing faster than the link: rolling and pinging as fast as it can,
+    then stopping the robot. Rolls superseded by a newer one before being sent are dropped, pings wait for their turn
+    and block the loop once the queue is full, and the stop roll goes before the waiting pings.
+    :param budgets: A list of link budgets in bytes per second, 0 meaning unpaced writes
+    :param duration: The time spent flooding the link, in seconds
+    :param period: The time between two packets sent by the robot, in seconds
+    :return: True if the stop roll was the last roll reaching the link every time, False otherwise
+    """
+
+    passed = True
+    print("{:>8}{:>8}{:>8}{:>8}{:>9}{:>7}{:>8}{:>11}  {}".format(
+        "budget", "rolls", "pings", "sent", "dropped", "depth", "kB/s", "stop (ms)", "status"))
+    mask1, mask2 = MASKS['position']
+    packet = async_packet(sphero_driver.IDCODE['DATA_STRM'], bytearray(2 * nb_field(mask1, mask2)))
+    roll_kind = bytes(bytearray(sphero_driver.REQ['CMD_ROLL']))
+    for budget in budgets:
+        # Connect a driver to a robot streaming its position, and start receiving
+        driver = sphero_driver.Sphero(link_budget=budget or None)
+        driver.transport_class = functools.partial(StreamingInterface, period=period, packet=packet)
+        driver.connect()
+        driver.create_mask_list(mask1, mask2)
+        driver.add_async_callback(sphero_driver.IDCODE['DATA_STRM'], lambda data: None)
+        driver.start()
+
+        # Flood the link, then stop the robot
+        nb_roll = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            driver.roll(128, nb_roll % 360, 0x01, False)
+            driver.ping(False)
+            nb_roll += 1
+        stop = time.perf_counter()
+        driver.roll(0, 0, 0x00, False)
+        link = driver.bt
+        driver.disconnect()
+        driver.join()
+        stats = driver.send_stats()
+
+        # The stop roll should reach the link last among the rolls, and before the pings still waiting
+        rolls = [(end, data) for end, data in link.sent if data[2:4] == roll_kind]
+        stopped = rolls and rolls[-1][1][6] == 0 and rolls[-1][1][9] == 0
+        rate = sum(len(data) for _, data in link.sent) / (link.sent[-1][0] - link.sent[0][0])
+        status = "ok" if stopped else "the stop roll was not the last roll sent"
+        passed = passed and stopped
+        print("{:>8}{:>8}{:>8}{:>8}{:>9}{:>7}{:>8.1f}{:>11}  {}".format(
+            budget or "-", nb_roll, nb_roll, stats['sent'], stats['dropped'], stats['max_depth'], rate / 1000,
+            "{:.2f}".format((rolls[-1][0] - stop) * 1000) if stopped else "-", status))
+    return passed
+
+
+def bench_response(counts, timeout=5.0):
+    """
+    Print the duration of commands waiting for their acknowledgement from a simulated robot, sent one after the other
+    or pipelined: all sent before waiting for any response. The writes are not paced, the simulated link has no
+    bandwidth limit.
+    :param counts: A list of numbers of commands
+    :param timeout: The longest time to wait for a response, in seconds
+    :return: True if every command was acknowledged, False otherwise
+    """
+
+    passed = True
+    print("{:>10}{:>16}{:>16}{:>12}".format("commands", "one by one (ms)", "pipelined (ms)", "speedup"))
+    for nb_command in counts:
+        driver = sphero_driver.Sphero(link_budget=None)
+        driver.transport_class = sphero_sim.SimInterface
+        with contextlib.redirect_stdout(io.StringIO()):
+            driver.connect()
+        driver.start()
+        try:
+            # Wait for each response before sending the next command
+            start = time.perf_counter()
+            for _ in range(nb_command):
+                driver.get_power_state(True).result(timeout)
+            sequential = time.perf_counter() - start
+
+            # Send all the commands, then wait for all the responses
+            start = time.perf_counter()
+            futures = [driver.get_power_state(True) for _ in range(nb_command)]
+            for future in futures:
+                future.result(timeout)
+            pipelined = time.perf_counter() - start
+        except IOError as error:
+            passed = False
+            print("{:>10}  {}: {}".format(nb_command, type(error).__name__, error))
+            continue
+        finally:
+            driver.disconnect()
+            driver.join()
+        print("{:>10}{:>16.2f}{:>16.2f}{:>11.1f}x".format(nb_command, sequential * 1000, pipelined * 1000,
+                                                        sequential / pipelined))
+    return passed
+
+
+if __name__ == "__main__":
+    # Parse the command line
+    parser = argparse.ArgumentParser(description="Benchmark the reception and parsing of packets by the Sphero driver")
+    parser.add_argument("benchmarks", nargs="*", metavar="{" + ",".join(BENCHMARKS) + "}",
+                        help="The benchmarks to run, all of them by default")
+    parser.add_argument("--masks", nargs="+", choices=sorted(MASKS), default=["position", "all"],
+                        help="The streaming masks: position is what Sphero.initialize streams, imu the filtered "
+                             "inertial measurements and all every field. Defaults to position all")
+    parser.add_argument("--frames", type=int, nargs="+", default=[1, 4],
+                        help="The numbers of frames per data packet. Defaults to 1 4")
+    parser.add_argument("--sync", type=float, nargs="+", default=[0.0, 0.25],
+                        help="The fractions of acknowledgements among the packets. Defaults to 0 0.25")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[16, 1024, 65536],
+                        help="The largest numbers of bytes returned by a read of the transport. The driver asks for "
+                             "1024, larger chunks only show up when it falls behind. Defaults to 16 1024 65536")
+    parser.add_argument("--packets", type=int, default=20000,
+                        help="The number of packets in each stream. Defaults to 20000")
+    parser.add_argument("--periods", type=float, nargs="+", default=[0.0025, 0.025, 0.1],
+                        help="The times between two packets sent by the robot while commands are issued, in seconds. "
+                             "Defaults to 0.0025 0.025 0.1, the 400Hz, 40Hz and 10Hz streams")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[0, sphero_driver.LINK_BUDGET, 2000],
+                        help="The link budgets in bytes per second while flooding the link, 0 meaning unpaced writes. "
+                             "Defaults to 0 {} 2000".format(sphero_driver.LINK_BUDGET))
+    args = parser.parse_args()
+    benchmarks = args.benchmarks or BENCHMARKS
+    for name in benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark: " + name)
+
+    # Run the benchmarks
+    passed = True
+    if "stream" in benchmarks:
+        passed = bench_stream(args.masks, args.frames, args.sync, args.chunks, args.packets) and passed
+        print("")
+    if "parse" in benchmarks:
+        passed = bench_parse(args.masks, args.frames) and passed
+        print("")
+    if "encode" in benchmarks:
+        passed = bench_encode() and passed
+        print("")
+    if "command" in benchmarks:
+        bench_command(args.periods)
+        print("")
+    if "flood" in benchmarks:
+        passed = bench_flood(args.budgets) and passed
+        print("")
+    if "response" in benchmarks:
+        passed = bench_response([10, 100, 1000]) and passed
+    if not passed:
+        sys.exit(1)
@@ -52,5 +52,9 @@ except KeyboardInterrupt:
     # Shut sphero down
     sphero.unload()
 
+# Report the commands superseded by newer ones before reaching the robot
+stats = sphero.send_stats()
+print("{sent} commands sent, {dropped} superseded before being sent, at most {max_depth} waiting".format(**stats))
+
 # Exit the program with a little message
 print("Goodbye !!! Hope to see you again soon!!!")
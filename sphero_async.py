@@ -0,0 +1,436 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = 'davinellulinvega'
+
+# Import the required packages
+import argparse
+import asyncio
+import functools
+import random
+import socket
+import time
+import sphero_driver
+import sphero_sim
+
+# Marks the end of an event stream
+_END = object()
+
+
+# Define the EventStream class
+class EventStream(object):
+    """
+    An asynchronous iterator over the parsed asynchronous packets of one kind, in their order of arrival. When the
+    consumer falls behind, the oldest packets are dropped: the state of the robot they describe is outdated anyway.
+    The iteration ends once the client is closed.
+    """
+
+    def __init__(self, client, id_code, maxsize=64):
+        """
+        Define the attributes
+        :param client: The AsyncSphero receiving the packets
+        :param id_code: The ID code of the packets, one of sphero_driver.IDCODE
+        :param maxsize: The number of packets kept for the consumer
+        """
+
+        self.client = client
+        self.id_code = id_code
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize)
+
+    def put(self, item):
+        """Add a parsed packet, dropping the oldest one if the consumer is behind"""
+
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(item)
+
+    def end(self):
+        """End the iteration once the packets already received have been consumed"""
+
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(_END)
+
+    def close(self):
+        """Stop receiving the packets"""
+
+        self.client.unsubscribe(self)
+
+    def __len__(self):
+        """Return the number of packets waiting for the consumer"""
+
+        return self._queue.qsize()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """Wait for the next packet"""
+
+        item = await self._queue.get()
+        if item is _END:
+            # Stay ended for the next calls
+            self._queue.put_nowait(_END)
+            raise StopAsyncIteration
+        return item
+
+
+# Define the AsyncSphero class
+class AsyncSphero(sphero_driver.SpheroProtocol):
+    """
+    A Sphero client running in an asyncio event loop, over a pair of asyncio streams. The command methods of
+    sphero_driver.Sphero write their packet at once and return an asyncio.Future, resolved by the acknowledgement of
+    Sphero when a response is requested and already resolved otherwise, so that commands can be sent without being
+    awaited. Several commands can wait for their acknowledgement at once:
+
+        await asyncio.gather(sphero.set_back_led(255, True), sphero.set_power_notify(0x01, True))
+
+    Await drain to wait for the link to accept the written packets.
+
+    The asynchronous packets are read through streams, see data_stream, collisions and power_notifications. A corrupted
+    packet stops the reading: the error is kept in the error attribute and fails the commands still waiting.
+    """
+
+    def __init__(self, reader, writer, timeout=1.0):
+        """
+        Define the attributes
+        :param reader: The asyncio.StreamReader receiving the bytes sent by Sphero
+        :param writer: The asyncio.StreamWriter sending the bytes to Sphero
+        :param timeout: The longest time to wait for an acknowledgement, in seconds
+        """
+
+        sphero_driver.SpheroProtocol.__init__(self)
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.closed = False
+        # The commands waiting for their acknowledgement, by sequence number
+        self._pending = dict()
+        # The streams of each kind of asynchronous packet, by ID code
+        self._streams = dict()
+        self._read_task = None
+        # The error that stopped the reading task, if any
+        self.error = None
+        # The tasks serving the other end of the link, if any
+        self.tasks = []
+
+    def start(self):
+        """Start reading the packets sent by Sphero, in a task of the running event loop"""
+
+        self._read_task = asyncio.ensure_future(self.read_loop())
+        return self
+
+    async def read_loop(self, num_bytes=4096):
+        """Read and parse the packets until the link is closed"""
+
+        try:
+            while True:
+                data = await self.reader.read(num_bytes)
+                if not data:
+                    break
+                self.feed(data)
+        except ConnectionError:
+            pass
+        except Exception as error:
+            # A corrupted packet leaves the receive buffer out of step with the packets, stop reading and report it
+            self.error = error
+        finally:
+            self.end()
+
+    def send(self, packet, response):
+        """
+        Write a packet encoded by a sphero_driver.PacketTemplate on the link
+        :param packet: The packet, as bytes
+        :param response: Request response back from Sphero
+        :return: An asyncio.Future, resolving to a sphero_driver.Response when a response is requested and to None
+        otherwise
+        """
+
+        if self.error is not None:
+            raise IOError("The link to Sphero failed: %s" % self.error)
+        if self.closed:
+            raise IOError("Sphero is not connected")
+        loop = asyncio.get_running_loop()
+        self.writer.write(packet)
+        if not response:
+            future = loop.create_future()
+            future.set_result(None)
+            return future
+        future = self.expect_response(packet[4])
+        timer = loop.call_later(self.timeout, self.expire_response, packet[4], future)
+        future.add_done_callback(lambda _: timer.cancel())
+        return future
+
+    async def drain(self):
+        """Wait for the link to accept the packets written so far"""
+
+        await self.writer.drain()
+
+    def expire_response(self, seq, future):
+        """Fail a command whose acknowledgement did not arrive within the timeout"""
+
+        if self._pending.get(seq) is future:
+            del self._pending[seq]
+        if not future.done():
+            future.set_exception(sphero_driver.ResponseTimeout(
+                "No response to command %d after %s seconds" % (seq, self.timeout)))
+
+    def expect_response(self, seq):
+        """
+        Register the command with the given sequence number as waiting for its acknowledgement. A command still waiting
+        when its sequence number comes back, after 0xff, fails with sphero_driver.ResponseLost.
+        :param seq: The sequence number of the command
+        :return: An asyncio.Future
+        """
+
+        future = asyncio.get_running_loop().create_future()
+        previous = self._pending.get(seq)
+        if previous is not None and not previous.done():
+            previous.set_exception(sphero_driver.ResponseLost(
+                "Sequence number %d reused before the response arrived" % seq))
+        self._pending[seq] = future
+        return future
+
+    def resolve_response(self, mrsp, seq, data):
+        """Hand an acknowledgement over to the command waiting for it, if any"""
+
+        future = self._pending.pop(seq, None)
+        if future is None or future.done():
+            return
+        if mrsp == sphero_driver.MRSP['ORBOTIX_RSP_CODE_OK']:
+            future.set_result(sphero_driver.Response(mrsp, seq, data))
+        else:
+            future.set_exception(sphero_driver.ResponseError(mrsp, seq))
+
+    def subscribe(self, id_code, maxsize=64):
+        """
+        Return a new stream of the asynchronous packets with the given ID code
+        :param id_code: One of sphero_driver.IDCODE
+        :param maxsize: The number of packets kept for the consumer
+        :return: An EventStream
+        """
+
+        stream = EventStream(self, id_code, maxsize)
+        if self.closed:
+            stream.end()
+            return stream
+        if id_code not in self._streams:
+            self._streams[id_code] = []
+            self.add_async_callback(id_code, functools.partial(self.publish, id_code))
+        self._streams[id_code].append(stream)
+        return stream
+
+    def unsubscribe(self, stream):
+        """Stop feeding a stream returned by subscribe"""
+
+        streams = self._streams.get(stream.id_code, [])
+        if stream in streams:
+            streams.remove(stream)
+            stream.end()
+        if stream.id_code in self._streams and not streams:
+            del self._streams[stream.id_code]
+            self.remove_async_callback(stream.id_code)
+
+    def publish(self, id_code, item):
+        """Hand a parsed packet over to the streams of its kind"""
+
+        for stream in self._streams.get(id_code, []):
+            stream.put(item)
+
+    def data_stream(self, maxsize=64):
+        """Return a stream of the sensor data, records or arrays of records as given by parse_data_strm"""
+
+        return self.subscribe(sphero_driver.IDCODE['DATA_STRM'], maxsize)
+
+    def collisions(self, maxsize=64):
+        """Return a stream of the collisions, dictionaries as given by parse_collision_detect"""
+
+        return self.subscribe(sphero_driver.IDCODE['COLLISION'], maxsize)
+
+    def power_notifications(self, maxsize=64):
+        """Return a stream of the power states, as given by parse_pwr_notify"""
+
+        return self.subscribe(sphero_driver.IDCODE['PWR_NOTIFY'], maxsize)
+
+    def end(self):
+        """Fail the commands waiting for their acknowledgement and end the streams, once the link is closed"""
+
+        self.closed = True
+        pending, self._pending = self._pending, dict()
+        for future in pending.values():
+            if not future.done():
+                if self.error is not None:
+                    future.set_exception(sphero_driver.ResponseLost(
+                        "The link to Sphero failed before the response to a command arrived: %s" % self.error))
+                else:
+                    future.set_exception(sphero_driver.ResponseLost(
+                        "Disconnected before the response to a command arrived"))
+        for streams in self._streams.values():
+            for stream in streams:
+                stream.end()
+
+    async def close(self):
+        """Close the link and wait for the reading task to end"""
+
+        self.closed = True
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        if self._read_task is not None:
+            # The task may have ended already, with the error kept in self.error
+            if not self._read_task.done():
+                self._read_task.cancel()
+            await asyncio.gather(self._read_task, return_exceptions=True)
+        self.end()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+async def connect(reader, writer, timeout=1.0):
+    """
+    Start a client over an open link
+    :param reader: The asyncio.StreamReader receiving the bytes sent by Sphero
+    :param writer: The asyncio.StreamWriter sending the bytes to Sphero
+    :param timeout: The longest time to wait for an acknowledgement, in seconds
+    :return: A started AsyncSphero
+    """
+
+    return AsyncSphero(reader, writer, timeout).start()
+
+
+async def connect_bluetooth(address, port=1, timeout=1.0):
+    """
+    Connect to a Sphero over a bluetooth RFCOMM socket, which needs a Python built with bluetooth support
+    :param address: The bluetooth address of the robot
+    :param port: The RFCOMM channel
+    :param timeout: The longest time to wait for an acknowledgement, in seconds
+    :return: A started AsyncSphero
+    """
+
+    sock = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, (address, port))
+    reader, writer = await asyncio.open_connection(sock=sock)
+    return await connect(reader, writer, timeout)
+
+
+async def serve_device(device, reader, writer):
+    """
+    Play a sphero_sim.SimulatedSphero at the other end of a link, until the client closes it
+    :param device: A SimulatedSphero
+    :param reader: The asyncio.StreamReader receiving the bytes sent by the client
+    :param writer: The asyncio.StreamWriter sending the bytes to the client
+    :return: Nothing
+    """
+
+    try:
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                break
+            device.receive(bytearray(data))
+            if device.pending():
+                writer.write(device.transmit(device.pending()))
+                await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def connect_simulator(device=None, timeout=1.0):
+    """
+    Connect to a simulated Sphero through a socket pair, the robot being played by a task of the same event loop
+    :param device: A sphero_sim.SimulatedSphero. Defaults to None, meaning a new one
+    :param timeout: The longest time to wait for an acknowledgement, in seconds
+    :return: A started AsyncSphero, whose device attribute is the simulated robot
+    """
+
+    device = device if device is not None else sphero_sim.SimulatedSphero()
+    client_sock, device_sock = socket.socketpair()
+    reader, writer = await asyncio.open_connection(sock=client_sock)
+    device_reader, device_writer = await asyncio.open_connection(sock=device_sock)
+    client = await connect(reader, writer, timeout)
+    client.device = device
+    client.tasks.append(asyncio.ensure_future(serve_device(device, device_reader, device_writer)))
+    return client
+
+
+async def wander(sphero, nb_roll, rng, speed=120):
+    """
+    Roll a robot in random directions, turning around after each collision
+    :param sphero: A started AsyncSphero
+    :param nb_roll: The number of rolls
+    :param rng: A random.Random drawing the directions
+    :param speed: The speed of the rolls, in the range 0-255
+    :return: A tuple: (number of collisions, latest data record)
+    """
+
+    # Configure the robot, all the commands waiting for their acknowledgement at once
+    data = sphero.data_stream()
+    collisions = sphero.collisions()
+    await asyncio.gather(
+        sphero.config_collision_detect(0x01, 10, 20, 10, 20, 0x01, True),
+        sphero.set_data_strm(40, 1, 0, 0, sphero_driver.STRM_MASK2['ODOM_X'] | sphero_driver.STRM_MASK2['ODOM_Y'],
+                             True),
+        sphero.set_back_led(255, True))
+
+    # Roll, and wait for the position streamed after each roll
+    heading = rng.randrange(360)
+    nb_collision = 0
+    record = None
+    for _ in range(nb_roll):
+        await sphero.roll(speed, heading, 0x01, False)
+        record = await asyncio.wait_for(data.__anext__(), sphero.timeout)
+        while len(collisions):
+            await collisions.__anext__()
+            nb_collision += 1
+            heading = (heading + 180 + rng.randrange(-60, 61)) % 360
+        heading = (heading + rng.randrange(-15, 16)) % 360
+    await sphero.roll(0, heading, 0x00, True)
+    return nb_collision, record
+
+
+async def main(nb_robot, nb_roll, room, seed):
+    """Have robots wander in simulated rooms, all of them driven from a single event loop"""
+
+    rng = random.Random(seed)
+    robots = [await connect_simulator(sphero_sim.SimulatedSphero(room)) for _ in range(nb_robot)]
+    start = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(wander(sphero, nb_roll, random.Random(rng.random())) for sphero in robots))
+    finally:
+        for sphero in robots:
+            await sphero.close()
+    duration = time.perf_counter() - start
+
+    # Report what each robot did
+    for index, (nb_collision, record) in enumerate(results):
+        print("robot {}: {} collisions, ended at ({} cm, {} cm)".format(index, nb_collision, record['ODOM_X'],
+                                                                       record['ODOM_Y']))
+    print("{} rolls in {:.2f}s ({:.0f} rolls/s)".format(nb_robot * nb_roll, duration, nb_robot * nb_roll / duration))
+
+
+if __name__ == "__main__":
+    # Parse the command line
+    parser = argparse.ArgumentParser(description="Drive several simulated robots from a single asyncio event loop")
+    parser.add_argument("--robots", type=int, default=4, help="The number of robots. Defaults to 4")
+    parser.add_argument("--rolls", type=int, default=1000, help="The number of rolls of each robot. Defaults to 1000")
+    parser.add_argument("--room", type=sphero_sim.parse_room, default=None,
+                        help="The corners of the room around the starting position, in centimeters, as 'x,y x,y ...'. "
+                             "Defaults to a 300 by 200 rectangle")
+    parser.add_argument("--seed", type=int, default=None, help="The seed of the directions")
+    args = parser.parse_args()
+    asyncio.run(main(args.robots, args.rolls, args.room, args.seed))
@@ -31,13 +31,25 @@
 #***********************************************************
 #author: Melonee Wise
 
-import bluetooth
 import sys
 import struct
+import collections
 import time
 import operator
 import threading
 
+# PyBluez is only needed to talk to a real robot, a simulated transport can do without it
+try:
+  import bluetooth
+except ImportError:
+  bluetooth = None
+
+# NumPy is only needed to decode data streaming packets holding several frames
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
 #These are the message response code that can be return by Sphero.
 MRSP = dict(
   ORBOTIX_RSP_CODE_OK = 0x00,           #Command succeeded
@@ -59,17 +71,95 @@ MRSP = dict(
 
 #ID codes for asynchronous packets
 IDCODE = dict(
-  PWR_NOTIFY = chr(0x01),               #Power notifications
-  LEVEL1_DIAG = chr(0x02),              #Level 1 Diagnostic response
-  DATA_STRM = chr(0x03),                #Sensor data streaming
-  CONFIG_BLOCK = chr(0x04),             #Config block contents
-  SLEEP = chr(0x05),                    #Pre-sleep warning (10 sec)
-  MACRO_MARKERS =chr(0x06),             #Macro markers
-  COLLISION = chr(0x07))                #Collision detected
+  PWR_NOTIFY = 0x01,                    #Power notifications
+  LEVEL1_DIAG = 0x02,                   #Level 1 Diagnostic response
+  DATA_STRM = 0x03,                     #Sensor data streaming
+  CONFIG_BLOCK = 0x04,                  #Config block contents
+  SLEEP = 0x05,                         #Pre-sleep warning (10 sec)
+  MACRO_MARKERS = 0x06,                 #Macro markers
+  COLLISION = 0x07)                     #Collision detected
 
 RECV = dict(
-  ASYNC = [chr(0xff), chr(0xfe)],
-  SYNC = [chr(0xff), chr(0xff)])
+  ASYNC = bytearray([0xff, 0xfe]),
+  SYNC = bytearray([0xff, 0xff]))
+
+#Size of the receive buffer, room for the largest packet (a 5 bytes header
+#and up to 0xffff bytes) and for a full read after it
+RECV_BUFFER_SIZE = 0x20000
+
+#Number of packets waiting for the writer thread before send blocks
+SEND_QUEUE_SIZE = 64
+
+#Seconds disconnect waits for the writer thread to send the queued
+#packets, a write stuck on a dead link must not hang it
+WRITER_TIMEOUT = 1.0
+
+#The acknowledgement of a command: message response code, sequence
+#number and data payload
+Response = collections.namedtuple('Response', 'mrsp seq data')
+
+
+class ResponseError(IOError):
+  """Raised when Sphero acknowledges a command with an error code"""
+
+  def __init__(self, mrsp, seq):
+    names = dict((value, key) for key, value in MRSP.items())
+    IOError.__init__(self, "Command %d failed: %s" % (seq, names.get(mrsp, "unknown code 0x%02x" % mrsp)))
+    self.mrsp = mrsp
+    self.seq = seq
+
+
+class ResponseTimeout(IOError):
+  """Raised when the acknowledgement of a command does not arrive in time"""
+
+
+class ResponseLost(IOError):
+  """Raised when the acknowledgement of a command can no longer arrive"""
+
+
+class ResponseFuture(object):
+  """
+  The acknowledgement expected for a command sent with response=True,
+  set by the receiving thread when the response with the same sequence
+  number arrives. The sequence numbers wrap around after 0xff, so at
+  most 256 commands can wait for their response at once: a command
+  still waiting when its sequence number comes back fails with
+  ResponseLost.
+  """
+
+  def __init__(self, seq):
+    self.seq = seq
+    self._event = threading.Event()
+    self._response = None
+    self._error = None
+
+  def set_response(self, response):
+    self._response = response
+    self._event.set()
+
+  def set_exception(self, error):
+    self._error = error
+    self._event.set()
+
+  def done(self):
+    return self._event.is_set()
+
+  def result(self, timeout=None):
+    """
+    Wait for the acknowledgement and return it.
+
+    :param timeout: the longest time to wait in seconds, None to wait\
+    forever.
+    :return: a Response.
+    :raise: ResponseTimeout if it does not arrive in time, ResponseError\
+    if Sphero reports an error, ResponseLost if the link is closed or\
+    the sequence number is reused first.
+    """
+    if not self._event.wait(timeout):
+      raise ResponseTimeout("No response to command %d after %s seconds" % (self.seq, timeout))
+    if self._error is not None:
+      raise self._error
+    return self._response
 
 
 REQ = dict(
@@ -117,6 +207,94 @@ REQ = dict(
   CMD_GET_MACRO_STATUS = [0x02, 0x56],
   CMD_SET_MACRO_STATUS = [0x02, 0x57])
 
+#The layout of the data of the commands, as struct formats
+CMD_FORMAT = dict(
+  CMD_PING = '',
+  CMD_VERSION = '',
+  CMD_GET_BT_NAME = '',
+  CMD_SET_AUTO_RECONNECT = 'BB',
+  CMD_GET_AUTO_RECONNECT = '',
+  CMD_GET_PWR_STATE = '',
+  CMD_SET_PWR_NOTIFY = 'B',
+  CMD_SLEEP = 'HB',
+  CMD_RUN_L1_DIAGS = '',
+  CMD_RUN_L2_DIAGS = '',
+  CMD_CLEAR_COUNTERS = '',
+  CMD_ASSIGN_COUNTER = 'I',
+  CMD_POLL_TIMES = 'I',
+  CMD_SET_HEADING = 'H',
+  CMD_SET_STABILIZ = 'B',
+  CMD_SET_ROTATION_RATE = 'B',
+  CMD_SET_APP_CONFIG_BLK = 'I',
+  CMD_GET_APP_CONFIG_BLK = '',
+  CMD_SET_DATA_STRM = 'HHIBI',
+  CMD_CFG_COL_DET = 'BBBBBB',
+  CMD_SET_RGB_LED = 'BBBB',
+  CMD_SET_BACK_LED = 'B',
+  CMD_GET_RGB_LED = '',
+  CMD_ROLL = 'BHB',
+  CMD_BOOST = 'BH',
+  CMD_SET_RAW_MOTORS = 'BBBB')
+
+
+class PacketTemplate(object):
+  """
+  Packets are sent from Client -> Sphero in the following byte format::
+
+    -------------------------------------------------------
+    | SOP1 | SOP2 | DID | CID | SEQ | DLEN | <data> | CHK |
+    -------------------------------------------------------
+
+  * SOP1 - start packet 1 - Always 0xff. 
+  * SOP2 - start packet 2 - Set to 0xff when an acknowledgement is\
+    expected, 0xfe otherwise.    
+  * DID - Device ID
+  * CID - Command ID
+  * SEQ - Sequence Number - This client field is echoed in the\
+    response for all synchronous commands (and ignored by Sphero\
+    when SOP2 = 0xfe)
+  * DLEN - Data
+  * Length - Number of bytes through the end of the packet.
+  * <data>
+  * CHK - Checksum - The modulo 256 sum of all the bytes from the\
+    DID through the end of the data payload, bit inverted (1's\
+    complement).
+
+  A template holds the packet of one command, preassembled: SOP1, DID,
+  CID and DLEN are written once along with their part of the checksum,
+  and encode patches SOP2, SEQ and the data in place. The buffer is
+  shared by every call, the caller serializes them.
+  """
+
+  def __init__(self, req, fmt=''):
+    """
+    :param req: the DID and CID of the command, from REQ.
+    :param fmt: the layout of the data, as a struct format.
+    """
+    self.data_struct = struct.Struct('>' + fmt)
+    dlen = self.data_struct.size + 1
+    self.buf = bytearray([0xff, 0xff] + list(req) + [0, dlen]) + bytearray(dlen)
+    #the data bytes, summed in place for the checksum
+    self.data_view = memoryview(self.buf)[6:-1]
+    self.header_sum = sum(req) + dlen
+
+  def encode(self, seq, response, fields):
+    """
+    :param seq: the sequence number.
+    :param response: request response back from Sphero.
+    :param fields: the values of the data as a tuple, laid out by the\
+    format.
+    :return: the packet, as bytes.
+    """
+    buf = self.buf
+    buf[1] = 0xff if response else 0xfe
+    buf[4] = seq
+    self.data_struct.pack_into(buf, 6, *fields)
+    #modulo 256 sum of data bit inverted, from the precomputed sum of
+    #DID, CID and DLEN
+    buf[-1] = ~(self.header_sum + seq + sum(self.data_view)) & 0xff
+    return bytes(buf)
+
 STRM_MASK1 = dict(
   GYRO_H_FILTERED    = 0x00000001,
   GYRO_M_FILTERED    = 0x00000002,
@@ -158,6 +336,202 @@ STRM_MASK2 = dict(
   VELOCITY_X         = 0x01000000,
   VELOCITY_Y         = 0x00800000)
 
+#Outbound budget of the link in bytes per second: the bluetooth module of
+#Sphero talks to its main processor at 115200 bauds, writing faster only
+#delays everything else on the link, sensor packets included
+LINK_BUDGET = 11520
+
+#Bytes sent at once after the link has been idle, in seconds of budget
+LINK_BURST = 0.05
+
+#The commands setting a state, superseded by a newer one of the same
+#kind: only the latest one waiting to be sent is sent
+COALESCED = frozenset(bytes(bytearray(REQ[name])) for name in (
+  'CMD_ROLL', 'CMD_SET_BACK_LED', 'CMD_SET_RGB_LED', 'CMD_CFG_COL_DET', 'CMD_SET_ROTATION_RATE'))
+ROLL_KIND = bytes(bytearray(REQ['CMD_ROLL']))
+
+
+class CommandScheduler(object):
+  """
+  The packets waiting for the writer thread. A packet of a coalesced
+  kind replaces the one of the same kind still waiting, urgent packets
+  are sent before the others, and the writes are paced to a budget in
+  bytes per second with a token bucket: the writer waits while the
+  bucket is in debt, so that superseded packets never reach the link.
+  put blocks while maxsize packets are waiting, except for urgent and
+  coalesced ones.
+  """
+
+  def __init__(self, budget=LINK_BUDGET, maxsize=SEND_QUEUE_SIZE):
+    """
+    :param budget: bytes per second, None for unpaced writes.
+    :param maxsize: number of packets waiting before put blocks.
+    """
+    self.budget = budget
+    self.maxsize = maxsize
+    self.closed = False
+    self._cond = threading.Condition()
+    #entries are [packet, kind, urgent], the packet of a superseded
+    #entry is set to None
+    self._urgent = collections.deque()
+    self._normal = collections.deque()
+    self._latest = dict()
+    self._depth = 0
+    self._burst = budget * LINK_BURST if budget else 0
+    self._tokens = self._burst
+    self._stamp = time.time()
+    #statistics
+    self.sent = 0
+    self.sent_bytes = 0
+    self.dropped = 0
+    self.max_depth = 0
+
+  def put(self, packet, kind=None, urgent=False):
+    """
+    Queue a packet.
+
+    :param packet: the bytes to write.
+    :param kind: the kind of the packet if a newer one supersedes it,\
+    None otherwise.
+    :param urgent: send the packet before the others.
+    :return: the packet superseded by this one, None if none.
+    """
+    with self._cond:
+      previous = self._latest.get(kind) if kind is not None else None
+      if previous is not None and previous[2] == urgent:
+        #take the place of the superseded packet
+        superseded, previous[0] = previous[0], packet
+        self.dropped += 1
+        return superseded
+      while not urgent and self._depth >= self.maxsize and not self.closed:
+        self._cond.wait()
+      superseded = None
+      previous = self._latest.get(kind) if kind is not None else None
+      if previous is not None:
+        superseded, previous[0] = previous[0], None
+        self._depth -= 1
+        self.dropped += 1
+      entry = [packet, kind, urgent]
+      (self._urgent if urgent else self._normal).append(entry)
+      if kind is not None:
+        self._latest[kind] = entry
+      self._depth += 1
+      self.max_depth = max(self.max_depth, self._depth)
+      self._cond.notify_all()
+      return superseded
+
+  def get(self):
+    """
+    Wait for the next packet to write, and for the budget to allow it.
+
+    :return: the packet, or None once closed and empty.
+    """
+    with self._cond:
+      while True:
+        entry = self._head()
+        if entry is None:
+          if self.closed:
+            return None
+          self._cond.wait()
+          continue
+        delay = self._delay()
+        if delay > 0:
+          #a newer packet may supersede this one meanwhile
+          self._cond.wait(delay)
+          continue
+        (self._urgent if entry[2] else self._normal).popleft()
+        if entry[1] is not None:
+          del self._latest[entry[1]]
+        self._depth -= 1
+        packet = entry[0]
+        self._tokens -= len(packet)
+        self.sent += 1
+        self.sent_bytes += len(packet)
+        self._cond.notify_all()
+        return packet
+
+  def _head(self):
+    """Return the next entry to send without removing it, None if none"""
+    for entries in (self._urgent, self._normal):
+      while entries and entries[0][0] is None:
+        entries.popleft()
+      if entries:
+        return entries[0]
+    return None
+
+  def _delay(self):
+    """Refill the token bucket and return the time to wait before a write"""
+    if not self.budget:
+      return 0
+    now = time.time()
+    self._tokens = min(self._burst, self._tokens + (now - self._stamp) * self.budget)
+    self._stamp = now
+    return -self._tokens / self.budget if self._tokens < 0 else 0
+
+  def close(self):
+    """Have get return None once the waiting packets are sent"""
+    with self._cond:
+      self.closed = True
+      self._cond.notify_all()
+
+  def stats(self):
+    """
+    :return: a dictionary with the number of packets waiting (depth),\
+    the most ever waiting (max_depth), the packets and bytes written\
+    (sent, sent_bytes) and the packets superseded before being written\
+    (dropped).
+    """
+    with self._cond:
+      return dict(depth=self._depth, max_depth=self.max_depth, sent=self.sent, sent_bytes=self.sent_bytes,
+                  dropped=self.dropped)
+
+
+#The record types built by data_strm_record, by fields
+_strm_record_types = dict()
+
+
+def data_strm_record(fields):
+  """
+  Return the record type holding a frame of streamed data: a tuple of
+  the values in the order of the fields, whose values can also be read
+  by field name, record['ODOM_X'] or record.ODOM_X. Use _asdict() to
+  get a dictionary. The types are built once for each list of fields.
+
+  :param fields: the names of the streamed fields, in order.
+  """
+  fields = tuple(fields)
+  record_type = _strm_record_types.get(fields)
+  if record_type is not None:
+    return record_type
+  index = dict((name, position) for position, name in enumerate(fields))
+
+  class DataStrmRecord(collections.namedtuple('DataStrmRecord', fields)):
+    __slots__ = ()
+
+    def __getitem__(self, key):
+      #names are looked up, indexes and slices go to the tuple
+      if isinstance(key, str):
+        return tuple.__getitem__(self, index[key])
+      return tuple.__getitem__(self, key)
+
+    def __reduce__(self):
+      #the type is built at run time, pickle the fields along with the values
+      return (make_strm_record, (fields, tuple(self)))
+
+  DataStrmRecord.__qualname__ = DataStrmRecord.__name__
+  _strm_record_types[fields] = DataStrmRecord
+  return DataStrmRecord
+
+
+def make_strm_record(fields, values):
+  """
+  Build a record of streamed data, as unpickled.
+
+  :param fields: the names of the streamed fields, in order.
+  :param values: the values of the fields.
+  """
+  return data_strm_record(fields)._make(values)
+
 
 class BTInterface(object):
 
@@ -170,6 +544,8 @@ class BTInterface(object):
       self.sock = None
 
   def connect(self):
+    if bluetooth is None:
+      raise RuntimeError("PyBluez is required to connect to a Sphero over bluetooth")
     if self.target_address is None:
         sys.stdout.write("Searching for devices....")
         sys.stdout.flush()
@@ -203,7 +579,7 @@ class BTInterface(object):
       self.sock=bluetooth.BluetoothSocket(bluetooth.RFCOMM)
       self.sock.connect((self.target_address,self.port))
     except bluetooth.btcommon.BluetoothError as error:
-      sys.stdout.write(error.message)
+      sys.stdout.write(str(error))
       sys.stdout.flush()
       time.sleep(5.0)
       sys.exit(1)
@@ -217,57 +593,93 @@ class BTInterface(object):
   def recv(self, num_bytes):
     return self.sock.recv(num_bytes)
 
+  def recv_into(self, buffer, num_bytes):
+    if hasattr(self.sock, 'recv_into'):
+      return self.sock.recv_into(buffer, num_bytes)
+    data = self.sock.recv(num_bytes)
+    buffer[:len(data)] = data
+    return len(data)
+
   def close(self):
     self.sock.close()
 
-class Sphero(threading.Thread):
+class SpheroProtocol(object):
+  """
+  The encoding of the commands and the decoding of the packets sent by
+  Sphero, whatever the link. A subclass writes the packets in send and
+  receives the acknowledgements in resolve_response, the bytes read
+  from the link are handed over to feed, or read in the buffer given by
+  buffer_space and parsed by parse_buffer.
+  """
 
-  def __init__(self, target_name = 'Sphero', target_addr = None):
-    threading.Thread.__init__(self)
-    self.target_name = target_name
-    self.target_address = target_addr
-    self.bt = None
-    self.shutdown = False
-    self.is_connected = False
+  def __init__(self):
     self.mask_list = None
+    self.sample_frames = 1
+    self.strm_struct = None
+    self.strm_record = None
+    self.strm_dtype = None
     self.stream_mask1 = None
     self.stream_mask2 = None
     self.seq = 0
-    self.raw_data_buf = []
-    self._communication_lock = threading.Lock()
+    # The preassembled packets of the commands sent so far, by name
+    self._templates = dict()
+    self._encode_lock = threading.Lock()
+    # The bytes received and not parsed yet are raw_data_buf[_buf_start:_buf_end]
+    self.raw_data_buf = bytearray(RECV_BUFFER_SIZE)
+    self._buf_view = memoryview(self.raw_data_buf)
+    self._buf_start = 0
+    self._buf_end = 0
     self._async_callback_dict = dict()
     self._sync_callback_dict = dict()
     self._sync_callback_queue = []
-
-  def connect(self):
-    self.bt = BTInterface(self.target_name, self.target_address)
-    self.is_connected = self.bt.connect()
-    return True
+    # The data streaming packets that did not match the streamed fields
+    self.dropped_strm = 0
 
   def inc_seq(self):
     self.seq = self.seq + 1
     if self.seq > 0xff:
       self.seq = 0
 
-  def pack_cmd(self, req ,cmd):
-    self.inc_seq()
- #   print req + [self.seq] + [len(cmd)+1] + cmd
-    return req + [self.seq] + [len(cmd)+1] + cmd
+  def send_cmd(self, name, response, *fields):
+    """
+    Encode a command in its preassembled packet and send it.
+
+    :param name: the key of the command in REQ and CMD_FORMAT.
+    :param response: request response back from Sphero.
+    :param fields: the values of the data of the command.
+    """
+    #the templates are shared by the threads sending commands, and the
+    #sequence number must go with the packet it was taken for
+    with self._encode_lock:
+      template = self._templates.get(name)
+      if template is None:
+        template = self._templates[name] = PacketTemplate(REQ[name], CMD_FORMAT[name])
+      self.inc_seq()
+      packet = template.encode(self.seq, response, fields)
+    return self.send(packet, response)
 
   def data2hexstr(self, data):
-    return ' '.join([ ("%02x"%ord(d)) for d in data])
+    return ' '.join([ ("%02x"%d) for d in bytearray(data)])
 
-  def create_mask_list(self, mask1, mask2):
+  def create_mask_list(self, mask1, mask2, sample_frames=1):
+    if sample_frames > 1 and numpy is None:
+      raise RuntimeError("NumPy is required to decode data streaming packets holding several frames")
+    self.sample_frames = sample_frames
     #save the mask
-    sorted_STRM1 = sorted(STRM_MASK1.iteritems(), key=operator.itemgetter(1), reverse=True)
+    sorted_STRM1 = sorted(STRM_MASK1.items(), key=operator.itemgetter(1), reverse=True)
     #create a list containing the keys that are part of the mask
     self.mask_list1 = [key  for key, value in sorted_STRM1 if value & mask1]
 
-    sorted_STRM2 = sorted(STRM_MASK2.iteritems(), key=operator.itemgetter(1), reverse=True)
+    sorted_STRM2 = sorted(STRM_MASK2.items(), key=operator.itemgetter(1), reverse=True)
     #create a list containing the keys that are part of the mask
     self.mask_list2 = [key  for key, value in sorted_STRM2 if value & mask2]
     self.mask_list = self.mask_list1 + self.mask_list2
-
+    #compile the decoder of a frame: a signed 16-bit value per field
+    self.strm_struct = struct.Struct('>%dh' % len(self.mask_list))
+    self.strm_record = data_strm_record(self.mask_list)
+    #and of several frames: one row per frame, one column per field
+    if numpy is not None:
+      self.strm_dtype = numpy.dtype([(str(key), numpy.int16) for key in self.mask_list])
 
   def add_async_callback(self, callback_type, callback):
     self._async_callback_dict[callback_type] = callback
@@ -282,8 +694,10 @@ class Sphero(threading.Thread):
     del self._sync_callback_dict[callback_type]
 
   def clamp(self, n, minn, maxn):
-    return max(min(maxn, n), minn)
+    #comparisons are cheaper than calls to min and max
+    return minn if n < minn else maxn if n > maxn else n
     
+
   def ping(self, response):
     """
     The Ping command is used to verify both a solid data link with the
@@ -291,7 +705,7 @@ class Sphero(threading.Thread):
 
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_PING'],[]), response)
+    return self.send_cmd('CMD_PING', response)
 
   def get_version(self, response):
     """
@@ -300,7 +714,7 @@ class Sphero(threading.Thread):
 
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_VERSION'],[]), response)
+    return self.send_cmd('CMD_VERSION', response)
 
   def set_device_name(self, name, response):
     """
@@ -313,7 +727,13 @@ class Sphero(threading.Thread):
     :param name: 48 character name.
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_SET_BT_NAME'],[name]), response)
+    if not isinstance(name, bytes):
+      name = name.encode('utf-8')
+    template = PacketTemplate(REQ['CMD_SET_BT_NAME'], '%ds' % len(name))
+    with self._encode_lock:
+      self.inc_seq()
+      packet = template.encode(self.seq, response, (name,))
+    return self.send(packet, response)
 
   def get_bt_name(self, response):
     """
@@ -325,7 +745,7 @@ class Sphero(threading.Thread):
 
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_GET_BT_NAME'],[]), response)
+    return self.send_cmd('CMD_GET_BT_NAME', response)
 
   def set_auto_reconnect(self, enable, time, response):
     """
@@ -343,7 +763,7 @@ class Sphero(threading.Thread):
     enable auto reconnect mode
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_SET_AUTO_RECONNECT'],[enable,time]), response)
+    return self.send_cmd('CMD_SET_AUTO_RECONNECT', response, enable, time)
 
   def get_auto_reconnect(self, response):
     """
@@ -352,7 +772,7 @@ class Sphero(threading.Thread):
 
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_GET_AUTO_RECONNECT'],[]), reponse)
+    return self.send_cmd('CMD_GET_AUTO_RECONNECT', response)
 
   def get_power_state(self, response):
     """
@@ -361,7 +781,7 @@ class Sphero(threading.Thread):
 
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_GET_PWR_STATE'],[]), response)
+    return self.send_cmd('CMD_GET_PWR_STATE', response)
 
   def set_power_notify(self, enable, response):
     """
@@ -374,7 +794,7 @@ class Sphero(threading.Thread):
     :param enable: 00h to disable and 01h to enable power notifications.
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_SET_PWR_NOTIFY'],[enable]), response)
+    return self.send_cmd('CMD_SET_PWR_NOTIFY', response, enable)
 
   def go_to_sleep(self, time, macro, response):
     """
@@ -388,7 +808,7 @@ class Sphero(threading.Thread):
     :param macro: macro number to run when re-awakened.
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_SLEEP'],[(time>>8), (time & 0xff), macro]), response)
+    return self.send_cmd('CMD_SLEEP', response, time, macro)
 
   def run_l1_diags(self, response):
     """
@@ -400,7 +820,7 @@ class Sphero(threading.Thread):
 
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_RUN_L1_DIAGS'],[]), response)
+    return self.send_cmd('CMD_RUN_L1_DIAGS', response)
 
   def run_l2_diags(self, response):
     """
@@ -411,7 +831,7 @@ class Sphero(threading.Thread):
 
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_RUN_L2_DIAGS'],[]), response)
+    return self.send_cmd('CMD_RUN_L2_DIAGS', response)
 
   def clear_counters(self, response):
     """
@@ -420,7 +840,7 @@ class Sphero(threading.Thread):
 
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_CLEAR_COUNTERS'],[]), response)
+    return self.send_cmd('CMD_CLEAR_COUNTERS', response)
 
   def assign_counter_value(self, counter, response):
     """
@@ -432,7 +852,7 @@ class Sphero(threading.Thread):
     :param counter: value to set the counter to.
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_ASSIGN_COUNTER'],[((counter>>24) & 0xff), ((counter>>16) & 0xff), ((counter>>8) & 0xff) ,(counter & 0xff)]), response)
+    return self.send_cmd('CMD_ASSIGN_COUNTER', response, counter)
 
   def poll_packet_times(self, time, response):
     """
@@ -463,7 +883,7 @@ class Sphero(threading.Thread):
     :param time: client Tx time.
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_POLL_TIME'],[((time>>24) & 0xff), ((time>>16) & 0xff), ((time>>8) & 0xff), (time & 0xff)]), response)
+    return self.send_cmd('CMD_POLL_TIMES', response, time)
 
   def set_heading(self, heading, response):
     """
@@ -476,7 +896,7 @@ class Sphero(threading.Thread):
     shortest angular distance to heading command)
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_SET_HEADING'],[(heading>>8),(heading & 0xff)]), response)
+    return self.send_cmd('CMD_SET_HEADING', response, heading)
 
   def set_stablization(self, enable, response):
     """
@@ -488,7 +908,7 @@ class Sphero(threading.Thread):
     :param enable: 00h for off and 01h for on (on by default).
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_SET_STABILIZ'],[enable]), response)
+    return self.send_cmd('CMD_SET_STABILIZ', response, enable)
 
   def set_rotation_rate(self, rate, response):
     """
@@ -503,7 +923,7 @@ class Sphero(threading.Thread):
     will move in other funcation calls).
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_SET_ROTATION_RATE'],[self.clamp(rate, 0, 255)]), response)
+    return self.send_cmd('CMD_SET_ROTATION_RATE', response, self.clamp(rate, 0, 255))
 
   def set_app_config_blk(self, app_data, response):
     """
@@ -514,7 +934,7 @@ class Sphero(threading.Thread):
     :param app_data: block set aside for application.
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_SET_APP_CONFIG_BLK'],[((app_data>>24) & 0xff), ((app_data>>16) & 0xff), ((app_data>>8) & 0xff), (app_data & 0xff)]), response)
+    return self.send_cmd('CMD_SET_APP_CONFIG_BLK', response, app_data)
 
   def get_app_config_blk(self, response):
     """
@@ -522,7 +942,7 @@ class Sphero(threading.Thread):
     that is set aside for exclusive use by applications.
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_GET_APP_CONFIG_BLK'], []), response)
+    return self.send_cmd('CMD_GET_APP_CONFIG_BLK', response)
 
   def set_data_strm(self, sample_div, sample_frames, sample_mask1, pcnt, sample_mask2, response):
     """
@@ -545,15 +965,13 @@ class Sphero(threading.Thread):
     :param pcnt: packet count (set to 0 for unlimited streaming).
     :param response: request response back from Sphero.
     """
-    data = self.pack_cmd(REQ['CMD_SET_DATA_STRM'], \
-           [(sample_div>>8), (sample_div & 0xff), (sample_frames>>8), (sample_frames & 0xff), ((sample_mask1>>24) & 0xff), \
-              ((sample_mask1>>16) & 0xff),((sample_mask1>>8) & 0xff), (sample_mask1 & 0xff), pcnt, ((sample_mask2>>24) & 0xff), \
-              ((sample_mask2>>16) & 0xff),((sample_mask2>>8) & 0xff), (sample_mask2 & 0xff)])
-    self.create_mask_list(sample_mask1, sample_mask2)
+    #the decoders only change with the masks
+    if self.mask_list is None or (sample_mask1, sample_mask2, sample_frames) != \
+       (self.stream_mask1, self.stream_mask2, self.sample_frames):
+      self.create_mask_list(sample_mask1, sample_mask2, sample_frames)
     self.stream_mask1 = sample_mask1
     self.stream_mask2 = sample_mask2
-    #print data
-    self.send(data, response)
+    return self.send_cmd('CMD_SET_DATA_STRM', response, sample_div, sample_frames, sample_mask1, pcnt, sample_mask2)
 
   def set_filtered_data_strm(self, sample_div, sample_frames, pcnt, response):
     """
@@ -567,12 +985,12 @@ class Sphero(threading.Thread):
     """
     mask1 = 0
     mask2 = 0
-    for key,value in STRM_MASK1.iteritems():
+    for key,value in STRM_MASK1.items():
       if 'FILTERED' in key:
         mask1 = mask1|value
-    for value in STRM_MASK2.itervalues():
+    for value in STRM_MASK2.values():
         mask2 = mask2|value
-    self.set_data_strm(sample_div, sample_frames, mask1, pcnt, mask2, response)
+    return self.set_data_strm(sample_div, sample_frames, mask1, pcnt, mask2, response)
 
   def set_raw_data_strm(self, sample_div, sample_frames, pcnt, response):
     """
@@ -586,13 +1004,12 @@ class Sphero(threading.Thread):
     """
     mask1 = 0
     mask2 = 0
-    for key,value in STRM_MASK1.iteritems():
+    for key,value in STRM_MASK1.items():
       if 'RAW' in key:
         mask1 = mask1|value
-    for value in STRM_MASK2.itervalues():
+    for value in STRM_MASK2.values():
         mask2 = mask2|value
-    self.set_data_strm(sample_div, sample_frames, mask1, pcnt, mask2, response)
-
+    return self.set_data_strm(sample_div, sample_frames, mask1, pcnt, mask2, response)
 
   def set_all_data_strm(self, sample_div, sample_frames, pcnt, response):
     """
@@ -606,11 +1023,11 @@ class Sphero(threading.Thread):
     """
     mask1 = 0
     mask2 = 0
-    for value in STRM_MASK1.itervalues():
+    for value in STRM_MASK1.values():
         mask1 = mask1|value
-    for value in STRM_MASK2.itervalues():
+    for value in STRM_MASK2.values():
         mask2 = mask2|value
-    self.set_data_strm(sample_div, sample_frames, mask1, pcnt, mask2, response)
+    return self.set_data_strm(sample_div, sample_frames, mask1, pcnt, mask2, response)
 
   def config_collision_detect(self, method, Xt, Xspd, Yt, Yspd, ignore_time, response):
     """
@@ -632,7 +1049,7 @@ class Sphero(threading.Thread):
     :param ignore_time: An 8-bit post-collision dead time to prevent\
     retriggering; specified in 10ms increments.
     """
-    self.send(self.pack_cmd(REQ['CMD_CFG_COL_DET'],[method, Xt, Xspd, Yt, Yspd, ignore_time]), response)
+    return self.send_cmd('CMD_CFG_COL_DET', response, method, Xt, Xspd, Yt, Yspd, ignore_time)
 
   def set_rgb_led(self, red, green, blue, save, response):
     """
@@ -648,7 +1065,8 @@ class Sphero(threading.Thread):
     :param blue: blue color value.
     :param save: 01h for save (color is saved as "user LED color").
     """
-    self.send(self.pack_cmd(REQ['CMD_SET_RGB_LED'],[self.clamp(red,0,255), self.clamp(green,0,255), self.clamp(blue,0,255), save]), response)
+    return self.send_cmd('CMD_SET_RGB_LED', response, self.clamp(red,0,255), self.clamp(green,0,255),
+                         self.clamp(blue,0,255), save)
 
   def set_back_led(self, brightness, response):
     """
@@ -658,7 +1076,7 @@ class Sphero(threading.Thread):
     :param brightness: 0-255, off-on (the blue LED on hemisphere of the Sphero).
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_SET_BACK_LED'],[self.clamp(brightness,0,255)]), response)
+    return self.send_cmd('CMD_SET_BACK_LED', response, self.clamp(brightness,0,255))
 
   def get_rgb_led(self, response):
     """
@@ -667,7 +1085,7 @@ class Sphero(threading.Thread):
 
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_GET_RGB_LED'],[]), response)
+    return self.send_cmd('CMD_GET_RGB_LED', response)
 
   def roll(self, speed, heading, state, response):
     """
@@ -684,7 +1102,7 @@ class Sphero(threading.Thread):
     :param state: 00h for off (braking) and 01h for on (driving).
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_ROLL'],[self.clamp(speed,0,255), (heading>>8), (heading & 0xff), state]), response)
+    return self.send_cmd('CMD_ROLL', response, self.clamp(speed,0,255), heading, state)
 
   def boost(self, time, heading, response):
     """
@@ -698,7 +1116,7 @@ class Sphero(threading.Thread):
     :param heading: the heading to travel while boosting.
     :param response: request response back from Sphero.
     """
-    self.send(self.pack_cmd(REQ['CMD_BOOST'], [time, (heading>>8), (heading & 0xff)]), response)
+    return self.send_cmd('CMD_BOOST', response, time, heading)
 
   def set_raw_motor_values(self, l_mode, l_power, r_mode, r_power, response):
     """
@@ -713,51 +1131,69 @@ class Sphero(threading.Thread):
     brake, 0x04 - ignored.
     :param power: 0-255 scalar value (units?).
     """
-    self.send(self.pack_cmd(REQ['CMD_RAW_MOTORS'], [l_mode, l_power, r_mode, r_power]), response)
+    return self.send_cmd('CMD_SET_RAW_MOTORS', response, l_mode, l_power, r_mode, r_power)
 
-  def send(self, data, response):
+  def send(self, packet, response):
     """
-    Packets are sent from Client -> Sphero in the following byte format::
+    Write a packet encoded by a PacketTemplate on the link. Whatever it
+    returns is returned by the command methods.
 
-      -------------------------------------------------------
-      | SOP1 | SOP2 | DID | CID | SEQ | DLEN | <data> | CHK |
-      -------------------------------------------------------
+    :param packet: the packet, as bytes.
+    :param response: request response back from Sphero.
+    """
+    raise NotImplementedError("The subclasses of SpheroProtocol write the packets on their link")
 
-    * SOP1 - start packet 1 - Always 0xff. 
-    * SOP2 - start packet 2 - Set to 0xff when an acknowledgement is\
-      expected, 0xfe otherwise.    
-    * DID - Device ID
-    * CID - Command ID
-    * SEQ - Sequence Number - This client field is echoed in the\
-      response for all synchronous commands (and ignored by Sphero\
-      when SOP2 = 0xfe)
-    * DLEN - Data
-    * Length - Number of bytes through the end of the packet.
-    * <data>
-    * CHK - Checksum - The modulo 256 sum of all the bytes from the\
-      DID through the end of the data payload, bit inverted (1's\
-      complement).
-    """
-    #compute the checksum
-    #modulo 256 sum of data bit inverted
-    checksum =~ sum(data) % 256
-    #if expecting response back from the sphero
-    if response:
-      output = REQ['WITH_RESPONSE'] + data + [checksum]
-    else:
-      output = REQ['WITHOUT_RESPONSE'] + data + [checksum]
-    #pack the msg
-    msg = ''.join(struct.pack('B',x) for x in output)
-    #send the msg
-    with self._communication_lock:
-      self.bt.send(msg)
+  def resolve_response(self, mrsp, seq, data):
+    """
+    Receive the acknowledgement of a command, ignored unless a subclass
+    keeps track of the commands waiting for one.
 
-  def run(self):
-    # this is larger than any single packet
-    self.recv(1024)
+    :param mrsp: the message response code.
+    :param seq: the sequence number echoed by Sphero.
+    :param data: the data payload of the response.
+    """
+    pass
 
-  def recv(self, num_bytes):
+  def buffer_space(self, num_bytes):
+    """
+    Return room for num_bytes at the end of the receive buffer, for the
+    bytes read from the link. They are written in place, and the
+    partial packet left at the end of the buffer is only moved back to
+    its start once there is no room left after it. Once written, the
+    bytes are added to the buffer by moving _buf_end past them.
+
+    :param num_bytes: maximum number of bytes to read.
+    :return: a memoryview of num_bytes, or of the room left after the\
+    partial packet if shorter.
+    """
+    if len(self.raw_data_buf) - self._buf_end < num_bytes:
+      length = self._buf_end - self._buf_start
+      self.raw_data_buf[:length] = self.raw_data_buf[self._buf_start:self._buf_end]
+      self._buf_start, self._buf_end = 0, length
+    return self._buf_view[self._buf_end:self._buf_end + num_bytes]
+
+  def feed(self, data):
+    """
+    Add the bytes read from the link to the receive buffer, and parse
+    the complete packets.
+
+    :param data: the bytes read.
+    """
+    data = memoryview(data)
+    start = 0
+    while start < len(data):
+      #the room left after a large partial packet can be shorter than the
+      #data, copy what fits and parse it to make room for the rest
+      free = self.buffer_space(len(data) - start)
+      free[:] = data[start:start + len(free)]
+      self._buf_end += len(free)
+      start += len(free)
+      self.parse_buffer()
+
+  def parse_buffer(self):
     '''
+    Parse the complete packets of the receive buffer.
+
     Commands are acknowledged from the Sphero -> Client in the
     following format::
 
@@ -801,41 +1237,64 @@ class Sphero(threading.Thread):
 
     '''
 
-    while self.is_connected and not self.shutdown:
-      with self._communication_lock:
-        self.raw_data_buf += self.bt.recv(num_bytes)
-      data = self.raw_data_buf
-      while len(data)>5:
-        if data[:2] == RECV['SYNC']:
-          #print "got response packet"
-          # response packet
-          data_length = ord(data[4])
-          if data_length+5 <= len(data):
-            data_packet = data[:(5+data_length)]
-            data = data[(5+data_length):]
-          else:
-            break
-            #print "Response packet", self.data2hexstr(data_packet)
-         
-        elif data[:2] == RECV['ASYNC']:
-          data_length = (ord(data[3])<<8)+ord(data[4])
-          if data_length+5 <= len(data):
-            data_packet = data[:(5+data_length)]
-            data = data[(5+data_length):]
-          else:
-            # the remainder of the packet isn't long enough
-            break
-          if data_packet[2]==IDCODE['DATA_STRM'] and self._async_callback_dict.has_key(IDCODE['DATA_STRM']):
-            self._async_callback_dict[IDCODE['DATA_STRM']](self.parse_data_strm(data_packet, data_length))
-          elif data_packet[2]==IDCODE['COLLISION'] and self._async_callback_dict.has_key(IDCODE['COLLISION']):
-            self._async_callback_dict[IDCODE['COLLISION']](self.parse_collision_detect(data_packet, data_length))
-          elif data_packet[2]==IDCODE['PWR_NOTIFY'] and self._async_callback_dict.has_key(IDCODE['PWR_NOTIFY']):
-            self._async_callback_dict[IDCODE['PWR_NOTIFY']](self.parse_pwr_notify(data_packet, data_length))
-          else:
-            print "got a packet that isn't streaming" + self.data2hexstr(data)
+    # The packets are parsed in place: the parsers are handed views of
+    # the receive buffer rather than copies
+    data = self.raw_data_buf
+    start = self._buf_start
+    end = self._buf_end
+    while end - start > 5:
+      if data[start] != 0xff:
+        raise RuntimeError("Bad SOF : " + self.data2hexstr(data[start:end]))
+      if data[start+1] == RECV['SYNC'][1]:
+        #print "got response packet"
+        # response packet
+        data_length = data[start+4]
+        if start+5+data_length <= end:
+          self.resolve_response(data[start+2], data[start+3], bytes(data[start+5:start+4+data_length]))
+          start += 5+data_length
+        else:
+          break
+
+      elif data[start+1] == RECV['ASYNC'][1]:
+        data_length = (data[start+3]<<8)+data[start+4]
+        if start+5+data_length <= end:
+          data_packet = self._buf_view[start:(start+5+data_length)]
+          start += 5+data_length
         else:
-          raise RuntimeError("Bad SOF : " + self.data2hexstr(data))
-      self.raw_data_buf=data
+          # the remainder of the packet isn't long enough
+          break
+        self.dispatch_async(data_packet, data_length)
+      else:
+        raise RuntimeError("Bad SOF : " + self.data2hexstr(data[start:end]))
+    # start over from the beginning of the buffer once it is empty
+    if start == end:
+      start = end = 0
+    self._buf_start = start
+    self._buf_end = end
+
+  def dispatch_async(self, data_packet, data_length):
+    """
+    Parse an asynchronous packet and hand it over to the callback
+    registered for its ID code.
+
+    :param data_packet: the packet, from SOP1 through CHK.
+    :param data_length: the DLEN of the packet.
+    """
+    if data_packet[2]==IDCODE['DATA_STRM'] and IDCODE['DATA_STRM'] in self._async_callback_dict:
+      try:
+        data = self.parse_data_strm(data_packet, data_length)
+      except ValueError:
+        #packets streamed with the previous mask are still on their way
+        #just after set_data_strm changes it, drop them and keep reading
+        self.dropped_strm += 1
+      else:
+        self._async_callback_dict[IDCODE['DATA_STRM']](data)
+    elif data_packet[2]==IDCODE['COLLISION'] and IDCODE['COLLISION'] in self._async_callback_dict:
+      self._async_callback_dict[IDCODE['COLLISION']](self.parse_collision_detect(data_packet, data_length))
+    elif data_packet[2]==IDCODE['PWR_NOTIFY'] and IDCODE['PWR_NOTIFY'] in self._async_callback_dict:
+      self._async_callback_dict[IDCODE['PWR_NOTIFY']](self.parse_pwr_notify(data_packet, data_length))
+    else:
+      print("got a packet that isn't streaming" + self.data2hexstr(data_packet))
 
   def parse_pwr_notify(self, data, data_length):
     '''
@@ -852,7 +1311,7 @@ class Sphero(threading.Thread):
       * 03h = Battery Low, 
       * 04h = Battery Critical
     '''
-    return struct.unpack_from('B', ''.join(data[5:]))[0]
+    return struct.unpack_from('B', data, 5)[0]
 
   def parse_collision_detect(self, data, data_length):
     '''
@@ -881,23 +1340,218 @@ class Sphero(threading.Thread):
     '''
     output={}
     
-    output['X'], output['Y'], output['Z'], output['Axis'], output['xMagnitude'], output['yMagnitude'], output['Speed'], output['Timestamp'] = struct.unpack_from('>hhhbhhbI', ''.join(data[5:]))
+    (output['X'], output['Y'], output['Z'], output['Axis'], output['xMagnitude'], output['yMagnitude'],
+     output['Speed'], output['Timestamp']) = struct.unpack_from('>hhhBhhBI', data, 5)
     return output
 
   def parse_data_strm(self, data, data_length):
-    output={}
-    for i in range((data_length-1)/2):
-      unpack = struct.unpack_from('>h', ''.join(data[5+2*i:]))
-      output[self.mask_list[i]] = unpack[0]
-    #print self.mask_list
-    #print output
-    return output
+    '''
+    The data payload of the async message holds sample_frames frames,
+    each of them a signed 16-bit value for each field of the mask, in
+    the order of mask_list.
+
+    A single frame is decoded in one call of the struct compiled by
+    create_mask_list, and returned as a strm_record. Several frames are
+    decoded at once into a numpy record array with one row per frame,
+    from the oldest to the latest: data['ODOM_X'] is then the column of
+    the values of ODOM_X, data[-1] the latest frame.
+    '''
+    if data_length-1 != self.strm_struct.size*self.sample_frames:
+      raise ValueError("The data streaming packet holds %d bytes, %d expected for %d frames of the mask" % \
+                       (data_length-1, self.strm_struct.size*self.sample_frames, self.sample_frames))
+    if self.sample_frames == 1:
+      return self.strm_record._make(self.strm_struct.unpack_from(data, 5))
+    # convert the frames out of the receive buffer, which is reused, and
+    # name the columns
+    values = numpy.frombuffer(data, '>i2', len(self.mask_list)*self.sample_frames, 5)
+    return values.astype(numpy.int16).view(self.strm_dtype)
+
 
+class Sphero(SpheroProtocol, threading.Thread):
 
+  # The class of the link to the robot, anything with the connect, send, recv and close methods of BTInterface.
+  # recv_into is used instead of recv when the link has it.
+  transport_class = BTInterface
 
-  def disconnect(self):
+  def __init__(self, target_name = 'Sphero', target_addr = None, link_budget = LINK_BUDGET):
+    threading.Thread.__init__(self)
+    SpheroProtocol.__init__(self)
+    self.target_name = target_name
+    self.target_address = target_addr
+    self.bt = None
+    self.shutdown = False
     self.is_connected = False
-    self.bt.close()
-    return self.is_connected
+    # The packets waiting to be written by the writer thread, paced to link_budget bytes per second. A new
+    # scheduler is made by each connect, the one of the previous connection is closed by disconnect
+    self.link_budget = link_budget
+    self._scheduler = CommandScheduler(link_budget)
+    self._writer = None
+    self._send_error = None
+    # The commands waiting for their acknowledgement, by sequence number
+    self._pending = dict()
+    self._pending_lock = threading.Lock()
 
+  def connect(self):
+    self.bt = self.transport_class(self.target_name, self.target_address)
+    self.is_connected = self.bt.connect()
+    # the reads and the writes share no lock: the run thread blocks on
+    # the reads while the writer thread sends the packets queued by send
+    self._scheduler = CommandScheduler(self.link_budget)
+    self._send_error = None
+    self._writer = threading.Thread(target=self.write_loop, args=(self._scheduler, self.bt),
+                                    name=self.name + "-writer")
+    self._writer.daemon = True
+    self._writer.start()
+    return True
+
+  def write_loop(self, scheduler, link):
+    #the scheduler and link of this connection: a writer outliving
+    #disconnect never touches those of the next one
+    while True:
+      msg = scheduler.get()
+      if msg is None:
+        break
+      if self._send_error is not None:
+        continue
+      try:
+        link.send(msg)
+      except Exception as error:
+        if scheduler is not self._scheduler:
+          break
+        #keep emptying the queue so that send never blocks, the next
+        #send reports the error
+        self._send_error = error
+        self.is_connected = False
+
+  def send(self, packet, response):
+    """
+    Queue a packet encoded by a PacketTemplate for the writer thread. A
+    roll, LED or collision detection command still waiting is replaced
+    by a newer one of the same kind, and a roll stopping the robot is
+    sent before the other commands.
+
+    :return: a ResponseFuture when a response is requested, None\
+    otherwise. Several commands can wait for their response at once.
+    """
+    #check the link before registering the command, a packet never sent
+    #must not leave a command waiting for its response
+    if self._send_error is not None:
+      raise IOError("The link to Sphero failed: %s" % self._send_error)
+    if self._writer is None or not self._writer.is_alive():
+      raise IOError("Sphero is not connected")
+    future = self.expect_response(packet[4]) if response else None
+    #queue the packet for the writer thread, blocking only if it is behind
+    kind = packet[2:4]
+    urgent = kind == ROLL_KIND and (packet[6] == 0 or packet[9] == 0)
+    superseded = self._scheduler.put(packet, kind if kind in COALESCED else None, urgent)
+    #the superseded command is never sent, nor acknowledged
+    if superseded is not None and superseded[1] == REQ['WITH_RESPONSE'][1]:
+      self.drop_response(superseded[4])
+    return future
+
+  def send_stats(self):
+    """
+    :return: the statistics of the writes since the last connect, see\
+    CommandScheduler.stats, and the data streaming packets dropped for\
+    not matching the streamed fields (dropped_strm).
+    """
+    stats = self._scheduler.stats()
+    stats['dropped_strm'] = self.dropped_strm
+    return stats
+
+  def expect_response(self, seq):
+    """
+    Register the command with the given sequence number as waiting for
+    its acknowledgement.
+
+    :param seq: the sequence number of the command.
+    :return: a ResponseFuture.
+    """
+    future = ResponseFuture(seq)
+    with self._pending_lock:
+      previous = self._pending.get(seq)
+      self._pending[seq] = future
+    if previous is not None and not previous.done():
+      previous.set_exception(ResponseLost("Sequence number %d reused before the response arrived" % seq))
+    return future
+
+  def drop_response(self, seq):
+    """
+    Fail the command with the given sequence number, superseded before
+    being sent.
+
+    :param seq: the sequence number of the command.
+    """
+    with self._pending_lock:
+      future = self._pending.pop(seq, None)
+    if future is not None and not future.done():
+      future.set_exception(ResponseLost("Command %d superseded by a newer one before being sent" % seq))
+
+  def resolve_response(self, mrsp, seq, data):
+    """
+    Hand an acknowledgement over to the command waiting for it, if any.
+
+    :param mrsp: the message response code.
+    :param seq: the sequence number echoed by Sphero.
+    :param data: the data payload of the response.
+    """
+    with self._pending_lock:
+      future = self._pending.pop(seq, None)
+    if future is None:
+      return
+    if mrsp == MRSP['ORBOTIX_RSP_CODE_OK']:
+      future.set_response(Response(mrsp, seq, data))
+    else:
+      future.set_exception(ResponseError(mrsp, seq))
 
+  def run(self):
+    # this is larger than any single packet
+    self.recv(1024)
+
+  def read_into_buffer(self, num_bytes):
+    """
+    Append up to num_bytes from the link to the receive buffer, with a
+    single copy when the link has recv_into.
+
+    :param num_bytes: maximum number of bytes to read.
+    :return: the number of bytes read.
+    """
+    free = self.buffer_space(num_bytes)
+    recv_into = getattr(self.bt, 'recv_into', None)
+    if recv_into is not None:
+      nb_bytes = recv_into(free, num_bytes)
+    else:
+      data = self.bt.recv(num_bytes)
+      nb_bytes = len(data)
+      free[:nb_bytes] = data
+    self._buf_end += nb_bytes
+    return nb_bytes
+
+  def recv(self, num_bytes):
+    """
+    Read from the link and parse the packets until disconnected, see
+    parse_buffer for their format.
+
+    :param num_bytes: maximum number of bytes per read.
+    """
+    while self.is_connected and not self.shutdown:
+      self.read_into_buffer(num_bytes)
+      self.parse_buffer()
+
+  def disconnect(self, timeout=WRITER_TIMEOUT):
+    self.is_connected = False
+    #let the writer send the packets already queued before closing, closing
+    #the link ends a write still stuck after the timeout
+    self._scheduler.close()
+    if self._writer is not None and self._writer.is_alive():
+      self._writer.join(timeout)
+    self._writer = None
+    self.bt.close()
+    #no response can arrive anymore
+    with self._pending_lock:
+      pending = list(self._pending.values())
+      self._pending.clear()
+    for future in pending:
+      if not future.done():
+        future.set_exception(ResponseLost("Disconnected before the response to command %d arrived" % future.seq))
+    return self.is_connected
@@ -0,0 +1,243 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = 'davinellulinvega'
+
+# Import the required packages
+import argparse
+import time
+import numpy as np
+import Activation
+import Network
+import Sphero
+import sphero_sim
+
+
+# Define the Fleet class
+class Fleet(object):
+    """
+    Many simulated robots stepped in lockstep, each one alone in its own copy of the room. The state of the robots is
+    held in arrays and follows the same dynamics as sphero_sim.SimulatedSphero, one roll_period per step. Since the
+    actor is deterministic, robots starting from the same place would all follow the same path: each robot starts from
+    a random place in the room instead, and its odometry counts from the origin of the room.
+    """
+
+    def __init__(self, nb_robot, room=None, roll_period=0.1, max_speed=200.0, time_constant=0.25,
+                 collision_config=(0x01, 10, 20, 10, 20, 0x01), seed=None):
+        """
+        Define the attributes and initialize their value
+        :param nb_robot: The number of robots
+        :param room: An instance of sphero_sim.Room. Defaults to None, meaning sphero_sim.Room(DEFAULT_ROOM)
+        :param roll_period: The simulated time of a step, in seconds
+        :param max_speed: The speed reached with a roll at speed 255, in centimeters per second
+        :param time_constant: The time taken to reach 63% of a new commanded velocity, in seconds
+        :param collision_config: The method, thresholds and speed factors on both axes, and dead time of the collision
+        detection, as sent by Sphero.config_collision when the robot stands still. The dead time is shorter than a step
+        and is not simulated.
+        :param seed: A seed or a numpy.random.Generator used to draw the starting positions. Defaults to None, meaning
+        draw them from a freshly seeded generator.
+        """
+
+        # The environment and the dynamics
+        self.room = room if room is not None else sphero_sim.Room()
+        self.roll_period = roll_period
+        self.max_speed = max_speed
+        self.time_constant = time_constant
+        self.collision_config = collision_config
+        # The walls as arrays: starting corner, direction and unit normal
+        walls = np.array(self.room.walls)
+        self._wall_x, self._wall_y = walls[:, 0], walls[:, 1]
+        self._wall_dx, self._wall_dy = walls[:, 2] - walls[:, 0], walls[:, 3] - walls[:, 1]
+        length = np.hypot(self._wall_dx, self._wall_dy)
+        self._wall_nx, self._wall_ny = -self._wall_dy / length, self._wall_dx / length
+
+        # The state of the robots: position in cm, velocity in cm/s
+        self.time = 0.0
+        self.x, self.y = self.draw_positions(nb_robot, np.random.default_rng(seed))
+        self.vx = np.zeros(nb_robot)
+        self.vy = np.zeros(nb_robot)
+        # The collision status as Sphero maintains it, and the number of collisions of each robot
+        self.collided = np.zeros(nb_robot, dtype=bool)
+        self.nb_collision = np.zeros(nb_robot, dtype=np.int64)
+
+    def draw_positions(self, nb_robot, rng):
+        """
+        Draw positions uniformly in the room, by drawing them in its bounding box and keeping those inside
+        :param nb_robot: The number of positions
+        :param rng: A numpy.random.Generator
+        :return: A tuple: (array of x, array of y)
+        """
+
+        corners = np.array(self.room.vertices)
+        low, high = corners.min(axis=0), corners.max(axis=0)
+        x, y = [], []
+        while len(x) < nb_robot:
+            for point_x, point_y in rng.uniform(low, high, (nb_robot, 2)):
+                if self.room.contains(point_x, point_y):
+                    x.append(point_x)
+                    y.append(point_y)
+        return np.array(x[:nb_robot]), np.array(y[:nb_robot])
+
+    def __len__(self):
+        """Return the number of robots"""
+
+        return len(self.x)
+
+    def get_positions(self):
+        """
+        Return the positions of the robots as the actor and the critic see them, the odometry in meters
+        :return: An array of shape (nb_robot, 2)
+        """
+
+        return np.column_stack((self.x, self.y)) / 100
+
+    def roll(self, speed, heading, state=0x01):
+        """
+        Have every robot roll for one step
+        :param speed: An array of speeds in the range 0-255, one per robot
+        :param heading: An array of headings in degrees, one per robot
+        :param state: 0x00 for braking, 0x01 for driving
+        :return: A boolean array, True for the robots that reported a collision during the step
+        """
+
+        # The commanded velocity: 0 is straight ahead along y, 90 is to the right along x
+        speed = self.max_speed * np.clip(speed, 0, 255) / 255.0 if state else np.zeros(len(self))
+        heading = np.radians(np.mod(heading, 360))
+        target_vx = speed * np.sin(heading)
+        target_vy = speed * np.cos(heading)
+
+        # The velocity converges exponentially towards the commanded one, integrate it exactly
+        duration = self.roll_period
+        decay = np.exp(-duration / self.time_constant)
+        dx = target_vx * duration + (self.vx - target_vx) * self.time_constant * (1 - decay)
+        dy = target_vy * duration + (self.vy - target_vy) * self.time_constant * (1 - decay)
+        vx = target_vx + (self.vx - target_vx) * decay
+        vy = target_vy + (self.vy - target_vy) * decay
+
+        # Find the first wall on the way of each robot, solving p + t * d = wall + u * wall_d for every pair
+        rel_x = self._wall_x - self.x[:, np.newaxis]
+        rel_y = self._wall_y - self.y[:, np.newaxis]
+        denom = dx[:, np.newaxis] * self._wall_dy - dy[:, np.newaxis] * self._wall_dx
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (rel_x * self._wall_dy - rel_y * self._wall_dx) / denom
+            u = (rel_x * dy[:, np.newaxis] - rel_y * dx[:, np.newaxis]) / denom
+        t[~((denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1))] = np.inf
+        wall = np.argmin(t, axis=1)
+        fraction = t[np.arange(len(self)), wall]
+        hit = np.isfinite(fraction)
+
+        # Move the robots, stopping those hitting a wall just before it
+        length = np.hypot(dx, dy)
+        fraction = np.where(hit, fraction, 1.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction[hit] = np.maximum(0.0, fraction[hit] - sphero_sim.SimulatedSphero.WALL_MARGIN / length[hit])
+        self.x += dx * fraction
+        self.y += dy * fraction
+        self.vx = np.where(hit, 0.0, vx)
+        self.vy = np.where(hit, 0.0, vy)
+        self.time += duration
+
+        # The impact is the part of the average velocity going into the wall, with the normal against the motion
+        nx, ny = self._wall_nx[wall], self._wall_ny[wall]
+        avg_vx, avg_vy = dx / duration, dy / duration
+        flip = np.where(nx * dx + ny * dy > 0, -1.0, 1.0)
+        nx, ny = nx * flip, ny * flip
+        impact = -(avg_vx * nx + avg_vy * ny)
+        speed = np.minimum(255, (255 * np.hypot(avg_vx, avg_vy) / self.max_speed).astype(int))
+        method, x_threshold, x_speed, y_threshold, y_speed = self.collision_config[:5]
+        detected = np.zeros(len(self), dtype=bool)
+        if method:
+            if x_threshold:
+                detected |= np.abs(nx * impact) > x_threshold + x_speed * speed / 255.0
+            if y_threshold:
+                detected |= np.abs(ny * impact) > y_threshold + y_speed * speed / 255.0
+        detected &= hit
+
+        # Keep the collision status as Sphero.on_collision does
+        self.collided |= detected
+        self.nb_collision += detected
+        return detected
+
+    def reset_collision(self, speed_x=30, speed_y=30):
+        """Clear the collision status of the robots moving fast enough on both axes, as Sphero.reset_collision does"""
+
+        # Sphero compares the streamed velocities, in mm/s
+        moving = (np.abs(self.vx * 10) > speed_x) & (np.abs(self.vy * 10) > speed_y)
+        self.collided &= ~moving
+
+
+def train(fleet, actor, critic, nb_step, discount=0.7, learn_rate=0.001, max_speed=0xff):
+    """
+    Run the learning loop of main.py on every robot of the fleet at once. Each step, the actor and the critic are
+    evaluated once for the whole fleet and learn once from all the transitions.
+    :param fleet: An instance of Fleet
+    :param actor: A Network with 2 inputs and 2 outputs
+    :param critic: A Network with 2 inputs and 1 output
+    :param nb_step: The number of steps
+    :param discount: The discount rate
+    :param learn_rate: The learning rate applied to the gradient summed over the fleet
+    :param max_speed: The maximal speed given to the robots
+    :return: A dictionary with the number of robot steps, of collisions and the duration
+    """
+
+    start = time.perf_counter()
+    nb_collision = fleet.nb_collision.sum()
+    for step in range(nb_step):
+        # Get the value of the present state
+        positions_o = fleet.get_positions()
+        state_o = critic.activate_batch(positions_o)[:, 0]
+
+        # Get the parameters for the next roll, and roll
+        outputs = actor.activate_batch(positions_o)
+        speed, heading = Sphero.Sphero.roll_params(outputs[:, 0], outputs[:, 1], max_speed)
+        fleet.roll(speed.astype(int), heading.astype(int), 0x01)
+
+        # Get the value of the new state
+        positions_n = fleet.get_positions()
+        state_n = critic.activate_batch(positions_n)[:, 0]
+
+        # Have the actor and the critic learn, the critic from the new state it was activated with last in main.py
+        error = Sphero.Sphero.td_error(fleet.collided, state_n, state_o, discount)[:, np.newaxis]
+        actor.learn_batch(positions_o, np.repeat(error, 2, axis=1), learn_rate)
+        critic.learn_batch(positions_n, error, learn_rate)
+
+        # Reset the collision status
+        fleet.reset_collision()
+
+    # Return the statistics of the run
+    return dict(steps=nb_step * len(fleet), collisions=int(fleet.nb_collision.sum() - nb_collision),
+                duration=time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    # Parse the command line
+    parser = argparse.ArgumentParser(description="Train an actor and a critic on many simulated robots at once")
+    parser.add_argument("--robots", type=int, default=256, help="The number of robots. Defaults to 256")
+    parser.add_argument("--steps", type=int, default=1000, help="The number of steps. Defaults to 1000")
+    parser.add_argument("--hid-act", type=int, nargs="+", default=[10, 10, 10],
+                        help="The hidden layers of the actor. Defaults to 10 10 10")
+    parser.add_argument("--hid-crit", type=int, nargs="+", default=[10, 10, 10],
+                        help="The hidden layers of the critic. Defaults to 10 10 10")
+    parser.add_argument("--activation", choices=sorted(Activation.ACTIVATIONS), default="gaussian",
+                        help="The activation function of the neurons. Defaults to gaussian")
+    parser.add_argument("--discount", type=float, default=0.7, help="The discount rate. Defaults to 0.7")
+    parser.add_argument("--learn-rate", type=float, default=0.001, help="The learning rate. Defaults to 0.001")
+    parser.add_argument("--room", type=sphero_sim.parse_room, default=None,
+                        help="The corners of the room around the starting position, in centimeters, as 'x,y x,y ...'. "
+                             "Defaults to a 300 by 200 rectangle")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="The seed of the starting positions and of the initial weights")
+    args = parser.parse_args()
+
+    # Build the fleet and the networks
+    rng = np.random.default_rng(args.seed)
+    fleet = Fleet(args.robots, args.room, seed=rng)
+    actor = Network.Network(2, args.hid_act, 2, seed=rng, activation=args.activation)
+    critic = Network.Network(2, args.hid_crit, 1, seed=rng, activation=args.activation)
+
+    # Train and report the throughput every tenth of the run
+    report = max(1, args.steps // 10)
+    print("{:>8}{:>16}{:>18}".format("step", "robot steps/s", "collisions/1000"))
+    for first in range(0, args.steps, report):
+        stats = train(fleet, actor, critic, min(report, args.steps - first), args.discount, args.learn_rate)
+        print("{:>8}{:>16.0f}{:>18.1f}".format(first + report, stats['steps'] / stats['duration'],
+                                               1000.0 * stats['collisions'] / stats['steps']))
@@ -0,0 +1,526 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = 'davinellulinvega'
+
+# Import the required packages
+import argparse
+import functools
+import math
+import os
+import runpy
+import struct
+import sys
+import threading
+import time
+import sphero_driver
+
+# A room of 3m by 2m centered on the starting position, in centimeters
+DEFAULT_ROOM = [(-150, -100), (150, -100), (150, 100), (-150, 100)]
+
+# The power states reported by the robot, and the fraction of the battery left below which each one starts
+POWER_STATES = [(0.05, 4), (0.2, 3), (1.0, 2)]
+
+
+def checksum(data):
+    """
+    Compute the checksum of a packet
+    :param data: The bytes from the DID, or MRSP or ID CODE, through the end of the data payload
+    :return: The modulo 256 sum of the bytes, bit inverted
+    """
+
+    return ~sum(data) % 256
+
+
+def clamp_short(value):
+    """Round a value and clamp it to the range of a signed 16-bit integer"""
+
+    return max(-0x8000, min(0x7fff, int(round(value))))
+
+
+# Define the Room class
+class Room(object):
+    """A polygonal room bounding the center of the robot, in the odometry frame and in centimeters"""
+
+    def __init__(self, vertices=None):
+        """
+        Define the walls of the room
+        :param vertices: A list of (x, y) tuples, the corners of the room in order. Defaults to DEFAULT_ROOM
+        """
+
+        # Check the polygon
+        if vertices is None:
+            vertices = DEFAULT_ROOM
+        if len(vertices) < 3:
+            raise ValueError("A room needs at least three corners", len(vertices))
+        self.vertices = [(float(x), float(y)) for x, y in vertices]
+        # Each wall goes from a corner to the next one
+        self.walls = [self.vertices[index - 1] + self.vertices[index] for index in range(len(self.vertices))]
+
+    def contains(self, x, y):
+        """Check whether a point lies inside the room, by counting the walls crossed by a ray going right"""
+
+        inside = False
+        for x1, y1, x2, y2 in self.walls:
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        return inside
+
+    def first_hit(self, x, y, dx, dy):
+        """
+        Find the first wall crossed by a displacement
+        :param x, y: The starting position
+        :param dx, dy: The displacement
+        :return: None if no wall is crossed, else a tuple (fraction of the displacement before the wall, normal x,
+        normal y), the unit normal pointing back into the room
+        """
+
+        hit = None
+        for x1, y1, x2, y2 in self.walls:
+            # Solve (x, y) + t * (dx, dy) = (x1, y1) + u * (ex, ey)
+            ex, ey = x2 - x1, y2 - y1
+            denom = dx * ey - dy * ex
+            if denom == 0:
+                continue
+            t = ((x1 - x) * ey - (y1 - y) * ex) / denom
+            u = ((x1 - x) * dy - (y1 - y) * dx) / denom
+            if 0 <= t <= 1 and 0 <= u <= 1 and (hit is None or t < hit[0]):
+                # Orient the normal against the displacement
+                length = math.hypot(ex, ey)
+                nx, ny = -ey / length, ex / length
+                if nx * dx + ny * dy > 0:
+                    nx, ny = -nx, -ny
+                hit = (t, nx, ny)
+        return hit
+
+
+# Define the SimulatedSphero class
+class SimulatedSphero(object):
+    """
+    A simulated robot speaking the packet protocol of sphero_driver. It rolls in a room with a first order response to
+    the commanded velocity, and stops against the walls. The simulated time only moves forward when a roll command is
+    received, by roll_period seconds, so that the simulation runs as fast as the client sends commands.
+    """
+
+    # The control system samples the sensors at 400Hz
+    SAMPLE_RATE = 400.0
+    # Timed power notifications arrive every 10 seconds
+    POWER_NOTIFY_PERIOD = 10.0
+    # The distance kept between the robot and a wall it ran into, in centimeters
+    WALL_MARGIN = 0.1
+
+    def __init__(self, room=None, roll_period=0.1, max_speed=200.0, time_constant=0.25, battery_life=3600.0):
+        """
+        Define the attributes and initialize their value
+        :param room: An instance of Room. Defaults to None, meaning Room(DEFAULT_ROOM)
+        :param roll_period: The simulated time between two roll commands, in seconds
+        :param max_speed: The speed reached with a roll at speed 255, in centimeters per second
+        :param time_constant: The time taken to reach 63% of a new commanded velocity, in seconds
+        :param battery_life: The number of simulated seconds before the battery is empty
+        """
+
+        # The environment and the dynamics
+        self.room = room if room is not None else Room()
+        self.roll_period = roll_period
+        self.max_speed = max_speed
+        self.time_constant = time_constant
+        self.battery_life = battery_life
+        # The state of the robot: position in cm, velocity in cm/s and commanded velocity
+        self.time = 0.0
+        self.x = 0.0
+        self.y = 0.0
+        self.vx = 0.0
+        self.vy = 0.0
+        self.target_vx = 0.0
+        self.target_vy = 0.0
+        self.heading = 0
+        self.back_led = 0
+        self.rgb_led = (0, 0, 0)
+        self.power_state = 2
+        # The data streaming configuration: period in seconds, frames per packet, fields and remaining packets
+        self.stream_period = None
+        self.stream_frames = 1
+        self.stream_fields = []
+        self.stream_count = 0
+        self.next_sample = None
+        self.frames = []
+        # The collision detection configuration: method, thresholds, speed factors and dead time
+        self.collision_config = (0, 0, 0, 0, 0, 0)
+        self.collision_dead_until = 0.0
+        # The power notifications
+        self.next_power_notify = None
+        # Some statistics on the simulation
+        self.nb_roll = 0
+        self.nb_collision = 0
+        # The bytes received from the client and waiting to be sent to it
+        self.incoming = bytearray()
+        self.outgoing = bytearray()
+
+        # The handler of each command, by device and command IDs
+        self.handlers = {
+            tuple(sphero_driver.REQ['CMD_GET_PWR_STATE']): self.on_get_power_state,
+            tuple(sphero_driver.REQ['CMD_SET_PWR_NOTIFY']): self.on_set_power_notify,
+            tuple(sphero_driver.REQ['CMD_SET_DATA_STRM']): self.on_set_data_strm,
+            tuple(sphero_driver.REQ['CMD_CFG_COL_DET']): self.on_config_collision,
+            tuple(sphero_driver.REQ['CMD_SET_RGB_LED']): self.on_set_rgb_led,
+            tuple(sphero_driver.REQ['CMD_SET_BACK_LED']): self.on_set_back_led,
+            tuple(sphero_driver.REQ['CMD_ROLL']): self.on_roll}
+        # The other known commands are acknowledged and ignored
+        self.known_commands = set(tuple(value) for key, value in sphero_driver.REQ.items() if key.startswith('CMD_'))
+
+    def receive(self, data):
+        """
+        Process the bytes sent by the client, packet by packet
+        :param data: A string of bytes, possibly holding partial packets
+        :return: Nothing
+        """
+
+        self.incoming += data
+        buf = self.incoming
+        start = 0
+        while len(buf) - start >= 6:
+            # Skip the bytes until the start of a packet
+            if buf[start] != 0xff or buf[start + 1] not in (0xff, 0xfe):
+                start += 1
+                continue
+            # Wait for the end of the packet
+            end = start + 6 + buf[start + 5]
+            if end > len(buf):
+                break
+            self.process(buf[start:end])
+            start = end
+        del buf[:start]
+
+    def process(self, packet):
+        """
+        Execute a command and send the acknowledgement if the client asked for one
+        :param packet: A complete packet: SOP1, SOP2, DID, CID, SEQ, DLEN, data and CHK
+        :return: Nothing
+        """
+
+        # Check the packet and run the command
+        response = bytearray()
+        command = (packet[2], packet[3])
+        if checksum(packet[2:-1]) != packet[-1]:
+            code = sphero_driver.MRSP['ORBOTIX_RSP_CODE_ECHKSUM']
+        elif command in self.handlers:
+            try:
+                response = self.handlers[command](packet[6:-1]) or bytearray()
+                code = sphero_driver.MRSP['ORBOTIX_RSP_CODE_OK']
+            except (IndexError, ValueError, struct.error):
+                code = sphero_driver.MRSP['ORBOTIX_RSP_CODE_EPARAM']
+        elif command in self.known_commands:
+            code = sphero_driver.MRSP['ORBOTIX_RSP_CODE_OK']
+        else:
+            code = sphero_driver.MRSP['ORBOTIX_RSP_CODE_EBAD_CMD']
+
+        # Acknowledge the command, echoing its sequence number
+        if packet[1] == 0xff:
+            body = bytearray([code, packet[4], len(response) + 1]) + response
+            self.outgoing += bytearray([0xff, 0xff]) + body + bytearray([checksum(body)])
+
+    def send_async(self, id_code, data):
+        """Queue an asynchronous packet for the client"""
+
+        body = bytearray([id_code, (len(data) + 1) >> 8, (len(data) + 1) & 0xff]) + data
+        self.outgoing += bytearray([0xff, 0xfe]) + body + bytearray([checksum(body)])
+
+    def pending(self):
+        """Return the number of bytes waiting to be sent to the client"""
+
+        return len(self.outgoing)
+
+    def transmit(self, num_bytes):
+        """
+        Hand the waiting bytes over to the client
+        :param num_bytes: The maximum number of bytes to return
+        :return: A string of bytes
+        """
+
+        data = bytes(self.outgoing[:num_bytes])
+        del self.outgoing[:num_bytes]
+        return data
+
+    def on_get_power_state(self, data):
+        """Answer with the record version, power state, battery voltage, number of charges and time awake"""
+
+        voltage = int(700 + 140 * self.battery_left())
+        return bytearray(struct.pack('>BBHHH', 1, self.power_state, voltage, 0, min(int(self.time), 0xffff)))
+
+    def on_set_power_notify(self, data):
+        """Enable or disable the timed power notifications"""
+
+        self.next_power_notify = self.time + self.POWER_NOTIFY_PERIOD if data[0] else None
+
+    def on_set_data_strm(self, data):
+        """Configure the data streaming: divisor, frames per packet, masks and packet count"""
+
+        sample_div, sample_frames, mask1, count, mask2 = struct.unpack('>HHIBI', data)
+        if sample_div == 0 or sample_frames == 0:
+            raise ValueError("The sampling divisor and the number of frames cannot be 0")
+        # The fields are streamed in the order of their bit, from the most significant one of the first mask
+        self.stream_fields = ([key for key, value in sorted(sphero_driver.STRM_MASK1.items(), key=lambda item: -item[1])
+                               if value & mask1] +
+                              [key for key, value in sorted(sphero_driver.STRM_MASK2.items(), key=lambda item: -item[1])
+                               if value & mask2])
+        self.stream_frames = sample_frames
+        self.stream_count = count
+        self.frames = []
+        if self.stream_fields:
+            self.stream_period = sample_div / self.SAMPLE_RATE
+            self.next_sample = self.time + self.stream_period
+        else:
+            self.stream_period = self.next_sample = None
+
+    def on_config_collision(self, data):
+        """Configure the collision detection: method, thresholds and speed factors on both axes, and dead time"""
+
+        self.collision_config = struct.unpack('>6B', data)
+
+    def on_set_rgb_led(self, data):
+        """Set the color of the main LED"""
+
+        self.rgb_led = tuple(struct.unpack('>4B', data)[:3])
+
+    def on_set_back_led(self, data):
+        """Set the brightness of the back LED"""
+
+        self.back_led = struct.unpack('>B', data)[0]
+
+    def on_roll(self, data):
+        """Set the commanded velocity, then let the robot roll until the next command is due"""
+
+        speed, heading, state = struct.unpack('>BHB', data)
+        self.heading = heading % 360
+        # 0 is straight ahead along y, 90 is to the right along x
+        speed = self.max_speed * speed / 255.0 if state else 0.0
+        self.target_vx = speed * math.sin(math.radians(self.heading))
+        self.target_vy = speed * math.cos(math.radians(self.heading))
+        self.nb_roll += 1
+        self.advance(self.roll_period)
+
+    def battery_left(self):
+        """Return the fraction of the battery left"""
+
+        return max(0.0, 1.0 - self.time / self.battery_life)
+
+    def advance(self, duration):
+        """
+        Move the simulated time forward, emitting the data samples and power notifications that fall due
+        :param duration: The simulated time to go through, in seconds
+        :return: Nothing
+        """
+
+        end = self.time + duration
+        while self.time < end:
+            # Stop at the next event
+            step_end = end
+            if self.next_sample is not None:
+                step_end = min(step_end, self.next_sample)
+            if self.next_power_notify is not None:
+                step_end = min(step_end, self.next_power_notify)
+            self.move(step_end - self.time)
+            self.time = step_end
+
+            # Sample the sensors
+            if self.next_sample is not None and self.time >= self.next_sample:
+                self.sample()
+                self.next_sample = None if self.stream_period is None else self.next_sample + self.stream_period
+
+            # Notify the power state when it changes, and periodically
+            power_state = [state for fraction, state in POWER_STATES if self.battery_left() <= fraction][0]
+            if power_state != self.power_state:
+                self.power_state = power_state
+                if self.next_power_notify is not None:
+                    self.send_async(sphero_driver.IDCODE['PWR_NOTIFY'], bytearray([power_state]))
+            if self.next_power_notify is not None and self.time >= self.next_power_notify:
+                self.send_async(sphero_driver.IDCODE['PWR_NOTIFY'], bytearray([self.power_state]))
+                self.next_power_notify += self.POWER_NOTIFY_PERIOD
+
+    def move(self, duration):
+        """
+        Integrate the motion of the robot over a period during which the commanded velocity does not change
+        :param duration: The period, in seconds
+        :return: Nothing
+        """
+
+        if duration <= 0:
+            return
+
+        # The velocity converges exponentially towards the commanded one, integrate it exactly
+        decay = math.exp(-duration / self.time_constant)
+        dx = self.target_vx * duration + (self.vx - self.target_vx) * self.time_constant * (1 - decay)
+        dy = self.target_vy * duration + (self.vy - self.target_vy) * self.time_constant * (1 - decay)
+        vx = self.target_vx + (self.vx - self.target_vx) * decay
+        vy = self.target_vy + (self.vy - self.target_vy) * decay
+
+        # Stop against the first wall on the way
+        hit = self.room.first_hit(self.x, self.y, dx, dy)
+        if hit is None:
+            self.x += dx
+            self.y += dy
+            self.vx, self.vy = vx, vy
+            return
+        fraction, nx, ny = hit
+        length = math.hypot(dx, dy)
+        fraction = max(0.0, fraction - self.WALL_MARGIN / length)
+        self.x += dx * fraction
+        self.y += dy * fraction
+        # The impact happens at the average velocity of the period
+        self.collide(dx / duration, dy / duration, nx, ny)
+        self.vx = self.vy = 0.0
+
+    def collide(self, vx, vy, nx, ny):
+        """
+        Report a collision to the client if the detection is enabled and the impact is strong enough
+        :param vx, vy: The velocity of the robot at the impact, in cm/s
+        :param nx, ny: The normal of the wall
+        :return: Nothing
+        """
+
+        # Check that the detection is enabled and not in its dead time
+        method, x_threshold, x_speed, y_threshold, y_speed, dead_time = self.collision_config
+        if method == 0 or self.time < self.collision_dead_until:
+            return
+
+        # The impact is the part of the velocity going into the wall
+        impact = -(vx * nx + vy * ny)
+        impact_x, impact_y = -nx * impact, -ny * impact
+        speed = min(255, int(255 * math.hypot(vx, vy) / self.max_speed))
+        # An axis with a threshold of 0 does not contribute
+        axis = 0
+        if x_threshold and abs(impact_x) > x_threshold + x_speed * speed / 255.0:
+            axis |= 0x01
+        if y_threshold and abs(impact_y) > y_threshold + y_speed * speed / 255.0:
+            axis |= 0x02
+        if not axis:
+            return
+
+        # Send the collision, with the impact in mm/s and the magnitudes in cm/s
+        self.nb_collision += 1
+        self.collision_dead_until = self.time + dead_time / 100.0
+        data = struct.pack('>hhhBhhBI', clamp_short(impact_x * 10), clamp_short(impact_y * 10), 0, axis,
+                           clamp_short(abs(impact_x)), clamp_short(abs(impact_y)), speed,
+                           int(self.time * 1000) & 0xffffffff)
+        self.send_async(sphero_driver.IDCODE['COLLISION'], bytearray(data))
+
+    def sample(self):
+        """Record a frame of the streamed fields, and send the frames once there are enough of them"""
+
+        # Odometry in cm, velocity in mm/s, yaw in degrees, acceleration in mG, the other sensors read 0
+        values = dict(ODOM_X=self.x, ODOM_Y=self.y, VELOCITY_X=self.vx * 10, VELOCITY_Y=self.vy * 10,
+                      IMU_YAW_FILTERED=(self.heading + 180) % 360 - 180, ACCELONE=1000)
+        self.frames.extend(clamp_short(values.get(field, 0)) for field in self.stream_fields)
+        if len(self.frames) < len(self.stream_fields) * self.stream_frames:
+            return
+
+        # Send the packet and count it
+        self.send_async(sphero_driver.IDCODE['DATA_STRM'], bytearray(struct.pack('>%dh' % len(self.frames),
+                                                                                  *self.frames)))
+        self.frames = []
+        if self.stream_count:
+            self.stream_count -= 1
+            if self.stream_count == 0:
+                self.stream_period = None
+
+
+# Define the SimInterface class
+class SimInterface(object):
+    """
+    A transport with the methods of sphero_driver.BTInterface, linked to a SimulatedSphero instead of a socket. As with
+    a socket, recv blocks until the device has something to send or the link is closed.
+    """
+
+    def __init__(self, target_name='Sphero', target_addr=None, port=1, device=None, poll_interval=None):
+        """
+        Define the attributes
+        :param device: The SimulatedSphero at the other end of the link. Defaults to None, meaning a new one
+        :param poll_interval: The longest time recv waits for data before returning an empty string, in seconds.
+        Defaults to None, meaning wait until there is data or the link is closed
+        """
+
+        self.target_name = target_name
+        self.target_address = target_addr
+        self.device = device if device is not None else SimulatedSphero()
+        self.poll_interval = poll_interval
+        self.closed = True
+        # Wakes recv up when the device has something to send
+        self._ready = threading.Condition()
+
+    def connect(self):
+        """Open the link"""
+
+        sys.stdout.write("Paired with the simulated Sphero.\n")
+        sys.stdout.flush()
+        self.closed = False
+        return True
+
+    def send(self, data):
+        """Hand the bytes over to the device"""
+
+        with self._ready:
+            self.device.receive(bytearray(data))
+            if self.device.pending():
+                self._ready.notify_all()
+
+    def recv(self, num_bytes):
+        """Return the bytes sent by the device, waiting for them for at most poll_interval"""
+
+        with self._ready:
+            if not self.device.pending() and not self.closed:
+                self._ready.wait(self.poll_interval)
+            return self.device.transmit(num_bytes)
+
+    def close(self):
+        """Close the link"""
+
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+
+
+def parse_room(text):
+    """Parse a room given as 'x,y x,y x,y ...' in centimeters"""
+
+    try:
+        return Room([tuple(float(value) for value in corner.split(',')) for corner in text.split()])
+    except ValueError:
+        raise argparse.ArgumentTypeError("a room is a list of at least three 'x,y' corners")
+
+
+if __name__ == "__main__":
+    # Parse the command line
+    parser = argparse.ArgumentParser(description="Run a script driving a Sphero, main.py for instance, with a "
+                                                 "simulated robot in place of the bluetooth link")
+    parser.add_argument("script", help="The script to run")
+    parser.add_argument("arguments", nargs=argparse.REMAINDER, help="The arguments of the script")
+    parser.add_argument("--room", type=parse_room, default=None,
+                        help="The corners of the room around the starting position, in centimeters, as 'x,y x,y ...'. "
+                             "Defaults to a 300 by 200 rectangle")
+    parser.add_argument("--roll-period", type=float, default=0.1,
+                        help="The simulated time between two roll commands, in seconds. Defaults to 0.1")
+    parser.add_argument("--max-speed", type=float, default=200.0,
+                        help="The speed at full throttle, in centimeters per second. Defaults to 200")
+    parser.add_argument("--battery-life", type=float, default=3600.0,
+                        help="The simulated time before the battery is empty, in seconds. Defaults to 3600")
+    args = parser.parse_args()
+
+    # Replace the bluetooth link by the simulated robot
+    device = SimulatedSphero(args.room, args.roll_period, args.max_speed, battery_life=args.battery_life)
+    sphero_driver.Sphero.transport_class = functools.partial(SimInterface, device=device)
+
+    # The script records the brain and the collisions in these directories
+    for directory in ("Config", "Data"):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    # Run the script as if it was started directly
+    sys.argv = [args.script] + args.arguments
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    start = time.time()
+    try:
+        runpy.run_path(args.script, run_name="__main__")
+    finally:
+        duration = time.time() - start
+        print("Simulated {:.1f}s in {:.1f}s ({:.0f}x real time): {} rolls ({:.0f}/s), {} collisions".format(
+            device.time, duration, device.time / max(duration, 1e-9), device.nb_roll,
+            device.nb_roll / max(duration, 1e-9), device.nb_collision))
@@ -0,0 +1,178 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = 'davinellulinvega'
+
+# Import the required packages
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import numpy as np
+import Activation
+import Network
+import sphero_fleet
+
+# The columns of the results table
+COLUMNS = ["key", "hid_act", "hid_crit", "activation", "discount", "learn_rate", "epsylon", "seed", "robots", "steps",
+           "collisions", "collisions_per_1000", "final_collisions_per_1000", "wall_time", "steps_per_s"]
+
+
+def parse_layers(text):
+    """Parse a list of hidden layer sizes given as '10,10,10'"""
+
+    try:
+        layers = [int(size) for size in text.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("hidden layers are given as comma separated sizes, like 10,10,10")
+    if not layers or min(layers) < 1:
+        raise argparse.ArgumentTypeError("hidden layers are given as comma separated sizes, like 10,10,10")
+    return layers
+
+
+def config_key(config):
+    """Return the string identifying a configuration in the results table"""
+
+    return "act={};crit={};activation={};discount={!r};learn_rate={!r};epsylon={!r};seed={};robots={};steps={}".format(
+        "-".join(str(size) for size in config['hid_act']),
+        "-".join(str(size) for size in config['hid_crit']),
+        config['activation'],
+        config['discount'],
+        config['learn_rate'],
+        config['epsylon'],
+        config['seed'],
+        config['robots'],
+        config['steps'])
+
+
+def make_configs(args):
+    """
+    List the configurations to run, the whole grid or a random subset of it drawn from the seed
+    :param args: The parsed command line
+    :return: A list of configuration dictionaries
+    """
+
+    # Build the grid
+    configs = [dict(hid_act=hid_act, hid_crit=hid_crit, activation=activation, discount=discount,
+                    learn_rate=learn_rate, epsylon=epsylon, seed=args.seed, robots=args.robots, steps=args.steps)
+               for hid_act, hid_crit, activation, discount, learn_rate, epsylon in itertools.product(
+                   args.hid_act, args.hid_crit, args.activation, args.discount, args.learn_rate, args.epsylon)]
+
+    # Draw a subset of it, always the same one for a given seed so that the search can be resumed
+    if args.samples is not None and args.samples < len(configs):
+        order = np.random.default_rng(args.seed).permutation(len(configs))
+        configs = [configs[index] for index in sorted(order[:args.samples])]
+    return configs
+
+
+def run_config(config):
+    """
+    Train an actor and a critic on a fleet of simulated robots with the given configuration
+    :param config: A configuration dictionary, as built by make_configs
+    :return: A row of the results table, as a dictionary
+    """
+
+    # Build the fleet and the networks
+    rng = np.random.default_rng(config['seed'])
+    fleet = sphero_fleet.Fleet(config['robots'], seed=rng)
+    actor = Network.Network(2, config['hid_act'], 2, seed=rng, activation=config['activation'])
+    critic = Network.Network(2, config['hid_crit'], 1, seed=rng, activation=config['activation'])
+    actor.set_epsylon(config['epsylon'])
+    critic.set_epsylon(config['epsylon'])
+
+    # Train, keeping the last tenth of the run apart to see where the learning ended up
+    final_steps = max(1, config['steps'] // 10)
+    first = sphero_fleet.train(fleet, actor, critic, config['steps'] - final_steps, config['discount'],
+                               config['learn_rate'])
+    final = sphero_fleet.train(fleet, actor, critic, final_steps, config['discount'], config['learn_rate'])
+
+    # Gather the metrics
+    steps = first['steps'] + final['steps']
+    collisions = first['collisions'] + final['collisions']
+    wall_time = first['duration'] + final['duration']
+    return dict(key=config_key(config),
+                hid_act="-".join(str(size) for size in config['hid_act']),
+                hid_crit="-".join(str(size) for size in config['hid_crit']),
+                activation=config['activation'],
+                discount=config['discount'],
+                learn_rate=config['learn_rate'],
+                epsylon=config['epsylon'],
+                seed=config['seed'],
+                robots=config['robots'],
+                steps=steps,
+                collisions=collisions,
+                collisions_per_1000="{:.3f}".format(1000.0 * collisions / steps),
+                final_collisions_per_1000="{:.3f}".format(1000.0 * final['collisions'] / final['steps']),
+                wall_time="{:.3f}".format(wall_time),
+                steps_per_s="{:.0f}".format(steps / wall_time))
+
+
+def read_done(path):
+    """
+    Return the keys of the configurations already in the results table, if any. A row cut short by an interruption
+    is removed, so that the next rows are appended after the complete ones
+    :param path: The results table
+    :return: A set of keys
+    """
+
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r+b") as csv_file:
+        content = csv_file.read()
+        if not content.endswith(b"\n"):
+            csv_file.truncate(content.rfind(b"\n") + 1)
+    with open(path, "r", newline="") as csv_file:
+        return set(row['key'] for row in csv.DictReader(csv_file))
+
+
+if __name__ == "__main__":
+    # Parse the command line
+    parser = argparse.ArgumentParser(description="Search the hyperparameters of the actor-critic on simulated robots. "
+                                                 "Every value given for a parameter is tried, in combination with all "
+                                                 "the values of the other parameters, unless --samples is given.")
+    parser.add_argument("--hid-act", type=parse_layers, nargs="+", default=[[10, 10, 10]],
+                        help="The hidden layers of the actor, like 10,10,10. Defaults to 10,10,10")
+    parser.add_argument("--hid-crit", type=parse_layers, nargs="+", default=[[10, 10, 10]],
+                        help="The hidden layers of the critic, like 10,10,10. Defaults to 10,10,10")
+    parser.add_argument("--activation", nargs="+", choices=sorted(Activation.ACTIVATIONS), default=["gaussian"],
+                        help="The activation functions of the neurons. Defaults to gaussian")
+    parser.add_argument("--discount", type=float, nargs="+", default=[0.7], help="The discount rates")
+    parser.add_argument("--learn-rate", type=float, nargs="+", default=[0.001], help="The learning rates")
+    parser.add_argument("--epsylon", type=float, nargs="+", default=[0.7], help="The momentums")
+    parser.add_argument("--samples", type=int, default=None,
+                        help="Run this many configurations drawn at random from the grid, instead of all of them")
+    parser.add_argument("--robots", type=int, default=64, help="The number of simulated robots per run. Defaults to 64")
+    parser.add_argument("--steps", type=int, default=1000, help="The number of steps per run. Defaults to 1000")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="The seed of the starting positions, of the initial weights and of the random search. "
+                             "Defaults to 0")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="The number of processes running configurations. Defaults to the number of cores")
+    parser.add_argument("--output", default="sweep.csv",
+                        help="The results table. Configurations already in it are skipped. Defaults to sweep.csv")
+    args = parser.parse_args()
+
+    # Skip the configurations run before an interruption
+    configs = make_configs(args)
+    done = read_done(args.output)
+    todo = [config for config in configs if config_key(config) not in done]
+    print("{} configurations, {} already done".format(len(configs), len(configs) - len(todo)))
+
+    # Run the others on all the cores, recording each result as soon as it arrives
+    if todo:
+        # A table interrupted before its header was complete is empty once read_done removed the partial row
+        new_file = not os.path.exists(args.output) or os.path.getsize(args.output) == 0
+        with open(args.output, "a", newline="") as csv_file:
+            writer = csv.DictWriter(csv_file, COLUMNS)
+            if new_file:
+                writer.writeheader()
+            pool = multiprocessing.Pool(args.processes)
+            try:
+                for index, row in enumerate(pool.imap_unordered(run_config, todo)):
+                    writer.writerow(row)
+                    csv_file.flush()
+                    print("[{}/{}] {}: {} collisions/1000 steps, {} steps/s".format(
+                        index + 1, len(todo), row['key'], row['collisions_per_1000'], row['steps_per_s']))
+            finally:
+                pool.terminate()
+                pool.join()